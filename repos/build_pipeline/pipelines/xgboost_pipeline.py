@@ -236,7 +236,8 @@ def get_pipeline(
         name="RegisterModel",
         estimator=training_step.estimator,
         model_data=training_step.properties.ModelArtifacts.S3ModelArtifacts,
-        content_types=["text/csv"],
+        # The default XGBoost inference handler also decodes typed binary payloads
+        content_types=["text/csv", "text/libsvm", "application/x-recordio-protobuf"],
         response_types=["text/csv"],
         inference_instances=["ml.t2.medium", "ml.t2.large", "ml.m5.large"],
         transform_instances=["ml.m5.xlarge"],
@@ -4,9 +4,86 @@ import os
 import pickle
 
 import boto3
+import numpy as np
 import pandas as pd
 import xgboost as xgb
 
+COMPILED_MODEL_FILE_NAME = "xgboost-model.npz"
+
+
+def compile_booster(booster: xgb.Booster, feature_names: list, objective: str) -> dict:
+    """Flatten the trees of a booster into arrays, for a dependency-free evaluator
+
+    Nodes of all trees are concatenated. Split nodes send a row to `left` when
+    its feature value is lower than `threshold`, to `right` otherwise and to
+    `missing` when the value is missing. Leaves have a `feature` of -1 and
+    their output in `value`.
+
+    Args:
+        booster (xgb.Booster): trained booster
+        feature_names (list): features, in the order of the model input
+        objective (str): training objective, to apply the output transform
+
+    Returns:
+        dict: arrays to save with `np.savez`
+    """
+    feature_index = {name: idx for idx, name in enumerate(feature_names)}
+    feature, threshold, left, right, missing, value, roots = [], [], [], [], [], [], []
+    max_depth = 0
+
+    for tree in booster.get_dump(dump_format="json"):
+        offset = len(feature)
+        roots.append(offset)
+        stack = [(json.loads(tree), 0)]
+        nodes = {}
+        while stack:
+            node, depth = stack.pop()
+            nodes[node["nodeid"]] = node
+            max_depth = max(max_depth, depth)
+            stack += [(child, depth + 1) for child in node.get("children", [])]
+
+        size = max(nodes) + 1
+        feature += [-1] * size
+        threshold += [0.0] * size
+        left += [0] * size
+        right += [0] * size
+        missing += [0] * size
+        value += [0.0] * size
+        for node_id, node in nodes.items():
+            idx = offset + node_id
+            if "leaf" in node:
+                value[idx] = node["leaf"]
+                left[idx] = right[idx] = missing[idx] = idx
+            else:
+                split = node["split"]
+                # Boosters trained without feature names split on f<index>
+                feature[idx] = (
+                    feature_index[split] if split in feature_index else int(split[1:])
+                )
+                threshold[idx] = node["split_condition"]
+                left[idx] = offset + node["yes"]
+                right[idx] = offset + node["no"]
+                missing[idx] = offset + node["missing"]
+
+    config = json.loads(booster.save_config())
+    base_score = config["learner"]["learner_model_param"]["base_score"]
+    base_score = float(base_score.strip("[]"))
+
+    return {
+        "feature": np.array(feature, dtype=np.int32),
+        "threshold": np.array(threshold, dtype=np.float32),
+        "left": np.array(left, dtype=np.int32),
+        "right": np.array(right, dtype=np.int32),
+        "missing": np.array(missing, dtype=np.int32),
+        "value": np.array(value, dtype=np.float32),
+        "roots": np.array(roots, dtype=np.int32),
+        "max_depth": np.array(max_depth, dtype=np.int32),
+        "base_score": np.array(base_score, dtype=np.float32),
+        "objective": np.array(objective),
+        "feature_names": np.array(feature_names),
+    }
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
@@ -83,3 +160,11 @@ if __name__ == "__main__":
 
     with open(model_location, "wb") as f:
         pickle.dump(model, f)
+
+    # Compiled trees for in-process serving, in the output data of the job
+    # (output.tar.gz, next to model.tar.gz): the XGBoost container loads the
+    # first file of the model directory, which must only hold the model
+    np.savez(
+        f"{args.output_data_dir}/{COMPILED_MODEL_FILE_NAME}",
+        **compile_booster(model, list(train.columns), args.objective),
+    )
@@ -63,11 +63,15 @@ class FeatureIngestionStack(cdk.Stack):
             bucket_name=f"sagemaker-{project_id}-fg-{cdk.Aws.ACCOUNT_ID}",
         )
         # offline_bucket.grant_read_write(role)
+        # Read by the Bloom filter steps of the pipelines
+        offline_bucket.grant_read(sagemaker_execution_role)
+        offline_store_uri = f"s3://{offline_bucket.bucket_name}/{self.account}/sagemaker/{self.region}/offline-store"
 
         if not isinstance(configuration_path, Path):
             configuration_path = Path(configuration_path)
 
         ### Create Feature Groups from configurations files
+        record_identifiers = {}
         for k in configuration_path.glob("*.fg.json"):
             fg_configuration = get_fg_conf(
                 file_path=k, bucket_name=offline_bucket.bucket_name
@@ -76,6 +80,9 @@ class FeatureIngestionStack(cdk.Stack):
             fg_configuration["feature_group_name"] = f"{project_name}-{fg_configuration['feature_group_name']}"
             fg_configuration["tags"] = fg_configuration["tags"] + tags
             logger.info(fg_configuration)
+            record_identifiers[fg_configuration["feature_group_name"]] = fg_configuration[
+                "record_identifier_feature_name"
+            ]
             sagemaker.CfnFeatureGroup(
                 self,
                 f"FeatureGroup{fg_configuration['feature_group_name']}",
@@ -95,7 +102,19 @@ class FeatureIngestionStack(cdk.Stack):
             for k, o in pipeline_conf.items():
                 if "feature_group_name" in k:
                     pipeline_conf[k] = f"{project_name}-{o}"
-
+            serving_vector_conf = pipeline_conf.get("serving_vector", {})
+            if serving_vector_conf:
+                serving_vector_conf["feature_group_name"] = (
+                    f"{project_name}-{serving_vector_conf['feature_group_name']}"
+                )
+                serving_vector_conf["source_feature_group_names"] = [
+                    f"{project_name}-{o}"
+                    for o in serving_vector_conf["source_feature_group_names"]
+                ]
+            pipeline_conf["record_identifier_name"] = record_identifiers[
+                pipeline_conf["feature_group_name"]
+            ]
+            pipeline_conf["offline_store_uri"] = offline_store_uri
 
             pipeline_definition = generate_pipeline_definition(
                 role=sagemaker_execution_role_arn,
@@ -7,6 +7,7 @@ from sagemaker.processing import (
     ProcessingOutput,
     Processor,
 )
+from sagemaker.sklearn.processing import SKLearnProcessor
 from sagemaker.workflow.parameters import ParameterInteger, ParameterString
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.steps import ProcessingStep
@@ -28,6 +29,9 @@ def create_pipeline(role, pipeline_name, sagemaker_session=None, **kwarg)-> Pipe
     """
     flow_file_path = kwarg["flow_file_path"]
     feature_group_name = kwarg["feature_group_name"]
+    bloom_filter_conf = kwarg.get("bloom_filter", {})
+    snapshot_conf = kwarg.get("snapshot", {})
+    serving_vector_conf = kwarg.get("serving_vector", {})
 
     flow_file = FlowFile(flow_file_path)
 
@@ -73,11 +77,263 @@ def create_pipeline(role, pipeline_name, sagemaker_session=None, **kwarg)-> Pipe
         job_arguments=job_argument,
     )
 
+    steps = [data_wrangler_step]
+    if bloom_filter_conf.get("enabled"):
+        steps.append(
+            create_bloom_filter_step(
+                role,
+                feature_group_name,
+                input_data_url,
+                data_wrangler_step,
+                sagemaker_session=sagemaker_session,
+                record_identifier_name=kwarg["record_identifier_name"],
+                offline_store_uri=kwarg["offline_store_uri"],
+                **bloom_filter_conf,
+            )
+        )
+
+    if snapshot_conf.get("enabled"):
+        steps.append(
+            create_snapshot_step(
+                role,
+                feature_group_name,
+                data_wrangler_step,
+                sagemaker_session=sagemaker_session,
+                **snapshot_conf,
+            )
+        )
+
+    if serving_vector_conf.get("enabled"):
+        steps.append(
+            create_serving_vector_step(
+                role,
+                input_data_url,
+                data_wrangler_step,
+                sagemaker_session=sagemaker_session,
+                record_identifier_name=kwarg["record_identifier_name"],
+                **serving_vector_conf,
+            )
+        )
+
     pipeline = Pipeline(
         name=pipeline_name,
         parameters=[instance_count, instance_type, input_data_url],
-        steps=[data_wrangler_step],
+        steps=steps,
         sagemaker_session=sagemaker_session,
     )
 
     return pipeline
+
+
+def create_bloom_filter_step(
+    role,
+    feature_group_name: str,
+    input_data_url: ParameterString,
+    data_wrangler_step: ProcessingStep,
+    sagemaker_session=None,
+    record_identifier_name: str = None,
+    offline_store_uri: str = None,
+    false_positive_rate: float = 0.01,
+    script_path: str = "scripts/build_bloom_filter.py",
+    instance_type: str = "ml.m5.large",
+    **kwarg,
+) -> ProcessingStep:
+    """Publish the Bloom filter of the record identifiers of the feature group
+
+    The filter is rebuilt after each ingestion, from the offline store and the
+    ingested data, and written to
+    `s3://<default bucket>/bloom-filters/<feature group name>/known-ids.bloom`,
+    where the serving Lambda reads it.
+
+    Args:
+        role (str): ARN of the role assumed by the step
+        feature_group_name (str): feature group ingested by the pipeline
+        input_data_url (ParameterString): data ingested by the pipeline
+        data_wrangler_step (ProcessingStep): ingestion step, run first
+        sagemaker_session (Session, optional): SageMaker session
+        record_identifier_name (str): record identifier feature of the group
+        offline_store_uri (str): S3 URI of the offline store, up to the
+            `offline-store` prefix
+        false_positive_rate (float): false positive rate of the filter
+        script_path (str): script building the filter
+        instance_type (str): instance type of the processing job
+
+    Returns:
+        ProcessingStep: the step building the filter
+    """
+    default_bucket = sagemaker_session.default_bucket()
+    bloom_filter_processor = SKLearnProcessor(
+        framework_version="0.23-1",
+        role=role,
+        instance_type=instance_type,
+        instance_count=1,
+        base_job_name=f"{feature_group_name}-bloom-filter",
+        sagemaker_session=sagemaker_session,
+    )
+
+    bloom_filter_step = ProcessingStep(
+        name="bloom-filter-step",
+        processor=bloom_filter_processor,
+        inputs=[
+            ProcessingInput(
+                input_name="input_data",
+                source=input_data_url,
+                destination="/opt/ml/processing/input",
+            )
+        ],
+        outputs=[
+            ProcessingOutput(
+                output_name="bloom_filter",
+                source="/opt/ml/processing/output",
+                destination=f"s3://{default_bucket}/bloom-filters/{feature_group_name}",
+            )
+        ],
+        job_arguments=[
+            "--offline-store-uri",
+            offline_store_uri,
+            "--feature-group-name",
+            feature_group_name,
+            "--record-identifier-name",
+            record_identifier_name,
+            "--false-positive-rate",
+            str(false_positive_rate),
+        ],
+        code=script_path,
+    )
+    bloom_filter_step.add_depends_on([data_wrangler_step])
+    return bloom_filter_step
+
+
+def create_snapshot_step(
+    role,
+    feature_group_name: str,
+    data_wrangler_step: ProcessingStep,
+    sagemaker_session=None,
+    index_every: int = 256,
+    script_path: str = "scripts/build_snapshot.py",
+    instance_type: str = "ml.m5.xlarge",
+    **kwarg,
+) -> ProcessingStep:
+    """Publish the snapshot of the latest records of the feature group
+
+    The snapshot is rebuilt from the offline store after each ingestion and
+    written to `s3://<default bucket>/snapshots/<feature group name>/snapshot.bin`,
+    where the serving Lambda reads it. The offline store lags the online store
+    by a few minutes, the records of the current run may only be in the next
+    snapshot.
+
+    Args:
+        role (str): ARN of the role assumed by the step
+        feature_group_name (str): feature group ingested by the pipeline
+        data_wrangler_step (ProcessingStep): ingestion step, run first
+        sagemaker_session (Session, optional): SageMaker session
+        index_every (int): rows per entry of the key index
+        script_path (str): script building the snapshot
+        instance_type (str): instance type of the processing job
+
+    Returns:
+        ProcessingStep: the step building the snapshot
+    """
+    default_bucket = sagemaker_session.default_bucket()
+    snapshot_processor = SKLearnProcessor(
+        framework_version="0.23-1",
+        role=role,
+        instance_type=instance_type,
+        instance_count=1,
+        base_job_name=f"{feature_group_name}-snapshot",
+        sagemaker_session=sagemaker_session,
+    )
+
+    snapshot_step = ProcessingStep(
+        name="snapshot-step",
+        processor=snapshot_processor,
+        outputs=[
+            ProcessingOutput(
+                output_name="snapshot",
+                source="/opt/ml/processing/output",
+                destination=f"s3://{default_bucket}/snapshots/{feature_group_name}",
+            )
+        ],
+        job_arguments=[
+            "--feature-group-name",
+            feature_group_name,
+            "--index-every",
+            str(index_every),
+        ],
+        code=script_path,
+    )
+    snapshot_step.add_depends_on([data_wrangler_step])
+    return snapshot_step
+
+
+def create_serving_vector_step(
+    role,
+    input_data_url: ParameterString,
+    data_wrangler_step: ProcessingStep,
+    sagemaker_session=None,
+    record_identifier_name: str = None,
+    feature_group_name: str = None,
+    source_feature_group_names: list = None,
+    layout_path: str = "configurations/serving_vector.layout.json",
+    script_path: str = "scripts/build_serving_vectors.py",
+    instance_type: str = "ml.m5.large",
+    **kwarg,
+) -> ProcessingStep:
+    """Refresh the serving vectors of the record identifiers ingested by the run
+
+    The records of the ingested identifiers are read back from all the source
+    feature groups, joined in the order of the model features, and written
+    with the version of this layout to the serving feature group, which the
+    serving Lambda reads instead of the source feature groups. Every pipeline
+    ingesting one of the source feature groups runs the step.
+
+    Args:
+        role (str): ARN of the role assumed by the step
+        input_data_url (ParameterString): data ingested by the pipeline
+        data_wrangler_step (ProcessingStep): ingestion step, run first
+        sagemaker_session (Session, optional): SageMaker session
+        record_identifier_name (str): record identifier feature of the groups
+        feature_group_name (str): serving feature group
+        source_feature_group_names (list): feature groups joined
+        layout_path (str): JSON file of the ordered model `features_names`
+        script_path (str): script building the vectors
+        instance_type (str): instance type of the processing job
+
+    Returns:
+        ProcessingStep: the step refreshing the vectors
+    """
+    with open(layout_path) as f:
+        features_names = json.load(f)["features_names"]
+    serving_vector_processor = SKLearnProcessor(
+        framework_version="0.23-1",
+        role=role,
+        instance_type=instance_type,
+        instance_count=1,
+        base_job_name=f"{feature_group_name}-refresh",
+        sagemaker_session=sagemaker_session,
+    )
+
+    serving_vector_step = ProcessingStep(
+        name="serving-vector-step",
+        processor=serving_vector_processor,
+        inputs=[
+            ProcessingInput(
+                input_name="input_data",
+                source=input_data_url,
+                destination="/opt/ml/processing/input",
+            )
+        ],
+        job_arguments=[
+            "--feature-group-name",
+            feature_group_name,
+            "--source-feature-group-names",
+            ",".join(source_feature_group_names),
+            "--record-identifier-name",
+            record_identifier_name,
+            "--features-names",
+            ",".join(features_names),
+        ],
+        code=script_path,
+    )
+    serving_vector_step.add_depends_on([data_wrangler_step])
+    return serving_vector_step
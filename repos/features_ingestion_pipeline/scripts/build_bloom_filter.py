@@ -0,0 +1,100 @@
+"""Build the Bloom filter of the record identifiers of a feature group.
+
+Identifiers are read from the offline store of the feature group and from the
+input of the current run, whose records may not have reached the offline store
+yet. The filter is written to the output directory, in the format read by the
+serving Lambda (`bloom_filter.py`): a little endian header (magic, number of
+hash functions, number of bits, number of identifiers) then the bit array.
+"""
+import argparse
+import hashlib
+import io
+import logging
+import math
+import struct
+from pathlib import Path
+from urllib.parse import urlparse
+
+import boto3
+import pandas as pd
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAGIC = b"BLM1"
+HEADER = struct.Struct("<4sIQQ")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--offline-store-uri", type=str)
+parser.add_argument("--feature-group-name", type=str)
+parser.add_argument("--record-identifier-name", type=str)
+parser.add_argument("--false-positive-rate", type=float, default=0.01)
+parser.add_argument("--input-data", type=str, default="/opt/ml/processing/input")
+parser.add_argument("--output-path", type=str, default="/opt/ml/processing/output")
+args = parser.parse_args()
+
+
+def as_strings(identifiers: pd.Series) -> pd.Series:
+    """Identifiers as read by the online store, e.g. 12 and not 12.0"""
+    identifiers = identifiers.dropna()
+    if identifiers.dtype.kind == "f":
+        identifiers = identifiers.astype("int64")
+    return identifiers.astype(str)
+
+
+def read_offline_store(s3_uri: str, feature_group_name: str) -> set:
+    # Offline store data sits under <feature group name>-<creation time>/data/
+    url = urlparse(s3_uri)
+    prefix = f"{url.path.strip('/')}/{feature_group_name}-"
+    s3 = boto3.client("s3")
+    identifiers = set()
+    for page in s3.get_paginator("list_objects_v2").paginate(
+        Bucket=url.netloc, Prefix=prefix
+    ):
+        for o in page.get("Contents", []):
+            if not o["Key"].endswith(".parquet"):
+                continue
+            body = s3.get_object(Bucket=url.netloc, Key=o["Key"])["Body"].read()
+            records = pd.read_parquet(
+                io.BytesIO(body), columns=[args.record_identifier_name]
+            )
+            identifiers.update(as_strings(records[args.record_identifier_name]))
+    return identifiers
+
+
+def read_input_data(input_path: str) -> set:
+    identifiers = set()
+    for path in Path(input_path).glob("**/*.csv"):
+        records = pd.read_csv(path, usecols=[args.record_identifier_name])
+        identifiers.update(as_strings(records[args.record_identifier_name]))
+    return identifiers
+
+
+def build_bloom_filter(identifiers: set, false_positive_rate: float) -> bytes:
+    capacity = max(len(identifiers), 1)
+    num_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    bits = bytearray((num_bits + 7) // 8)
+    for r in identifiers:
+        digest = hashlib.blake2b(r.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(num_hashes):
+            p = (h1 + i * h2) % num_bits
+            bits[p >> 3] |= 1 << (p & 7)
+    return HEADER.pack(MAGIC, num_hashes, num_bits, len(identifiers)) + bytes(bits)
+
+
+identifiers = read_offline_store(args.offline_store_uri, args.feature_group_name)
+logger.info(f"{len(identifiers)} identifiers in the offline store")
+identifiers |= read_input_data(args.input_data)
+logger.info(f"{len(identifiers)} identifiers with the input data")
+
+output_path = Path(args.output_path)
+output_path.mkdir(parents=True, exist_ok=True)
+bloom_filter = build_bloom_filter(identifiers, args.false_positive_rate)
+(output_path / "known-ids.bloom").write_bytes(bloom_filter)
+logger.info(
+    f"Bloom filter of {len(bloom_filter)} bytes"
+    f" at a {args.false_positive_rate} false positive rate"
+)
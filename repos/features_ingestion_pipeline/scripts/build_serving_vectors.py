@@ -0,0 +1,143 @@
+"""Refresh the serving vectors of the record identifiers ingested by the run.
+
+The records of the identifiers of the current input are read back from the
+online stores of all the source feature groups, joined, and written to the
+serving feature group as one record per identifier: the model vector, as the
+CSV line of the `ValueAsString` of its features in model order, and the
+version of this layout. The serving Lambda reads the vector with one call and
+scores it as is (`serving_vectors.py`); identifiers missing from any of the
+source feature groups have their vector deleted.
+"""
+import argparse
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+import pandas as pd
+from botocore.config import Config
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# BatchGetRecord reads at most 100 identifiers per feature group
+MAX_RECORDS_PER_FEATURE_GROUP = 100
+VECTOR_FEATURE_NAME = "vector"
+LAYOUT_VERSION_FEATURE_NAME = "layout_version"
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--feature-group-name", type=str)
+parser.add_argument("--source-feature-group-names", type=str)
+parser.add_argument("--record-identifier-name", type=str)
+parser.add_argument("--features-names", type=str)
+parser.add_argument("--max-workers", type=int, default=16)
+parser.add_argument("--input-data", type=str, default="/opt/ml/processing/input")
+args = parser.parse_args()
+
+
+def layout_version(features_names: list) -> str:
+    """Hash of the ordered features names, as computed by the serving Lambda"""
+    return hashlib.sha256(",".join(features_names).encode("utf-8")).hexdigest()[:16]
+
+
+def as_strings(identifiers: pd.Series) -> pd.Series:
+    """Identifiers as read by the online store, e.g. 12 and not 12.0"""
+    identifiers = identifiers.dropna()
+    if identifiers.dtype.kind == "f":
+        identifiers = identifiers.astype("int64")
+    return identifiers.astype(str)
+
+
+def read_input_data(input_path: str) -> list:
+    identifiers = set()
+    for path in Path(input_path).glob("**/*.csv"):
+        records = pd.read_csv(path, usecols=[args.record_identifier_name])
+        identifiers.update(as_strings(records[args.record_identifier_name]))
+    return sorted(identifiers)
+
+
+def read_records(featurestore_runtime, feature_group_names: list, ids: list) -> dict:
+    """Features of the identifiers, by identifier then feature group"""
+    response = featurestore_runtime.batch_get_record(
+        Identifiers=[
+            {"FeatureGroupName": name, "RecordIdentifiersValueAsString": ids}
+            for name in feature_group_names
+        ]
+    )
+    if response.get("Errors"):
+        raise RuntimeError(response["Errors"][0]["ErrorMessage"])
+    if response.get("UnprocessedIdentifiers"):
+        raise RuntimeError("Identifiers left unprocessed by BatchGetRecord")
+    records = {}
+    for r in response.get("Records", []):
+        records.setdefault(r["RecordIdentifierValueAsString"], {})[
+            r["FeatureGroupName"]
+        ] = {f["FeatureName"]: f["ValueAsString"] for f in r["Record"]}
+    return records
+
+
+def to_vector(records: dict, features_names: list) -> str:
+    """CSV line of the features, None if any of them is missing"""
+    values = {}
+    for record in records.values():
+        values.update(record)
+    if any(name not in values for name in features_names):
+        return None
+    return ",".join(values[name] for name in features_names)
+
+
+if __name__ == "__main__":
+    features_names = args.features_names.split(",")
+    source_feature_group_names = args.source_feature_group_names.split(",")
+    version = layout_version(features_names)
+    featurestore_runtime = boto3.client(
+        "sagemaker-featurestore-runtime",
+        config=Config(
+            retries={"mode": "adaptive", "max_attempts": 10},
+            max_pool_connections=args.max_workers,
+        ),
+    )
+
+    identifiers = read_input_data(args.input_data)
+    event_time = str(round(time.time(), 3))
+    vectors, deleted = {}, []
+    for i in range(0, len(identifiers), MAX_RECORDS_PER_FEATURE_GROUP):
+        ids = identifiers[i : i + MAX_RECORDS_PER_FEATURE_GROUP]
+        records = read_records(featurestore_runtime, source_feature_group_names, ids)
+        for r in ids:
+            vector = None
+            if len(records.get(r, {})) == len(source_feature_group_names):
+                vector = to_vector(records[r], features_names)
+            if vector is None:
+                deleted.append(r)
+            else:
+                vectors[r] = vector
+
+    def put_vector(item) -> None:
+        r, vector = item
+        featurestore_runtime.put_record(
+            FeatureGroupName=args.feature_group_name,
+            Record=[
+                {"FeatureName": args.record_identifier_name, "ValueAsString": r},
+                {"FeatureName": VECTOR_FEATURE_NAME, "ValueAsString": vector},
+                {"FeatureName": LAYOUT_VERSION_FEATURE_NAME, "ValueAsString": version},
+                {"FeatureName": "event_time", "ValueAsString": event_time},
+            ],
+        )
+
+    def delete_vector(r: str) -> None:
+        featurestore_runtime.delete_record(
+            FeatureGroupName=args.feature_group_name,
+            RecordIdentifierValueAsString=r,
+            EventTime=event_time,
+        )
+
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        list(executor.map(put_vector, vectors.items()))
+        list(executor.map(delete_vector, deleted))
+    logger.info(
+        f"{len(vectors)} serving vectors of layout {version} written"
+        f" to {args.feature_group_name}, {len(deleted)} deleted"
+    )
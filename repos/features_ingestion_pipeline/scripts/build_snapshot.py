@@ -0,0 +1,132 @@
+"""Build the snapshot of the latest records of a feature group.
+
+The latest record of each identifier is read from the offline store, deleted
+records left out, and written to a memory-mappable file, in the format read by
+the serving Lambda (`feature_snapshot.py`):
+
+- magic `FSS1` and the length of the JSON header, little endian
+- JSON header: feature group name, `generated_at` the latest event time of
+  the records read, in epoch seconds, number of rows, width of the
+  identifiers, `index_every` and the (name, width) of each feature
+- rows sorted by identifier, each one the identifier then the value of each
+  feature, as the online store `ValueAsString`, NUL padded to a fixed width
+- key index: the identifier of every `index_every` row
+"""
+import argparse
+import io
+import json
+import logging
+import struct
+from pathlib import Path
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAGIC = b"FSS1"
+PREAMBLE = struct.Struct("<4sI")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--feature-group-name", type=str)
+parser.add_argument("--index-every", type=int, default=256)
+parser.add_argument("--output-path", type=str, default="/opt/ml/processing/output")
+args = parser.parse_args()
+
+
+def read_offline_store(s3_uri: str) -> pd.DataFrame:
+    url = urlparse(s3_uri)
+    s3 = boto3.client("s3")
+    frames = []
+    for page in s3.get_paginator("list_objects_v2").paginate(
+        Bucket=url.netloc, Prefix=url.path.lstrip("/")
+    ):
+        for o in page.get("Contents", []):
+            if o["Key"].endswith(".parquet"):
+                body = s3.get_object(Bucket=url.netloc, Key=o["Key"])["Body"].read()
+                frames.append(pd.read_parquet(io.BytesIO(body)))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def as_strings(values: pd.Series, feature_type: str) -> np.ndarray:
+    """Values as the online store `ValueAsString`, empty when missing"""
+    if feature_type == "Integral":
+        values = values.astype("Int64")
+    strings = values.astype(str).where(values.notna(), "")
+    return strings.str.encode("utf-8").to_numpy()
+
+
+def to_epoch_seconds(values: pd.Series) -> pd.Series:
+    """Event times, `Fractional` epoch seconds or ISO-8601 `String`"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    epoch = pd.Timestamp(0, tz="UTC")
+    return (pd.to_datetime(values, utc=True) - epoch).dt.total_seconds()
+
+
+description = boto3.client("sagemaker").describe_feature_group(
+    FeatureGroupName=args.feature_group_name
+)
+record_identifier_name = description["RecordIdentifierFeatureName"]
+event_time_name = description["EventTimeFeatureName"]
+feature_types = {
+    d["FeatureName"]: d["FeatureType"] for d in description["FeatureDefinitions"]
+}
+features = [(n, t) for n, t in feature_types.items() if n != record_identifier_name]
+
+records = read_offline_store(
+    description["OfflineStoreConfig"]["S3StorageConfig"]["ResolvedOutputS3Uri"]
+)
+logger.info(f"{len(records)} records in the offline store")
+# The offline store lags the ingestion, the snapshot is as old as the latest
+# record it holds, not as its build
+generated_at = 0.0
+if len(records):
+    generated_at = float(to_epoch_seconds(records[event_time_name]).max())
+    records = records.sort_values([event_time_name, "write_time"]).drop_duplicates(
+        record_identifier_name, keep="last"
+    )
+    if "is_deleted" in records:
+        records = records[~records["is_deleted"].astype(bool)]
+logger.info(f"{len(records)} latest records")
+
+keys = as_strings(
+    records.get(record_identifier_name, pd.Series(dtype=str)),
+    feature_types[record_identifier_name],
+)
+order = np.argsort(np.array(keys, dtype=bytes), kind="stable")
+columns = [("key", keys)] + [
+    (name, as_strings(records.get(name, pd.Series(dtype=str)), feature_type))
+    for name, feature_type in features
+]
+widths = [max((len(v) for v in values), default=0) or 1 for _, values in columns]
+rows = np.empty(
+    len(keys), dtype=[(f"f{i}", f"S{w}") for i, w in enumerate(widths)]
+)
+for i, (_, values) in enumerate(columns):
+    rows[f"f{i}"] = np.array(values, dtype=f"S{widths[i]}")[order]
+
+header = json.dumps(
+    {
+        "feature_group_name": args.feature_group_name,
+        "generated_at": generated_at,
+        "count": len(rows),
+        "key_width": widths[0],
+        "index_every": args.index_every,
+        "features": [[name, w] for (name, _), w in zip(features, widths[1:])],
+    }
+).encode("utf-8")
+
+output_path = Path(args.output_path)
+output_path.mkdir(parents=True, exist_ok=True)
+with (output_path / "snapshot.bin").open("wb") as f:
+    f.write(PREAMBLE.pack(MAGIC, len(header)))
+    f.write(header)
+    f.write(rows.tobytes())
+    f.write(rows["f0"][:: args.index_every].tobytes())
+logger.info(
+    f"Snapshot of {len(rows)} records, {rows.dtype.itemsize} bytes per record"
+)
@@ -0,0 +1,132 @@
+"""Memory and latency of the Bloom filters of known record identifiers.
+
+- filter: a filter of `--ids` identifiers (10M by default) is built at each
+  false positive rate, and its serialized size, the memory held once loaded
+  (tracemalloc), the load time, the p50/p99 latency of a lookup of known and
+  unknown identifiers and the measured false positive rate are reported
+- handler: `lambda_handler` is invoked in process, as in
+  `stage_latency_benchmark`, for identifiers missing from the online store,
+  with and without the filters, against a stub feature store answering
+  `--feature-store-ms` later
+
+Usage:
+    python benchmarks/bloom_filter_benchmark.py --ids 10000000
+"""
+import argparse
+import logging
+import statistics
+import time
+import tracemalloc
+
+from cold_start_benchmark import Context
+from scoring_server_benchmark import StubEndpoint, StubFeatureStore, lambda_function
+
+from bloom_filter import BloomFilter, KnownIdentifiers
+
+
+class KnownIdsFeatureStore(StubFeatureStore):
+    """Only holds records for identifiers below `known`"""
+
+    def __init__(self, latency_ms: float, known: int) -> None:
+        super().__init__(latency_ms, 0)
+        self.known = known
+
+    def batch_get_record(self, Identifiers):
+        response = super().batch_get_record(Identifiers)
+        response["Records"] = [
+            r
+            for r in response["Records"]
+            if int(r["RecordIdentifierValueAsString"]) < self.known
+        ]
+        return response
+
+
+def lookup_latencies(bloom_filter: BloomFilter, ids: range) -> list:
+    latencies = []
+    for i in ids:
+        r = str(i)
+        start = time.perf_counter()
+        bloom_filter.might_contain(r)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def benchmark_filter(ids: int, false_positive_rate: float, lookups: int) -> None:
+    start = time.perf_counter()
+    bloom_filter = BloomFilter.for_capacity(ids, false_positive_rate)
+    bloom_filter.update(str(i) for i in range(ids))
+    build_seconds = time.perf_counter() - start
+    data = bloom_filter.to_bytes()
+    del bloom_filter
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    bloom_filter = BloomFilter.from_bytes(data)
+    load_ms = (time.perf_counter() - start) * 1000
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    known = statistics.quantiles(lookup_latencies(bloom_filter, range(lookups)), n=100)
+    unknown_ids = range(ids, ids + lookups)
+    unknown = statistics.quantiles(lookup_latencies(bloom_filter, unknown_ids), n=100)
+    false_positives = sum(bloom_filter.might_contain(str(i)) for i in unknown_ids)
+    print(
+        f"fpr {false_positive_rate:<6}: {len(data) / 2 ** 20:6.1f} MiB file"
+        f" | {memory / 2 ** 20:6.1f} MiB loaded | {bloom_filter.num_hashes} hashes"
+        f" | build {build_seconds:5.1f} s | load {load_ms:6.1f} ms"
+        f" | known p50 {known[49]:.2f} us p99 {known[98]:.2f} us"
+        f" | unknown p50 {unknown[49]:.2f} us p99 {unknown[98]:.2f} us"
+        f" | measured fpr {false_positives / lookups:.4f}"
+    )
+
+
+def invoke(ids: range) -> tuple:
+    latencies, status_codes = [], set()
+    for i in ids:
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(
+            {"queryStringParameters": {"policy_id": str(i)}}, Context()
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        status_codes.add(response["statusCode"])
+    percentiles = statistics.quantiles(latencies, n=100)
+    return percentiles[49], percentiles[98], status_codes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", type=int, default=10_000_000)
+    parser.add_argument(
+        "--false-positive-rates", type=float, nargs="+", default=[0.01, 0.001]
+    )
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--feature-store-ms", type=float, default=8)
+    args = parser.parse_args()
+
+    for false_positive_rate in args.false_positive_rates:
+        benchmark_filter(args.ids, false_positive_rate, args.lookups)
+
+    logging.disable(logging.CRITICAL)
+    lambda_function.stage_metrics.sink = lambda record: None
+    known = 100_000
+    featurestore = KnownIdsFeatureStore(args.feature_store_ms, known)
+    lambda_function.guarded_featurestore.client = featurestore
+    lambda_function.guarded_sm.client = StubEndpoint(0, 0)
+    known_identifiers = KnownIdentifiers(None, {})
+    for fg in lambda_function.feature_groups:
+        known_identifiers.filters_uris[fg["name"]] = ""
+        bloom_filter = BloomFilter.for_capacity(known, 0.01)
+        bloom_filter.update(str(i) for i in range(known))
+        known_identifiers.filters[fg["name"]] = bloom_filter
+    reader = lambda_function.feature_groups_reader
+
+    unknown_ids = range(known, known + args.requests)
+    for name, filters in [("no filter", None), ("filter", known_identifiers)]:
+        reader.known_identifiers = filters
+        featurestore.calls = 0
+        p50, p99, status_codes = invoke(unknown_ids)
+        print(
+            f"{name:>10}: unknown ids p50 {p50:7.3f} ms | p99 {p99:7.3f} ms"
+            f" | {featurestore.calls} feature store calls | status codes {status_codes}"
+        )
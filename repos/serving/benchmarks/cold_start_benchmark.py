@@ -0,0 +1,191 @@
+"""Local cold start benchmark of the serving Lambda handlers.
+
+Each handler module is imported in a fresh Python process, as in a new Lambda
+execution environment, and its first invocation is timed against stubbed AWS
+clients (botocore Stubber), so the results do not depend on the network.
+
+Connection priming is disabled, since it would reach AWS. Use
+`python -X importtime` on the child command to break the import time down.
+
+Usage:
+    python benchmarks/cold_start_benchmark.py --runs 5
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HANDLERS = {
+    "xgboost_inference": "lambdas/functions/xgboost_inference",
+    "read-ddb": "lambdas/functions/read-ddb",
+}
+
+
+def get_environment(handler: str) -> dict:
+    env = {
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "prime_connections": "false",
+    }
+    if handler == "xgboost_inference":
+        with Path("configurations/xgboost.model.json").open("r") as f:
+            features_names = json.load(f)["features_names"]
+        split = features_names.index("customer_age")
+        env.update(
+            {
+                "region": "us-east-1",
+                "endpoint_name": "benchmark-xgboost",
+                "content_type": "text/csv",
+                "features_names": ",".join(features_names),
+                "feature_groups": json.dumps(
+                    [
+                        {
+                            "name": "claims",
+                            "feature_group_name": "benchmark-claims",
+                            "features_names": features_names[:split],
+                            "event_time_feature_name": "event_time",
+                        },
+                        {
+                            "name": "customers",
+                            "feature_group_name": "benchmark-customers",
+                            "features_names": features_names[split:],
+                            "event_time_feature_name": "event_time",
+                        },
+                    ]
+                ),
+            }
+        )
+    else:
+        env["target_ddb_table"] = "benchmark-table"
+    return env
+
+
+def stub_xgboost_inference(module):
+    from botocore.response import StreamingBody
+    from botocore.stub import ANY, Stubber
+
+    records = [
+        {
+            "FeatureGroupName": fg["feature_group_name"],
+            "RecordIdentifierValueAsString": "1",
+            "Record": [
+                {"FeatureName": n, "ValueAsString": "1"} for n in fg["features_names"]
+            ],
+        }
+        for fg in module.feature_groups
+    ]
+    fs_stubber = Stubber(module.featurestore_runtime)
+    fs_stubber.add_response(
+        "batch_get_record",
+        {"Records": records, "Errors": [], "UnprocessedIdentifiers": []},
+        {"Identifiers": ANY},
+    )
+    sm_stubber = Stubber(module.client_sm)
+    sm_stubber.add_response(
+        "invoke_endpoint",
+        {"Body": StreamingBody(io.BytesIO(b"0.5"), 3)},
+        {"EndpointName": ANY, "Body": ANY, "ContentType": ANY, "Accept": ANY},
+    )
+    fs_stubber.activate()
+    sm_stubber.activate()
+    return {"queryStringParameters": {"policy_id": "1"}}
+
+
+def stub_read_ddb(module):
+    from botocore.stub import ANY, Stubber
+
+    stubber = Stubber(module.dynamodb)
+    stubber.add_response(
+        "get_item",
+        {"Item": {"generation": {"N": "1"}}},
+        {
+            "TableName": ANY,
+            "Key": ANY,
+            "ProjectionExpression": ANY,
+            "ExpressionAttributeNames": ANY,
+        },
+    )
+    stubber.add_response(
+        "get_item",
+        {
+            "Item": {"policy_id": {"S": "1"}, "score": {"S": "0.5"}},
+            "ConsumedCapacity": {"TableName": "benchmark-table", "CapacityUnits": 0.5},
+        },
+        {
+            "TableName": ANY,
+            "Key": ANY,
+            "ProjectionExpression": ANY,
+            "ExpressionAttributeNames": ANY,
+            "ConsistentRead": ANY,
+            "ReturnConsumedCapacity": ANY,
+        },
+    )
+    stubber.activate()
+    return {"queryStringParameters": {"policy_id": "1"}}
+
+
+class Context(object):
+    aws_request_id = "benchmark"
+
+    @staticmethod
+    def get_remaining_time_in_millis():
+        return 29000
+
+
+def child(handler: str) -> None:
+    """Runs in a fresh process: time the import and the first invocation"""
+    import importlib
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    sys.path.insert(0, HANDLERS[handler])
+
+    start = time.perf_counter()
+    module = importlib.import_module("lambda_function")
+    import_ms = (time.perf_counter() - start) * 1000
+
+    event = {"xgboost_inference": stub_xgboost_inference, "read-ddb": stub_read_ddb}[
+        handler
+    ](module)
+    start = time.perf_counter()
+    response = module.lambda_handler(event, Context())
+    first_call_ms = (time.perf_counter() - start) * 1000
+    assert response["statusCode"] == 200, response
+
+    print(json.dumps({"import_ms": import_ms, "first_call_ms": first_call_ms}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--handler", type=str, choices=list(HANDLERS))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.handler)
+        sys.exit(0)
+
+    for handler in [args.handler] if args.handler else HANDLERS:
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", "--handler", handler],
+                env={**os.environ, **get_environment(handler)},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        print(
+            f"{handler:>18}: import {statistics.median(r['import_ms'] for r in runs):8.1f} ms"
+            f" | first call {statistics.median(r['first_call_ms'] for r in runs):8.1f} ms"
+            f" (median of {args.runs})"
+        )
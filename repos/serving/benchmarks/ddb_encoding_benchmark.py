@@ -0,0 +1,79 @@
+"""CPU cost per item of the JSON responses of the DynamoDB score API.
+
+Items of the score table, as returned by the low-level client, are encoded
+to the JSON body of `read-ddb`:
+
+- before: `TypeDeserializer` then `json.dumps` with `DecimalEncoder`, indented
+  as the former handler did, and compact
+- after: `ItemEncoder` of the known schema, straight from the AttributeValues
+
+The outputs are checked to be the same JSON values.
+
+Usage:
+    python benchmarks/ddb_encoding_benchmark.py --items 1 100 500
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+
+from boto3.dynamodb.types import TypeDeserializer
+
+sys.path.insert(0, "lambdas/functions/read-ddb")
+
+from item_encoding import DecimalEncoder, ItemEncoder  # noqa: E402
+
+deserializer = TypeDeserializer()
+
+
+def get_items(n: int, numbers: bool) -> list:
+    rng = random.Random(0)
+    score_type = "N" if numbers else "S"
+    return [
+        {
+            "policy_id": {"S": str(i)},
+            "score": {score_type: str(round(rng.random(), 8))},
+            "scored_at": {"S": "1792206304"},
+        }
+        for i in range(n)
+    ]
+
+
+def deserialized(items: list, indent=None, separators=None) -> str:
+    return json.dumps(
+        [{k: deserializer.deserialize(v) for k, v in item.items()} for item in items],
+        cls=DecimalEncoder,
+        indent=indent,
+        separators=separators,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 100, 500])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    for numbers in [False, True]:
+        schema = {"policy_id": "S", "score": "N" if numbers else "S", "scored_at": "S"}
+        item_encoder = ItemEncoder(schema)
+        print(f"score as {'N' if numbers else 'S'}")
+        for n in args.items:
+            items = get_items(n, numbers)
+            assert json.loads(item_encoder.encode_items(items)) == json.loads(
+                deserialized(items)
+            )
+            for name, encode in [
+                ("TypeDeserializer, indent=2", lambda: deserialized(items, indent=2)),
+                (
+                    "TypeDeserializer, compact",
+                    lambda: deserialized(items, separators=(",", ":")),
+                ),
+                ("ItemEncoder", lambda: item_encoder.encode_items(items)),
+            ]:
+                seconds = min(timeit.repeat(encode, number=args.number, repeat=5))
+                print(
+                    f"{n:>5} items | {name:>26}: "
+                    f"{seconds / args.number / n * 1e6:7.2f} us per item"
+                )
@@ -0,0 +1,338 @@
+"""Latency and read capacity of the DynamoDB score API (`read-ddb`).
+
+`lambda_handler` is invoked in process against `LocalDynamoDB`, a local
+stand-in of the DynamoDB JSON API (GetItem, BatchGetItem, Query) served over
+HTTP, with a latency per call and per item and the read capacity units of
+DynamoDB: 4 KB per unit, halved for eventually consistent reads, summed then
+rounded up by Query, rounded up per item by GetItem and BatchGetItem. The
+stand-in can also leave a fraction of the BatchGetItem keys unprocessed, as a
+throttled table does.
+
+- single id: the former query paginator and GetItem with a projection,
+  eventually and strongly consistent, and cached for a load generation
+- many ids: one GetItem per id and BatchGetItem, with and without throttling
+
+Usage:
+    python benchmarks/ddb_read_benchmark.py --requests 300 --batch-size 100
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cold_start_benchmark import HANDLERS, Context, get_environment
+
+os.environ.update(get_environment("read-ddb"))
+sys.path.insert(0, HANDLERS["read-ddb"])
+import boto3  # noqa: E402
+import lambda_function  # noqa: E402
+from boto3.dynamodb.types import TypeDeserializer  # noqa: E402
+from item_encoding import DecimalEncoder  # noqa: E402
+
+TABLE_NAME = os.environ["target_ddb_table"]
+deserializer = TypeDeserializer()
+
+
+def item_size(item: dict) -> int:
+    """Approximate DynamoDB item size: names, strings and numbers"""
+    size = 0
+    for name, value in item.items():
+        size += len(name.encode("utf-8"))
+        if "S" in value:
+            size += len(value["S"].encode("utf-8"))
+        elif "N" in value:
+            size += math.ceil(len(value["N"].lstrip("-").replace(".", "")) / 2) + 1
+        else:
+            size += len(json.dumps(value))
+    return size
+
+
+def read_units(size: int, consistent: bool) -> float:
+    return max(1, math.ceil(size / 4096)) * (1.0 if consistent else 0.5)
+
+
+class LocalDynamoDB(object):
+    """In-memory table served with the DynamoDB JSON protocol
+
+    Args:
+        items (dict): items by `policy_id`, in the DynamoDB JSON format
+        latency_ms (float): latency of each call
+        item_latency_ms (float): latency added per item read
+        unprocessed_rate (float): fraction of the BatchGetItem keys left
+            unprocessed
+    """
+
+    def __init__(
+        self,
+        items: dict,
+        latency_ms: float = 3,
+        item_latency_ms: float = 0.02,
+        unprocessed_rate: float = 0.0,
+    ) -> None:
+        self.items = items
+        self.latency = latency_ms / 1000
+        self.item_latency = item_latency_ms / 1000
+        self.unprocessed_rate = unprocessed_rate
+        self.rng = random.Random(0)
+        self.calls = 0
+        self.capacity = 0.0
+        self._lock = threading.Lock()
+
+    def _project(self, item: dict, request: dict) -> dict:
+        if "ProjectionExpression" not in request:
+            return item
+        names = request.get("ExpressionAttributeNames", {})
+        projected = [
+            names.get(p.strip(), p.strip())
+            for p in request["ProjectionExpression"].split(",")
+        ]
+        return {k: v for k, v in item.items() if k in projected}
+
+    def _consume(self, units: float) -> dict:
+        with self._lock:
+            self.calls += 1
+            self.capacity += units
+        return {"TableName": TABLE_NAME, "CapacityUnits": units}
+
+    def GetItem(self, request: dict) -> dict:
+        consistent = request.get("ConsistentRead", False)
+        item = self.items.get(request["Key"]["policy_id"]["S"])
+        time.sleep(self.latency + self.item_latency)
+        # Read capacity is consumed by the full item, before the projection
+        response = {
+            "ConsumedCapacity": self._consume(
+                read_units(item_size(item) if item else 0, consistent)
+            )
+        }
+        if item:
+            response["Item"] = self._project(item, request)
+        return response
+
+    def BatchGetItem(self, request: dict) -> dict:
+        table = request["RequestItems"][TABLE_NAME]
+        consistent = table.get("ConsistentRead", False)
+        keys, unprocessed = [], []
+        for key in table["Keys"]:
+            if self.rng.random() < self.unprocessed_rate:
+                unprocessed.append(key)
+            else:
+                keys.append(key)
+        time.sleep(self.latency + self.item_latency * len(keys))
+        items = [self.items.get(k["policy_id"]["S"]) for k in keys]
+        response = {
+            "Responses": {
+                TABLE_NAME: [self._project(i, table) for i in items if i]
+            },
+            "ConsumedCapacity": [
+                self._consume(
+                    sum(read_units(item_size(i) if i else 0, consistent) for i in items)
+                )
+            ],
+            "UnprocessedKeys": {},
+        }
+        if unprocessed:
+            response["UnprocessedKeys"] = {TABLE_NAME: {**table, "Keys": unprocessed}}
+        return response
+
+    def Query(self, request: dict) -> dict:
+        consistent = request.get("ConsistentRead", False)
+        policy_id = request["ExpressionAttributeValues"][":policy_id"]["S"]
+        items = [self.items[policy_id]] if policy_id in self.items else []
+        time.sleep(self.latency + self.item_latency * len(items))
+        # Query sums the sizes of the items, then rounds up
+        units = read_units(sum(item_size(i) for i in items), consistent)
+        return {
+            "Items": items,
+            "Count": len(items),
+            "ScannedCount": len(items),
+            "ConsumedCapacity": self._consume(units),
+        }
+
+    def serve(self) -> ThreadingHTTPServer:
+        table = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                operation = self.headers["X-Amz-Target"].split(".")[-1]
+                length = int(self.headers["Content-Length"])
+                request = json.loads(self.rfile.read(length))
+                body = json.dumps(getattr(table, operation)(request)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-amz-json-1.0")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def query_items(dynamodb, policy_id: str) -> str:
+    """Former read path: query paginator, all attributes, indented JSON"""
+    paginator = dynamodb.get_paginator("query")
+    for page in paginator.paginate(
+        TableName=TABLE_NAME,
+        KeyConditionExpression="policy_id = :policy_id",
+        ExpressionAttributeValues={":policy_id": {"S": policy_id}},
+        Select="ALL_ATTRIBUTES",
+        ReturnConsumedCapacity="TOTAL",
+        PaginationConfig={"MaxItems": 10, "PageSize": 10},
+    ):
+        if page["Count"] > 0:
+            items = [
+                {k: deserializer.deserialize(v) for k, v in item.items()}
+                for item in page["Items"]
+            ]
+            converted_items = json.dumps(items, cls=DecimalEncoder, indent=2)
+    return converted_items
+
+
+def measure(table: LocalDynamoDB, call, requests: int) -> dict:
+    calls, capacity = table.calls, table.capacity
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": percentiles[49],
+        "p99": percentiles[98],
+        "calls": (table.calls - calls) / requests,
+        "rcu": (table.capacity - capacity) / requests,
+    }
+
+
+def report(name: str, result: dict) -> None:
+    print(
+        f"{name:>34}: p50 {result['p50']:7.2f} ms | p99 {result['p99']:7.2f} ms"
+        f" | {result['calls']:6.2f} calls | {result['rcu']:7.2f} RCU per request"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=3)
+    parser.add_argument("--unprocessed-rate", type=float, default=0.3)
+    parser.add_argument("--hot-ids", type=int, default=50)
+    parser.add_argument(
+        "--payload-bytes",
+        type=int,
+        default=5000,
+        help="size of the attributes left out by the projection",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(0)
+    items = {
+        str(i): {
+            "policy_id": {"S": str(i)},
+            "score": {"S": str(rng.random())},
+            "scored_at": {"S": str(time.time())},
+            "features": {"S": "x" * args.payload_bytes},
+        }
+        for i in range(args.items)
+    }
+    table = LocalDynamoDB(items, latency_ms=args.latency_ms)
+    server = table.serve()
+    dynamodb = boto3.client(
+        "dynamodb",
+        region_name="us-east-1",
+        endpoint_url=f"http://127.0.0.1:{server.server_address[1]}",
+    )
+    lambda_function.dynamodb = dynamodb
+    lambda_function.generation_cache.dynamodb = dynamodb
+
+    def ids(i: int) -> list:
+        start = i * args.batch_size
+        return [str((start + j) % args.items) for j in range(args.batch_size)]
+
+    def batch(i: int) -> dict:
+        response = handler({"body": json.dumps({"policy_ids": ids(i)})})
+        return json.loads(response["body"])
+
+    def handler(event: dict) -> dict:
+        response = lambda_function.lambda_handler(event, Context())
+        assert response["statusCode"] == 200, response
+        return response
+
+    print(f"single id, {args.payload_bytes} bytes not projected")
+    report(
+        "query paginator",
+        measure(table, lambda i: query_items(dynamodb, str(i)), args.requests),
+    )
+    for consistent in ["false", "true"]:
+        params = {"consistent": consistent}
+        report(
+            f"GetItem consistent={consistent}",
+            measure(
+                table,
+                lambda i: handler(
+                    {"queryStringParameters": {**params, "policy_id": str(i)}}
+                ),
+                args.requests,
+            ),
+        )
+    # Once the Glue job wrote a load generation, hot policies are cached
+    items[lambda_function.generation_marker_key] = {
+        "policy_id": {"S": lambda_function.generation_marker_key},
+        "generation": {"N": "1"},
+    }
+    lambda_function.generation_cache.check_seconds = 0
+    lambda_function.generation_cache.check()
+    lambda_function.generation_cache.check_seconds = 5
+    for i in range(args.hot_ids):
+        handler({"queryStringParameters": {"policy_id": str(i)}})
+    report(
+        f"GetItem, {args.hot_ids} hot ids cached",
+        measure(
+            table,
+            lambda i: handler(
+                {"queryStringParameters": {"policy_id": str(i % args.hot_ids)}}
+            ),
+            args.requests,
+        ),
+    )
+    del items[lambda_function.generation_marker_key]
+    lambda_function.generation_cache.check_seconds = 0
+    lambda_function.generation_cache.check()
+    lambda_function.generation_cache.check_seconds = 5
+
+    requests = max(args.requests // 10, 10)
+    print(f"\n{args.batch_size} ids per request")
+    report(
+        "GetItem per id",
+        measure(
+            table,
+            lambda i: [
+                handler({"queryStringParameters": {"policy_id": p}}) for p in ids(i)
+            ],
+            requests,
+        ),
+    )
+    report("BatchGetItem", measure(table, batch, requests))
+    table.unprocessed_rate = args.unprocessed_rate
+    unprocessed = []
+    report(
+        f"BatchGetItem, {args.unprocessed_rate:.0%} unprocessed",
+        measure(
+            table, lambda i: unprocessed.append(len(batch(i)["unprocessed"])), requests
+        ),
+    )
+    print(f"{'':>34}  {sum(unprocessed)} ids left unprocessed after the retries")
+    server.shutdown()
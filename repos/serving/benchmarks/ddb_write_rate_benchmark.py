@@ -0,0 +1,247 @@
+"""Write rate of the Glue loader (`load-ddb-table.py`) against a throttled table.
+
+`ThrottledTable` is a stand-in of BatchWriteItem on a simulated clock: its
+available write capacity, a token bucket holding at most one second of
+units, changes over the run as other writers come and go. Items it cannot
+write are returned unprocessed, and a call with no item written raises
+`ProvisionedThroughputExceededException`. A fraction of the calls fail on a
+read timeout or a closed connection, after their items were written or not.
+Write capacity units are 1 KB per item, rounded up.
+
+- former loader: 1000-row chunks written as fast as the table accepts them,
+  unprocessed items sent again at once and failed calls retried with the
+  backoff of botocore, then `sleep(1)`
+- `AdaptiveBatchWriter`, with an unknown capacity (on-demand) and with the
+  provisioned capacity and its target utilization
+
+Each run prints, per phase, the available capacity, the consumed units per
+second and the writer rate at the end of the phase.
+
+Usage:
+    python benchmarks/ddb_write_rate_benchmark.py --phases 500:60 200:60 1000:60
+"""
+import argparse
+import logging
+import math
+import random
+import sys
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    HTTPClientError,
+    ReadTimeoutError,
+)
+
+sys.path.insert(0, "scripts/glue")
+
+from ddb_writer import MAX_ITEMS_PER_BATCH_WRITE, AdaptiveBatchWriter  # noqa: E402
+
+TABLE_NAME = "benchmark-DDB-Table"
+
+
+class Clock(object):
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class ThrottledTable(object):
+    """BatchWriteItem of a table whose capacity changes by phases
+
+    Args:
+        clock (Clock): simulated clock, advanced by the latency of each call
+        phases (list): (write capacity units per second, seconds) tuples
+        latency_ms (float): latency of each call
+        error_rate (float): fraction of the calls failing on a connection
+            error or a read timeout
+    """
+
+    def __init__(
+        self,
+        clock: Clock,
+        phases: list,
+        latency_ms: float = 8,
+        error_rate: float = 0.01,
+    ) -> None:
+        self.clock = clock
+        self.phases = phases
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(1)
+        self.errors = 0
+        # Distinct items written
+        self.written = set()
+        self.tokens = 0.0
+        self.filled_at = 0.0
+        self.calls = 0
+        self.throttles = 0
+        # Consumed units per phase
+        self.consumed = [0.0] * len(phases)
+
+    def phase(self, now: float) -> int:
+        end = 0
+        for i, (_, seconds) in enumerate(self.phases):
+            end += seconds
+            if now < end:
+                return i
+        return len(self.phases) - 1
+
+    def capacity(self, now: float) -> float:
+        return self.phases[self.phase(now)][0]
+
+    def batch_write_item(self, RequestItems: dict, ReturnConsumedCapacity: str):
+        self.clock.sleep(self.latency)
+        now = self.clock()
+        capacity = self.capacity(now)
+        self.tokens = min(capacity, self.tokens + (now - self.filled_at) * capacity)
+        self.filled_at = now
+        self.calls += 1
+        if self.rng.random() < self.error_rate / 2:
+            self.errors += 1
+            raise ConnectionClosedError(endpoint_url="https://dynamodb")
+
+        requests = RequestItems[TABLE_NAME]
+        consumed, unprocessed = 0.0, []
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            size = sum(len(k) + len(v["S"]) for k, v in item.items())
+            units = math.ceil(size / 1024)
+            if self.tokens >= units:
+                self.tokens -= units
+                consumed += units
+                self.written.add(item["policy_id"]["S"])
+            else:
+                unprocessed.append(request)
+        if len(unprocessed) == len(requests):
+            self.throttles += 1
+            raise ClientError(
+                {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                "BatchWriteItem",
+            )
+        self.consumed[self.phase(now)] += consumed
+        # The response of a written batch is lost
+        if self.rng.random() < self.error_rate / 2:
+            self.errors += 1
+            raise ReadTimeoutError(endpoint_url="https://dynamodb")
+        response = {
+            "ConsumedCapacity": [{"TableName": TABLE_NAME, "CapacityUnits": consumed}]
+        }
+        if unprocessed:
+            self.throttles += 1
+            response["UnprocessedItems"] = {TABLE_NAME: unprocessed}
+        return response
+
+
+def get_items(clock: Clock, end: float, ids: set = None):
+    """Items of the batch transform output, until the end of the run, their
+    identifiers are added to `ids`"""
+    i = 0
+    while clock() < end:
+        if ids is not None:
+            ids.add(str(i))
+        yield {
+            "policy_id": {"S": str(i)},
+            "score": {"S": "0.12345678"},
+            "scored_at": {"S": "1792206304"},
+        }
+        i += 1
+
+
+def former_loader(table: ThrottledTable, clock: Clock, end: float) -> None:
+    """1000-row chunks, as `wr.dynamodb.put_df` then `time.sleep(1)`"""
+    rng = random.Random(0)
+    items = get_items(clock, end)
+    while clock() < end:
+        chunk = [{"PutRequest": {"Item": next(items)}} for _ in range(1000)]
+        # The batch writer of boto3 sends the unprocessed items again with the
+        # next batch, at once
+        while chunk:
+            batch = chunk[:MAX_ITEMS_PER_BATCH_WRITE]
+            chunk = chunk[MAX_ITEMS_PER_BATCH_WRITE:]
+            for attempt in range(5):
+                try:
+                    response = table.batch_write_item(
+                        RequestItems={TABLE_NAME: batch}, ReturnConsumedCapacity="NONE"
+                    )
+                    break
+                except (ClientError, HTTPClientError):
+                    # Legacy retry mode of botocore: base 2 exponential backoff
+                    clock.sleep(rng.random() * 2 ** attempt)
+            else:
+                continue
+            chunk += response.get("UnprocessedItems", {}).get(TABLE_NAME, [])
+        clock.sleep(1)
+
+
+def print_phases(table: ThrottledTable, rates: list = None) -> None:
+    for i, (capacity, seconds) in enumerate(table.phases):
+        consumed = table.consumed[i] / seconds
+        line = (
+            f"    {capacity:6.0f} WCU/s available: {consumed:6.0f} WCU/s consumed"
+            f" ({consumed / capacity:4.0%})"
+        )
+        if rates:
+            line += f", writer rate {rates[i]:6.0f} WCU/s"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--phases",
+        nargs="+",
+        default=["500:60", "200:60", "1000:60"],
+        help="capacity:seconds of each phase",
+    )
+    parser.add_argument("--provisioned", type=float, default=1000)
+    parser.add_argument("--target-utilization", type=float, default=0.8)
+    parser.add_argument("--initial-rate", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    phases = [tuple(float(v) for v in p.split(":")) for p in args.phases]
+    duration = sum(seconds for _, seconds in phases)
+
+    clock = Clock()
+    table = ThrottledTable(clock, phases, error_rate=args.error_rate)
+    former_loader(table, clock, duration)
+    rows = sum(table.consumed)
+    print(
+        f"former loader: {rows / clock():.0f} rows/s, {table.calls} calls,"
+        f" {table.throttles} throttles, {table.errors} errors"
+    )
+    print_phases(table)
+
+    for name, write_capacity in [
+        ("on-demand", None),
+        (f"provisioned {args.provisioned:.0f} WCU", args.provisioned),
+    ]:
+        clock = Clock()
+        table = ThrottledTable(clock, phases, error_rate=args.error_rate)
+        writer = AdaptiveBatchWriter(
+            table,
+            TABLE_NAME,
+            write_capacity=write_capacity,
+            target_utilization=args.target_utilization,
+            initial_rate=args.initial_rate,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        # Writer rate at the end of each phase
+        rates, end, ids = [], 0.0, set()
+        for _, seconds in phases:
+            end += seconds
+            writer.write(get_items(clock, end, ids))
+            rates.append(writer.rate)
+        writer.flush()
+        # Every item was written, despite the errors
+        assert table.written == ids
+        print(f"\nAdaptiveBatchWriter, {name}: {writer.report()}")
+        print(f"    {table.errors} connection errors and read timeouts")
+        print_phases(table, rates)
@@ -0,0 +1,181 @@
+"""Payload size and latency of the endpoint request encodings.
+
+Synthetic feature vectors shaped like the model ones (one-hot encoded
+categories, small integers and amounts) are encoded as CSV, libsvm and
+RecordIO-protobuf, and the payload size and encoding time are reported for a
+single record and a batch. With `--endpoint-name`, each payload is also sent
+to the endpoint to compare the end-to-end invocation latency.
+
+The scores of each payload are checked against the CSV ones: a booster is
+trained on the dense vectors, then evaluated on the payloads decoded as the
+XGBoost container reads them, libsvm as a sparse matrix whose absent entries
+are missing values.
+
+Usage:
+    python benchmarks/encoding_benchmark.py --rows 100 \
+        [--endpoint-name sagemaker-<project>-xgboost]
+"""
+import argparse
+import json
+import random
+import statistics
+import struct
+import sys
+import time
+import timeit
+from pathlib import Path
+
+import numpy as np
+import xgboost as xgb
+from scipy.sparse import csr_matrix
+
+sys.path.insert(0, "lambdas/functions/xgboost_inference")
+from request_encoding import (  # noqa: E402
+    CSV_CONTENT_TYPE,
+    LIBSVM_CONTENT_TYPE,
+    RECORDIO_PROTOBUF_CONTENT_TYPE,
+    RequestEncoder,
+)
+
+CONTENT_TYPES = [CSV_CONTENT_TYPE, LIBSVM_CONTENT_TYPE, RECORDIO_PROTOBUF_CONTENT_TYPE]
+FRACTIONAL_FEATURES = {
+    "injury_claim",
+    "vehicle_claim",
+    "total_claim_amount",
+    "policy_annual_premium",
+}
+
+
+def get_vectors(features_names: list, rows: int):
+    rng = random.Random(0)
+    features_types = "".join(
+        "F" if f in FRACTIONAL_FEATURES else "I" for f in features_names
+    )
+    lines = []
+    for _ in range(rows):
+        values = []
+        for name, code in zip(features_names, features_types):
+            if code == "F":
+                values.append(str(round(rng.uniform(1000, 60000), 2)))
+            elif "_" in name and name.rsplit("_", 1)[0] in {
+                "driver_relationship",
+                "incident_type",
+                "collision_type",
+                "authorities_contacted",
+                "customer_gender",
+                "policy_state",
+            }:
+                values.append(str(int(rng.random() < 0.25)))
+            else:
+                values.append(str(rng.randint(0, 60)))
+        lines.append(",".join(values))
+    return features_types, lines
+
+
+def decode(encoder, body: bytes, n_features: int) -> xgb.DMatrix:
+    """Payload as read by the XGBoost container"""
+    if encoder.content_type == CSV_CONTENT_TYPE:
+        rows = body.decode("utf-8").split("\n")
+        return xgb.DMatrix(np.array([r.split(",") for r in rows], dtype=np.float32))
+    if encoder.content_type == LIBSVM_CONTENT_TYPE:
+        data, indices, indptr = [], [], [0]
+        for row in body.decode("utf-8").split("\n"):
+            for pair in row.split(" ")[1:]:
+                i, v = pair.split(":")
+                indices.append(int(i))
+                data.append(float(v))
+            indptr.append(len(data))
+        return xgb.DMatrix(
+            csr_matrix(
+                (data, indices, indptr), shape=(len(indptr) - 1, n_features)
+            )
+        )
+    rows, offset = [], 0
+    while offset < len(body):
+        (length,) = struct.unpack_from("<I", body, offset + 4)
+        record = body[offset + 8 : offset + 8 + length]
+        # The float32 tensor ends the record
+        rows.append(struct.unpack(f"<{n_features}f", record[-4 * n_features :]))
+        offset += 8 + length + (-length % 4)
+    return xgb.DMatrix(np.array(rows, dtype=np.float32))
+
+
+def get_booster(lines: list) -> xgb.Booster:
+    """Booster whose splits send missing values and zeros apart"""
+    data = np.array([line.split(",") for line in lines], dtype=np.float32)
+    rng = np.random.default_rng(0)
+    label = (data @ rng.normal(size=data.shape[1]) > 0).astype(int)
+    # The same vectors with their zeros missing, and the opposite labels
+    missing = np.where(data == 0, np.nan, data)
+    train = xgb.DMatrix(
+        np.vstack([data, missing]), label=np.concatenate([label, 1 - label])
+    )
+    return xgb.train(
+        {"objective": "binary:logistic", "max_depth": 4},
+        train,
+        num_boost_round=20,
+    )
+
+
+def invoke_latency(client_sm, endpoint_name: str, encoder, body: bytes, number: int):
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        client_sm.invoke_endpoint(
+            EndpointName=endpoint_name,
+            Body=body,
+            ContentType=encoder.content_type,
+            Accept=CSV_CONTENT_TYPE,
+        )["Body"].read()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), statistics.quantiles(latencies, n=100)[98]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--configuration", type=str, default="configurations/xgboost.model.json"
+    )
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--endpoint-name", type=str, default=None)
+    args = parser.parse_args()
+
+    with Path(args.configuration).open("r") as f:
+        features_names = json.load(f)["features_names"]
+    features_types, lines = get_vectors(features_names, args.rows)
+    booster = get_booster(lines)
+    expected = booster.predict(
+        decode(RequestEncoder(CSV_CONTENT_TYPE), "\n".join(lines).encode(), 0)
+    )
+
+    client_sm = None
+    if args.endpoint_name:
+        import boto3
+
+        client_sm = boto3.client("sagemaker-runtime")
+
+    for content_type in CONTENT_TYPES:
+        encoder = RequestEncoder(content_type, features_types)
+        for name, batch in [("1 row", lines[:1]), (f"{args.rows} rows", lines)]:
+            body = encoder.join([encoder.encode_row(line) for line in batch])
+            encode_s = (
+                timeit.timeit(
+                    lambda: encoder.join([encoder.encode_row(line) for line in batch]),
+                    number=args.number,
+                )
+                / args.number
+            )
+            scores = booster.predict(decode(encoder, body, len(features_names)))
+            max_diff = float(np.abs(scores - expected[: len(batch)]).max())
+            assert max_diff < 1e-6, f"{content_type} scores differ by {max_diff}"
+            report = (
+                f"{content_type:>32} {name:>10}: {len(body):8d} bytes"
+                f" | encode {encode_s * 1e6:9.1f} us | max score diff {max_diff:.1e}"
+            )
+            if client_sm is not None:
+                p50, p99 = invoke_latency(
+                    client_sm, args.endpoint_name, encoder, body, args.number
+                )
+                report += f" | invoke p50 {p50:7.1f} ms p99 {p99:7.1f} ms"
+            print(report)
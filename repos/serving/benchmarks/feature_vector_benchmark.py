@@ -0,0 +1,74 @@
+"""Microbenchmark of the feature vector assembly in the xgboost inference Lambda.
+
+Compares the original pandas path (DataFrame + concat + loc) with the
+precompiled FeatureVectorAssembler on synthetic `get_record` responses.
+
+Usage:
+    python benchmarks/feature_vector_benchmark.py --number 10000
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, "lambdas/functions/xgboost_inference")
+from feature_vector import FeatureVectorAssembler  # noqa: E402
+
+
+def get_features_names(configuration_path: str) -> list:
+    with Path(configuration_path).open("r") as f:
+        return json.load(f)["features_names"]
+
+
+def make_record(features_names: list) -> list:
+    return [
+        {"FeatureName": n, "ValueAsString": str(round(random.random() * 100, 2))}
+        for n in features_names
+    ]
+
+
+def pandas_csv(claims_record: list, customer_record: list, col_order: list) -> str:
+    claims_df = pd.DataFrame(claims_record).set_index("FeatureName")
+    customer_df = pd.DataFrame(customer_record).set_index("FeatureName")
+    blended_df = pd.concat([claims_df, customer_df]).loc[col_order]
+    return ",".join(blended_df["ValueAsString"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--configuration", type=str, default="configurations/xgboost.model.json"
+    )
+    parser.add_argument("--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    col_order = get_features_names(args.configuration)
+    split = col_order.index("customer_age")
+    # Feature groups also hold columns the model does not use
+    claims_record = make_record(
+        ["policy_id", "fraud", "event_time"] + col_order[:split]
+    )
+    customer_record = make_record(["policy_id", "event_time"] + col_order[split:])
+
+    assembler = FeatureVectorAssembler(col_order)
+    assert assembler.to_csv(claims_record, customer_record) == pandas_csv(
+        claims_record, customer_record, col_order
+    )
+
+    results = {
+        "pandas": timeit.timeit(
+            lambda: pandas_csv(claims_record, customer_record, col_order),
+            number=args.number,
+        ),
+        "assembler": timeit.timeit(
+            lambda: assembler.to_csv(claims_record, customer_record),
+            number=args.number,
+        ),
+    }
+    for name, total in results.items():
+        print(f"{name:>10}: {total / args.number * 1e6:10.2f} us/request")
+    print(f"   speedup: {results['pandas'] / results['assembler']:10.1f}x")
@@ -0,0 +1,107 @@
+"""Hedged feature reads and endpoint circuit breaker of the real-time handler.
+
+`lambda_handler` is invoked in process, as in `stage_latency_benchmark`,
+against stub backends:
+
+- hedging: a feature store whose calls are slow with a given probability,
+  p50/p99 of the handler with and without hedged reads
+- circuit breaker: an endpoint failing for a while, status codes and
+  handler latency before, during and after the outage
+
+Usage:
+    python benchmarks/resilience_benchmark.py --requests 500
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from collections import Counter
+
+from cold_start_benchmark import Context
+from scoring_server_benchmark import StubEndpoint, StubFeatureStore, lambda_function
+
+
+class SlowTailFeatureStore(StubFeatureStore):
+    def __init__(self, latency_ms: float, slow_ms: float, slow_rate: float) -> None:
+        super().__init__(latency_ms, 0)
+        self.slow = slow_ms / 1000
+        self.slow_rate = slow_rate
+        self.rng = random.Random(0)
+
+    def batch_get_record(self, Identifiers):
+        if self.rng.random() < self.slow_rate:
+            time.sleep(self.slow)
+        return super().batch_get_record(Identifiers)
+
+
+class FailingEndpoint(StubEndpoint):
+    def __init__(self, latency_ms: float) -> None:
+        super().__init__(latency_ms, 0)
+        self.failing = False
+
+    def invoke_endpoint(self, **kwargs):
+        if self.failing:
+            time.sleep(self.latency)
+            raise ConnectionError("endpoint unavailable")
+        return super().invoke_endpoint(**kwargs)
+
+
+def invoke(requests: int, start_id: int = 0):
+    latencies, status_codes = [], Counter()
+    for i in range(start_id, start_id + requests):
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(
+            {"queryStringParameters": {"policy_id": str(i)}}, Context()
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        status_codes[response["statusCode"]] += 1
+    percentiles = statistics.quantiles(latencies, n=100)
+    return percentiles[49], percentiles[98], dict(status_codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--feature-store-ms", type=float, default=8)
+    parser.add_argument("--slow-ms", type=float, default=200)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--endpoint-ms", type=float, default=15)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    records = []
+    lambda_function.stage_metrics.sink = records.append
+    guarded_featurestore = lambda_function.guarded_featurestore
+    endpoint = FailingEndpoint(args.endpoint_ms)
+    lambda_function.guarded_sm.client = endpoint
+
+    for hedged in ((), ("batch_get_record",)):
+        guarded_featurestore.client = SlowTailFeatureStore(
+            args.feature_store_ms, args.slow_ms, args.slow_rate
+        )
+        guarded_featurestore.hedged = hedged
+        del records[:]
+        p50, p99, _ = invoke(args.requests)
+        hedges = sum(r.get("Hedges", 0) for r in records)
+        print(
+            f"{'hedged' if hedged else 'not hedged':>10}: p50 {p50:7.1f} ms"
+            f" | p99 {p99:7.1f} ms | {hedges} hedges"
+        )
+
+    breaker = lambda_function.circuit_breaker
+    guarded_featurestore.client = StubFeatureStore(args.feature_store_ms, 0)
+    for phase, failing, requests in [
+        ("healthy", False, 50),
+        ("outage", True, 50),
+        ("recovered", False, 50),
+    ]:
+        endpoint.failing = failing
+        if phase == "recovered":
+            # Skip the cool down of the breaker
+            breaker._opened_at -= breaker.open_seconds
+        p50, p99, status_codes = invoke(requests, start_id=args.requests)
+        print(
+            f"{phase:>10}: p50 {p50:7.1f} ms | p99 {p99:7.1f} ms"
+            f" | status codes {status_codes} | breaker {breaker.state}"
+        )
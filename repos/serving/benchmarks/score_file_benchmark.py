@@ -0,0 +1,217 @@
+"""Latency and requests of the score API (`read-ddb`) on an S3 score file.
+
+The scores are written as the score file of the batch transform pipeline
+(`scripts/build_score_file.py`) to a local directory, served by `LocalS3`: a
+stand-in of `get_object` with byte ranges and conditional reads, with a
+latency per request and per MB read. `lambda_handler` is invoked in process
+with the `s3_file` score store, then with the DynamoDB table of
+`ddb_read_benchmark.py` for comparison.
+
+- single id: cold, the block of each id read with one range GET, and warm,
+  every block cached
+- many ids: one range GET per distinct block, concurrent
+- size of the file and of its index, the requests and bytes of the open
+
+Usage:
+    python benchmarks/score_file_benchmark.py --items 100000 --requests 300
+"""
+import argparse
+import io
+import json
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+
+from cold_start_benchmark import Context
+from ddb_read_benchmark import LocalDynamoDB, boto3, lambda_function
+
+sys.path.insert(0, "scripts")
+from build_score_file import write_score_file  # noqa: E402
+from score_file import LATEST_NAME, ScoreFileReader  # noqa: E402
+
+
+class LocalS3(object):
+    """Objects of a local directory, read as with the `get_object` of boto3
+
+    Args:
+        root (Path): directory of the objects, keys are relative paths
+        latency_ms (float): latency of each request, to the first byte
+        ms_per_mb (float): latency added per MB read
+    """
+
+    def __init__(self, root: Path, latency_ms: float = 20, ms_per_mb: float = 10):
+        self.root = root
+        self.latency = latency_ms / 1000
+        self.seconds_per_byte = ms_per_mb / 1000 / 2 ** 20
+        self.requests = 0
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None, IfNoneMatch=None):
+        path = self.root / Key
+        if not path.exists():
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        stat = path.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if IfNoneMatch == etag:
+            time.sleep(self.latency)
+            raise ClientError({"Error": {"Code": "304"}}, "GetObject")
+        start, end = 0, stat.st_size - 1
+        if Range:
+            first, last = Range[len("bytes=") :].split("-")
+            if not first:
+                start = max(0, stat.st_size - int(last))
+            else:
+                start, end = int(first), min(int(last), end)
+        with path.open("rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        with self._lock:
+            self.requests += 1
+            self.bytes_read += len(data)
+        time.sleep(self.latency + len(data) * self.seconds_per_byte)
+        return {"Body": io.BytesIO(data), "ETag": etag}
+
+
+def counters(store) -> tuple:
+    """Calls and bytes read so far, bytes are not counted by LocalDynamoDB"""
+    if isinstance(store, LocalS3):
+        return store.requests, store.bytes_read
+    return store.calls, 0
+
+
+def measure(store, call, requests: int) -> dict:
+    calls, bytes_read = counters(store)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": percentiles[49],
+        "p99": percentiles[98],
+        "calls": (counters(store)[0] - calls) / requests,
+        "bytes": (counters(store)[1] - bytes_read) / requests,
+    }
+
+
+def report(name: str, result: dict) -> None:
+    print(
+        f"{name:>34}: p50 {result['p50']:7.2f} ms | p99 {result['p99']:7.2f} ms"
+        f" | {result['calls']:6.2f} calls | {result['bytes']:9.0f} bytes per request"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--block-bytes", type=int, default=4096)
+    parser.add_argument("--s3-latency-ms", type=float, default=20)
+    parser.add_argument("--ddb-latency-ms", type=float, default=3)
+    parser.add_argument("--max-workers", type=int, default=16)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(0)
+    scores = {str(i): str(rng.random()) for i in range(args.items)}
+    root = Path(tempfile.mkdtemp())
+    key = "score-files/v1/scores.scf"
+    (root / key).parent.mkdir(parents=True)
+    start = time.perf_counter()
+    index = write_score_file(root / key, scores, args.block_bytes, "1792206304")
+    write_ms = (time.perf_counter() - start) * 1000
+    (root / "score-files" / LATEST_NAME).write_text(
+        json.dumps({"version": "v1", "key": key})
+    )
+    index_bytes = len(json.dumps(index, separators=(",", ":")))
+    print(
+        f"{args.items} scores: file {(root / key).stat().st_size / 2 ** 20:.2f} MB,"
+        f" {len(index['blocks'])} blocks, index {index_bytes / 1024:.0f} KB,"
+        f" written in {write_ms:.0f} ms"
+    )
+
+    s3 = LocalS3(root, latency_ms=args.s3_latency_ms)
+    executor = ThreadPoolExecutor(max_workers=args.max_workers)
+
+    def open_reader(max_blocks: int) -> ScoreFileReader:
+        reader = ScoreFileReader(s3, "s3://bucket/score-files", max_blocks=max_blocks)
+        lambda_function.score_file_reader = reader
+        lambda_function.score_file_executor = executor
+        return reader
+
+    requests, bytes_read = s3.requests, s3.bytes_read
+    start = time.perf_counter()
+    reader = open_reader(max_blocks=len(index["blocks"]))
+    reader.refresh()
+    print(
+        f"open: {(time.perf_counter() - start) * 1000:.1f} ms,"
+        f" {s3.requests - requests} requests, {s3.bytes_read - bytes_read} bytes"
+    )
+
+    def ids(i: int) -> list:
+        start = i * args.batch_size
+        return [
+            str(rng.randrange(args.items)) if j % 2 else str((start + j) % args.items)
+            for j in range(args.batch_size)
+        ]
+
+    def handler(event: dict) -> dict:
+        response = lambda_function.lambda_handler(event, Context())
+        assert response["statusCode"] == 200, response
+        return response
+
+    def single(i: int) -> None:
+        policy_id = str(rng.randrange(args.items))
+        response = handler({"queryStringParameters": {"policy_id": policy_id}})
+        assert json.loads(response["body"])[0]["score"] == scores[policy_id]
+
+    def batch(i: int) -> None:
+        policy_ids = ids(i)
+        response = handler({"body": json.dumps({"policy_ids": policy_ids})})
+        assert len(json.loads(response["body"])["items"]) == len(set(policy_ids))
+
+    print("\nsingle id")
+    report("score file, cold blocks", measure(s3, single, args.requests))
+    for p in scores:
+        reader.score_file.get(p)
+    report("score file, warm blocks", measure(s3, single, args.requests))
+
+    requests = max(args.requests // 10, 10)
+    print(f"\n{args.batch_size} ids per request")
+    open_reader(max_blocks=len(index["blocks"])).refresh()
+    report("score file, cold blocks", measure(s3, batch, requests))
+
+    # The same scores in the table, behind the same handler
+    lambda_function.score_file_reader = None
+    items = {
+        p: {
+            "policy_id": {"S": p},
+            "score": {"S": score},
+            "scored_at": {"S": "1792206304"},
+        }
+        for p, score in scores.items()
+    }
+    table = LocalDynamoDB(items, latency_ms=args.ddb_latency_ms)
+    server = table.serve()
+    dynamodb = boto3.client(
+        "dynamodb",
+        region_name="us-east-1",
+        endpoint_url=f"http://127.0.0.1:{server.server_address[1]}",
+    )
+    lambda_function.dynamodb = dynamodb
+    lambda_function.generation_cache.dynamodb = dynamodb
+    print("\nDynamoDB, no load generation cached")
+    report("GetItem", measure(table, single, args.requests))
+    report(f"BatchGetItem, {args.batch_size} ids", measure(table, batch, requests))
+    server.shutdown()
@@ -0,0 +1,155 @@
+"""Local load generator of the micro-batching scoring server.
+
+The server runs in process, configured as the Lambda by
+`cold_start_benchmark.get_environment`, with stub feature store and endpoint
+clients adding a fixed latency per call plus a per-row cost. Concurrent
+keep-alive clients send single requests, each for a distinct `policy_id` so
+that the caches do not hit, and the p50/p99 latency, throughput and batch
+size are reported for each micro-batching setting.
+
+The clients share the event loop of the server, so absolute numbers are
+pessimistic; compare the settings with each other.
+
+Usage:
+    python benchmarks/scoring_server_benchmark.py --clients 64 --requests 20
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+from cold_start_benchmark import HANDLERS, get_environment
+
+os.environ.update(get_environment("xgboost_inference"))
+sys.path.insert(0, HANDLERS["xgboost_inference"])
+import lambda_function  # noqa: E402
+from scoring_server import MicroBatcher, ScoringServer, score_batch  # noqa: E402
+
+
+class StubFeatureStore(object):
+    def __init__(self, latency_ms: float, row_latency_ms: float) -> None:
+        self.latency = latency_ms / 1000
+        self.row_latency = row_latency_ms / 1000
+        self.calls = 0
+
+    def batch_get_record(self, Identifiers):
+        self.calls += 1
+        ids = Identifiers[0]["RecordIdentifiersValueAsString"]
+        time.sleep(self.latency + self.row_latency * len(ids))
+        return {
+            "Records": [
+                {
+                    "FeatureGroupName": i["FeatureGroupName"],
+                    "RecordIdentifierValueAsString": r,
+                    "Record": [
+                        {"FeatureName": f, "ValueAsString": "1"} for f in i["FeatureNames"]
+                    ],
+                }
+                for i in Identifiers
+                for r in i["RecordIdentifiersValueAsString"]
+            ],
+            "Errors": [],
+            "UnprocessedIdentifiers": [],
+        }
+
+
+class StubEndpoint(object):
+    def __init__(self, latency_ms: float, row_latency_ms: float) -> None:
+        self.latency = latency_ms / 1000
+        self.row_latency = row_latency_ms / 1000
+        self.calls = 0
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        self.calls += 1
+        rows = Body.count(b"\n") + 1
+        time.sleep(self.latency + self.row_latency * rows)
+        return {"Body": io.BytesIO("\n".join(["0.5"] * rows).encode("utf-8"))}
+
+
+async def client(port: int, path: str, ids: list, latencies: list) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for policy_id in ids:
+        start = time.perf_counter()
+        writer.write(
+            f"GET {path}?policy_id={policy_id} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+        )
+        await writer.drain()
+        headers = {}
+        status = (await reader.readline()).split()[1]
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        await reader.readexactly(int(headers["content-length"]))
+        assert status == b"200", status
+        latencies.append((time.perf_counter() - start) * 1000)
+    writer.close()
+
+
+async def run(args, max_batch_size: int, max_wait_ms: float) -> dict:
+    batcher = MicroBatcher(score_batch, max_batch_size, max_wait_ms)
+    server = await ScoringServer(batcher, lambda_function.endpoint_name).serve(
+        "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(
+                port,
+                f"/get-{lambda_function.endpoint_name}",
+                [f"{c}-{i}" for i in range(args.requests)],
+                latencies,
+            )
+            for c in range(args.clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    await batcher.stop()
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": percentiles[49],
+        "p99": percentiles[98],
+        "rps": len(latencies) / elapsed,
+        "batch_size": batcher.metrics()["batch_size"]["mean"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--feature-store-ms", type=float, default=8)
+    parser.add_argument("--endpoint-ms", type=float, default=15)
+    parser.add_argument("--row-ms", type=float, default=0.05)
+    parser.add_argument(
+        "--settings",
+        type=str,
+        default="1:0,16:2,100:2,100:5",
+        help="comma separated max_batch_size:max_wait_ms",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    lambda_function.guarded_featurestore.client = StubFeatureStore(
+        args.feature_store_ms, args.row_ms
+    )
+    lambda_function.guarded_sm.client = StubEndpoint(args.endpoint_ms, args.row_ms)
+
+    for setting in args.settings.split(","):
+        max_batch_size, max_wait_ms = setting.split(":")
+        result = asyncio.run(run(args, int(max_batch_size), float(max_wait_ms)))
+        print(
+            f"max_batch_size {max_batch_size:>4} max_wait_ms {max_wait_ms:>4}:"
+            f" p50 {result['p50']:7.1f} ms | p99 {result['p99']:7.1f} ms"
+            f" | {result['rps']:7.0f} req/s | mean batch {result['batch_size']:5.1f}"
+        )
@@ -0,0 +1,141 @@
+"""Lookups in a memory-mapped snapshot of the customers feature group.
+
+- snapshot: a snapshot of `--records` customers, with even identifiers, is
+  written in the format of the ingestion pipeline `build_snapshot.py`, and its
+  size, open time and the p50/p99 latency of a lookup of present (even) and
+  missing (odd) identifiers are reported
+- handler: `lambda_handler` is invoked in process, as in
+  `stage_latency_benchmark`, with and without the snapshot of the customers,
+  against a stub feature store answering `--feature-store-ms` later
+
+Usage:
+    python benchmarks/snapshot_benchmark.py --records 1000000
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from cold_start_benchmark import Context
+from scoring_server_benchmark import StubEndpoint, StubFeatureStore, lambda_function
+
+from feature_snapshot import MAGIC, PREAMBLE, FeatureSnapshot, FeatureSnapshots
+
+
+class CountingFeatureStore(StubFeatureStore):
+    def __init__(self, latency_ms: float, row_latency_ms: float) -> None:
+        super().__init__(latency_ms, row_latency_ms)
+        self.records = 0
+
+    def batch_get_record(self, Identifiers):
+        self.records += sum(
+            len(i["RecordIdentifiersValueAsString"]) for i in Identifiers
+        )
+        return super().batch_get_record(Identifiers)
+
+
+def write_snapshot(path: str, records: int, features: list, index_every: int) -> None:
+    keys = np.array(sorted(str(i).encode() for i in range(0, 2 * records, 2)))
+    rng = np.random.default_rng(0)
+    columns = [keys] + [
+        np.char.encode(rng.integers(0, 1000, records).astype(str)) for _ in features
+    ]
+    rows = np.empty(
+        records, dtype=[(f"f{i}", c.dtype) for i, c in enumerate(columns)]
+    )
+    for i, c in enumerate(columns):
+        rows[f"f{i}"] = c
+    header = json.dumps(
+        {
+            "feature_group_name": "benchmark-customers",
+            "generated_at": time.time(),
+            "count": records,
+            "key_width": keys.dtype.itemsize,
+            "index_every": index_every,
+            "features": [
+                [f, c.dtype.itemsize] for f, c in zip(features, columns[1:])
+            ],
+        }
+    ).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(rows.tobytes())
+        f.write(rows["f0"][::index_every].tobytes())
+
+
+def lookup_latencies(snapshot: FeatureSnapshot, ids: range) -> list:
+    latencies = []
+    for i in ids:
+        r = str(i)
+        start = time.perf_counter()
+        snapshot.get(r)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return statistics.quantiles(latencies, n=100)
+
+
+def invoke(requests: int) -> tuple:
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(
+            {"queryStringParameters": {"policy_id": str(2 * i)}}, Context()
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response["statusCode"] == 200, response
+    percentiles = statistics.quantiles(latencies, n=100)
+    return percentiles[49], percentiles[98]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--index-every", type=int, default=256)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--feature-store-ms", type=float, default=8)
+    args = parser.parse_args()
+
+    customers = next(
+        fg for fg in lambda_function.feature_groups if fg["name"] == "customers"
+    )
+    with tempfile.TemporaryDirectory() as local_dir:
+        path = os.path.join(local_dir, "customers.snapshot")
+        write_snapshot(
+            path, args.records, customers["features_names"], args.index_every
+        )
+        start = time.perf_counter()
+        snapshot = FeatureSnapshot(path)
+        open_ms = (time.perf_counter() - start) * 1000
+        step = 2 * max(1, args.records // args.lookups)
+        present = lookup_latencies(snapshot, range(0, 2 * args.records, step))
+        missing = lookup_latencies(snapshot, range(1, 2 * args.records, step))
+        print(
+            f"snapshot: {os.path.getsize(path) / 2 ** 20:.1f} MiB"
+            f" | {snapshot.row_width} bytes per record | open {open_ms:.1f} ms"
+            f" | present p50 {present[49]:.2f} us p99 {present[98]:.2f} us"
+            f" | missing p50 {missing[49]:.2f} us p99 {missing[98]:.2f} us"
+        )
+
+        logging.disable(logging.CRITICAL)
+        lambda_function.stage_metrics.sink = lambda record: None
+        # Each request reads a new policy, the caches do not hit
+        featurestore = CountingFeatureStore(args.feature_store_ms, 0)
+        lambda_function.guarded_featurestore.client = featurestore
+        lambda_function.guarded_sm.client = StubEndpoint(0, 0)
+        snapshots = FeatureSnapshots(None, {"customers": ""})
+        snapshots.snapshots["customers"] = snapshot
+        reader = lambda_function.feature_groups_reader
+        for name, with_snapshots in [("online", None), ("snapshot", snapshots)]:
+            reader.snapshots = with_snapshots
+            featurestore.records = 0
+            p50, p99 = invoke(args.requests)
+            print(
+                f"{name:>9}: p50 {p50:7.3f} ms | p99 {p99:7.3f} ms"
+                f" | {featurestore.records / args.requests:.1f} online records"
+                " per request"
+            )
@@ -0,0 +1,70 @@
+"""Per-stage latency of the real-time handler, from its EMF records.
+
+`lambda_handler` is invoked in process against the stub backends of
+`scoring_server_benchmark`, with the EMF records sent to a local list instead
+of stdout. The p50/p99 of each stage are reported, then the overhead of the
+instrumentation is measured as the handler time with every request sampled
+against no request sampled, with instantaneous backends.
+
+Usage:
+    python benchmarks/stage_latency_benchmark.py --requests 500
+"""
+import argparse
+import logging
+import statistics
+import time
+from collections import defaultdict
+
+from cold_start_benchmark import Context
+from scoring_server_benchmark import StubEndpoint, StubFeatureStore, lambda_function
+
+
+def invoke(requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        response = lambda_function.lambda_handler(
+            {"queryStringParameters": {"policy_id": str(i)}}, Context()
+        )
+        assert response["statusCode"] == 200, response
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--feature-store-ms", type=float, default=8)
+    parser.add_argument("--endpoint-ms", type=float, default=15)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    records = []
+    stage_metrics = lambda_function.stage_metrics
+    stage_metrics.sink = records.append
+
+    lambda_function.guarded_featurestore.client = StubFeatureStore(
+        args.feature_store_ms, 0
+    )
+    lambda_function.guarded_sm.client = StubEndpoint(args.endpoint_ms, 0)
+    stage_metrics.sample_rate = 1.0
+    invoke(args.requests)
+
+    timings = defaultdict(list)
+    for record in records:
+        for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]:
+            timings[metric["Name"]].append(record[metric["Name"]])
+    for name, values in timings.items():
+        if not name.endswith("Latency"):
+            continue
+        percentiles = statistics.quantiles(values, n=100)
+        print(f"{name:>22}: p50 {percentiles[49]:8.3f} ms | p99 {percentiles[98]:8.3f} ms")
+
+    lambda_function.guarded_featurestore.client = StubFeatureStore(0, 0)
+    lambda_function.guarded_sm.client = StubEndpoint(0, 0)
+    overhead = {}
+    for sample_rate in (0.0, 1.0, 0.0, 1.0):
+        stage_metrics.sample_rate = sample_rate
+        overhead[sample_rate] = invoke(args.requests)
+    print(
+        f"handler: {overhead[0.0]:.1f} us unsampled"
+        f" | {overhead[1.0]:.1f} us sampled, EMF record included"
+    )
@@ -0,0 +1,108 @@
+"""Parity check and throughput benchmark of the compiled tree ensemble evaluator.
+
+Trains a booster shaped like the one of the build pipeline (depth 3, 100
+rounds, binary:logistic) on synthetic data, compiles it with `compile_booster`
+from the build pipeline `xgboost_starter_script.py`, then checks that
+TreeEnsemble returns the same scores as `Booster.predict` and compares their
+throughput, for single rows and batches.
+
+Usage:
+    python benchmarks/tree_ensemble_benchmark.py \
+        --starter-script ../build_pipeline/scripts/xgboost_starter_script.py
+"""
+import argparse
+import importlib.util
+import json
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, "lambdas/functions/xgboost_inference")
+from tree_ensemble import TreeEnsemble  # noqa: E402
+
+
+def load_starter_script(path: str):
+    spec = importlib.util.spec_from_file_location("xgboost_starter_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--starter-script",
+        type=str,
+        default="../build_pipeline/scripts/xgboost_starter_script.py",
+    )
+    parser.add_argument(
+        "--configuration", type=str, default="configurations/xgboost.model.json"
+    )
+    parser.add_argument("--num_round", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    starter_script = load_starter_script(args.starter_script)
+    with Path(args.configuration).open("r") as f:
+        features_names = json.load(f)["features_names"]
+
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(
+        rng.normal(size=(5000, len(features_names))), columns=features_names
+    )
+    label = (train.iloc[:, :5].sum(axis=1) + rng.normal(size=5000) > 0).astype(int)
+    params = {
+        "max_depth": args.max_depth,
+        "eta": 0.2,
+        "objective": "binary:logistic",
+    }
+    booster = xgb.train(
+        params, xgb.DMatrix(train, label=label), num_boost_round=args.num_round
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = f"{tmp_dir}/{starter_script.COMPILED_MODEL_FILE_NAME}"
+        np.savez(
+            path,
+            **starter_script.compile_booster(
+                booster, features_names, params["objective"]
+            ),
+        )
+        load_s = timeit.timeit(lambda: TreeEnsemble.load(path), number=args.number)
+        ensemble = TreeEnsemble.load(path)
+
+    data = rng.normal(size=(args.rows, len(features_names))).astype(np.float32)
+    data[rng.random(data.shape) < 0.01] = np.nan
+    expected = booster.predict(xgb.DMatrix(data, feature_names=features_names))
+    actual = ensemble.predict(data)
+    max_error = float(np.max(np.abs(expected - actual)))
+    assert max_error < 1e-5, f"parity check failed, max abs error {max_error}"
+    print(f"parity: {args.rows} rows, max abs error {max_error:.2e}")
+    print(f"load: {load_s / args.number * 1e6:.1f} us")
+
+    row = data[:1]
+    for name, booster_fn, ensemble_fn in [
+        (
+            "1 row",
+            lambda: booster.predict(xgb.DMatrix(row, feature_names=features_names)),
+            lambda: ensemble.predict(row),
+        ),
+        (
+            f"{args.rows} rows",
+            lambda: booster.predict(xgb.DMatrix(data, feature_names=features_names)),
+            lambda: ensemble.predict(data),
+        ),
+    ]:
+        booster_s = timeit.timeit(booster_fn, number=args.number) / args.number
+        ensemble_s = timeit.timeit(ensemble_fn, number=args.number) / args.number
+        print(
+            f"{name:>12}: Booster.predict {booster_s * 1e6:10.1f} us"
+            f" | TreeEnsemble {ensemble_s * 1e6:10.1f} us"
+        )
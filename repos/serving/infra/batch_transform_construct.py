@@ -5,6 +5,7 @@ import aws_cdk as cdk
 from aws_cdk import aws_apigateway as apigateway
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_lambda_event_sources as lambda_event_sources
 from aws_cdk import aws_lambda_python_alpha as lambda_python
 from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_sagemaker as sagemaker
@@ -13,7 +14,17 @@ from aws_cdk import aws_sqs as sqs
 from aws_cdk import aws_ssm as ssm
 from constructs import Construct
 
-from infra.dynamodb_construct import GlueDynamoDb
+from infra.dynamodb_construct import (
+    GENERATION_MARKER_KEY,
+    GlueDynamoDb,
+    get_scores_table_name,
+)
+from infra.model_endpoint_construct import (
+    get_feature_groups_conf,
+    get_features_names_environment,
+    get_features_types,
+    to_environment,
+)
 from infra.sm_pipeline_utils import generate_pipeline_definition
 
 logger = logging.getLogger()
@@ -97,6 +108,8 @@ class BatchTransform(Construct):
         pipeline_conf["queue_url"] = callback_queue.queue_url
         pipeline_conf["model_package_group_name"] = model_package_group_name
         pipeline_conf["features_names"] = features_names
+        score_store = pipeline_props.get("score_store", {"type": "dynamodb"})
+        pipeline_conf["score_store"] = score_store
 
         try:
             logging.info("Attempting to generate pipeline definition")
@@ -124,7 +137,12 @@ class BatchTransform(Construct):
                 f"UploadResults-{pipeline_name}",
                 callback_queue=callback_queue,
                 model_name=pipeline_name,
-                index_name=pipeline_props["index_name"]
+                index_name=pipeline_props["index_name"],
+                score_store={
+                    **score_store,
+                    "uri": f"s3://{project_bucket_name}"
+                    f"/{pipeline_conf['prefix']}/score-files",
+                },
             ).function_read_ddb
             get_data_ddb_integration = apigateway.LambdaIntegration(inference_lambda)
 
@@ -132,6 +150,10 @@ class BatchTransform(Construct):
             get_data_ddb.add_method(
                 http_method="GET", integration=get_data_ddb_integration
             )
+            # Many policy_ids in a JSON body, read with BatchGetItem
+            get_data_ddb.add_method(
+                http_method="POST", integration=get_data_ddb_integration
+            )
             endpoint_parameter = ssm.StringParameter(
                 self,
                 f"{pipeline_name}-URL",
@@ -141,3 +163,147 @@ class BatchTransform(Construct):
 
         except:
             logging.exception("Failed to create a Pipeline definition")
+
+
+class AsyncScoring(Construct):
+    """Queue of asynchronous scoring requests and its consumer Lambda.
+
+    Callers send `{"policy_ids": [...]}` messages to the queue, whose URL is
+    published in SSM. The consumer scores the messages in batches with the
+    real-time endpoint and writes the scores to the table of the batch
+    transform, or posts them to the `callback_url` of the message.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        pipeline_props: dict,
+        endpoint_conf: dict,
+        features_names: list,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+        lambda_role = iam.Role.from_role_arn(
+            self, "LambdaRole", role_arn=lambda_role_arn
+        )
+
+        pipeline_name = f"{project_name}-{pipeline_props['pipeline_name']}"
+        async_conf = pipeline_props["async_scoring"]
+        endpoint_name = f"{project_name}-{endpoint_conf['endpoint_name']}"
+        table_name = get_scores_table_name(pipeline_name)
+        timeout_seconds = async_conf.get("timeout_seconds", 300)
+
+        dead_letter_queue = sqs.Queue(
+            self,
+            f"{pipeline_name}-AsyncScoringDLQ",
+            queue_name=f"{pipeline_name}-AsyncScoring-DLQ",
+            retention_period=cdk.Duration.days(14),
+        )
+        queue = sqs.Queue(
+            self,
+            f"{pipeline_name}-AsyncScoringQueue",
+            queue_name=f"{pipeline_name}-AsyncScoring",
+            # Recommended for Lambda event sources: 6 times the function timeout
+            visibility_timeout=cdk.Duration.seconds(6 * timeout_seconds),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=async_conf.get("max_receive_count", 3),
+                queue=dead_letter_queue,
+            ),
+        )
+
+        try:
+            feature_groups_conf = get_feature_groups_conf(
+                endpoint_conf["feature_groups"], features_names
+            )
+            consumer = lambda_python.PythonFunction(
+                self,
+                f"{pipeline_name}AsyncScoring",
+                function_name=f"{pipeline_name}-AsyncScoring",
+                description=f"Score the requests of the {pipeline_name} async queue",
+                entry=endpoint_conf["lambda_entry_point"],
+                index="async_scoring.py",
+                handler="lambda_handler",
+                runtime=lambda_.Runtime.PYTHON_3_8,
+                timeout=cdk.Duration.seconds(timeout_seconds),
+                environment={
+                    "region": os.getenv("AWS_REGION"),
+                    "endpoint_name": endpoint_name,
+                    "content_type": endpoint_conf["lambda_environment"]["content_type"],
+                    **get_features_names_environment(
+                        feature_groups_conf, features_names
+                    ),
+                    "features_types": get_features_types(
+                        feature_groups_conf, features_names
+                    ),
+                    "feature_groups": to_environment(
+                        [
+                            {k: o for k, o in fg.items() if k != "features_types"}
+                            for fg in feature_groups_conf
+                        ]
+                    ),
+                    "table_name": table_name,
+                    "index_name": pipeline_props["index_name"],
+                    "generation_marker_key": GENERATION_MARKER_KEY,
+                    "message_ttl_seconds": str(
+                        async_conf.get("message_ttl_seconds", 900)
+                    ),
+                    "max_ids_per_message": str(
+                        async_conf.get("max_ids_per_message", 500)
+                    ),
+                    "generation_bump_seconds": str(
+                        async_conf.get("generation_bump_seconds", 60)
+                    ),
+                },
+                role=lambda_role,
+            )
+            consumer.add_event_source(
+                lambda_event_sources.SqsEventSource(
+                    queue,
+                    batch_size=async_conf.get("batch_size", 10),
+                    max_batching_window=cdk.Duration.seconds(
+                        async_conf.get("max_batching_window_seconds", 5)
+                    ),
+                    report_batch_item_failures=True,
+                )
+            )
+            consumer.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "sagemaker:InvokeEndpoint",
+                    ],
+                    resources=[
+                        f"arn:aws:sagemaker:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:endpoint/{endpoint_name.lower()}",
+                    ],
+                )
+            )
+            consumer.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "sagemaker:GetRecord",
+                        "sagemaker:BatchGetRecord",
+                    ],
+                    resources=[
+                        f"*",
+                    ],
+                )
+            )
+            consumer.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "dynamodb:BatchWriteItem",
+                        "dynamodb:UpdateItem",
+                    ],
+                    resources=[
+                        f"arn:aws:dynamodb:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:table/{table_name}",
+                    ],
+                )
+            )
+            ssm.StringParameter(
+                self,
+                f"{pipeline_name}-AsyncScoringQueueURL",
+                string_value=queue.queue_url,
+                parameter_name=f"/sagemaker-{project_name}/{pipeline_name}-async-scoring",
+            )
+        except:
+            logging.exception("Failed to create the async scoring consumer")
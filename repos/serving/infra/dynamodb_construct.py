@@ -27,6 +27,15 @@ api_gateway_role_arn = os.getenv("API_GATEWAY_ROLE_ARN")
 lambda_role_arn = os.getenv("LAMBDA_ROLE_ARN")
 
 
+# Sentinel item of the score tables, its generation is incremented by each load
+GENERATION_MARKER_KEY = "__load_generation__"
+
+
+def get_scores_table_name(model_name: str) -> str:
+    """Name of the table of the batch transform scores of `model_name`"""
+    return f"sagemaker-{project_id}-{model_name}-DDB-Table"
+
+
 class GlueDynamoDb(Construct):
     def __init__(
         self,
@@ -35,9 +44,11 @@ class GlueDynamoDb(Construct):
         callback_queue: sqs.Queue,
         model_name: str,
         index_name: str,
+        score_store: dict = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        score_store = score_store or {"type": "dynamodb"}
 
         glue_role = iam.Role.from_role_arn(self, "GlueRole", role_arn=glue_role_arn)
         lambda_role = iam.Role.from_role_arn(
@@ -61,7 +72,7 @@ class GlueDynamoDb(Construct):
         table_ddb = dynamodb.Table(
             self,
             "DDBTable",
-            table_name=f"sagemaker-{project_id}-{model_name}-DDB-Table",
+            table_name=get_scores_table_name(model_name),
             partition_key=dynamodb.Attribute(
                 name="policy_id", type=dynamodb.AttributeType.STRING
             ),
@@ -93,7 +104,23 @@ class GlueDynamoDb(Construct):
             handler="lambda_handler",
             runtime=lambda_.Runtime.PYTHON_3_8,
             timeout=cdk.Duration.seconds(15),
-            environment={"target_ddb_table": table_ddb.table_name},
+            environment={
+                "target_ddb_table": table_ddb.table_name,
+                "index_name": "policy_id",
+                "consistent_read": "false",
+                "generation_marker_key": GENERATION_MARKER_KEY,
+                "generation_check_seconds": "5",
+                "cache_max_entries": "100000",
+                "cache_control_max_age": "60",
+                # `s3_file`: scores read from the score file of the pipeline,
+                # the pre-created role must allow s3:GetObject on its prefix
+                "score_store": score_store["type"],
+                "score_file_uri": score_store.get("uri", ""),
+                "score_file_refresh_seconds": str(
+                    score_store.get("refresh_seconds", 60)
+                ),
+                "score_file_max_blocks": str(score_store.get("max_blocks", 1024)),
+            },
             role=lambda_role_immutable,
         )
 
@@ -109,6 +136,9 @@ class GlueDynamoDb(Construct):
                 glue_version=glue.GlueVersion.V3_0,
                 python_version=glue.PythonVersion.THREE,
                 script=glue.Code.from_asset(path="./scripts/glue/load-ddb-table.py"),
+                extra_python_files=[
+                    glue.Code.from_asset(path="./scripts/glue/ddb_writer.py")
+                ],
             ),
             role=glue_role_immutable,
             description="Glue Job to upload the result of Batch Transform to DynamoDB for low-latency serving",
@@ -118,7 +148,12 @@ class GlueDynamoDb(Construct):
                 "--additional-python-modules": "pyarrow==2,awswrangler==2.9.0",
                 "--TARGET_DDB_TABLE": table_ddb.table_name,
                 "--SOURCE_S3_BUCKET": project_bucket_name,
-                "--TABLE_HEADER_NAME": f"{index_name}, score",
+                "--TABLE_HEADER_NAME": f"{index_name},score",
+                "--GENERATION_MARKER_KEY": GENERATION_MARKER_KEY,
+                # Write rate control, the rate starts at the lower of the
+                # initial rate and the target utilization of the table
+                "--TARGET_UTILIZATION": "0.8",
+                "--INITIAL_WRITE_RATE": "100",
             },
             worker_count=2,
             worker_type=glue.WorkerType.STANDARD,
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 
@@ -13,6 +14,8 @@ from aws_cdk import aws_sagemaker as sagemaker
 from aws_cdk import aws_ssm as ssm
 from constructs import Construct
 
+from infra.dynamodb_construct import get_scores_table_name
+
 logger = logging.getLogger()
 
 project_bucket_name = os.getenv("PROJECT_BUCKET")
@@ -23,6 +26,14 @@ region = os.getenv("AWS_REGION")
 sm_client = boto3.client("sagemaker", region_name=region)
 lambda_role_arn = os.getenv("LAMBDA_ROLE_ARN")
 
+# Type codes of the `features_types` Lambda environment variable
+FEATURE_TYPE_CODES = {"Integral": "I", "Fractional": "F", "String": "S"}
+
+# Published by the feature ingestion pipeline after each run, under
+# <prefix>/<feature group name>/
+BLOOM_FILTERS_PREFIX = "bloom-filters"
+SNAPSHOTS_PREFIX = "snapshots"
+
 
 
 def get_model_package_arn(model_package_group_name: str):
@@ -34,6 +45,64 @@ def get_model_package_arn(model_package_group_name: str):
     )["ModelPackageSummaryList"][0]["ModelPackageArn"]
 
 
+def get_feature_groups_conf(feature_groups: list, features_names: list) -> list:
+    """Map each feature group to the model features it holds
+
+    Args:
+        feature_groups (list): feature groups names, without project prefix
+        features_names (list): ordered features used by the model
+
+    Returns:
+        list: feature groups configurations, in the given order
+    """
+    feature_groups_conf = []
+    for fg in feature_groups:
+        feature_group_name = f"{project_name}-{fg}"
+        fg_description = sm_client.describe_feature_group(
+            FeatureGroupName=feature_group_name
+        )
+        fg_features = {
+            d["FeatureName"]: FEATURE_TYPE_CODES[d["FeatureType"]]
+            for d in fg_description["FeatureDefinitions"]
+        }
+        model_features = [f for f in features_names if f in fg_features]
+        feature_groups_conf.append(
+            {
+                "name": fg,
+                "feature_group_name": feature_group_name,
+                "features_names": model_features,
+                "features_types": "".join(fg_features[f] for f in model_features),
+                "event_time_feature_name": fg_description["EventTimeFeatureName"],
+            }
+        )
+    return feature_groups_conf
+
+
+def get_features_names_environment(
+    feature_groups_conf: list, features_names: list
+) -> dict:
+    """`features_names` variable, left out when the feature groups hold the
+    model features in model order"""
+    if [f for fg in feature_groups_conf for f in fg["features_names"]] == list(
+        features_names
+    ):
+        return {}
+    return {"features_names": ",".join(features_names)}
+
+
+def to_environment(conf) -> str:
+    """Compact JSON of a Lambda environment variable, limited to 4 KB in total"""
+    return json.dumps(conf, separators=(",", ":"))
+
+
+def get_features_types(feature_groups_conf: list, features_names: list) -> str:
+    """Type codes of the model features, in model order"""
+    features_types = {}
+    for fg in feature_groups_conf:
+        features_types.update(zip(fg["features_names"], fg["features_types"]))
+    return "".join(features_types[f] for f in features_names)
+
+
 class ModelEndpointConstruct(Construct):
     def __init__(
         self,
@@ -41,6 +110,7 @@ class ModelEndpointConstruct(Construct):
         construct_id: str,
         model_package_group_name: str,
         endpoint_conf: dict,
+        features_names: list,
         api_gw: apigateway.RestApi,
         **kwargs,
     ) -> None:
@@ -56,6 +126,29 @@ class ModelEndpointConstruct(Construct):
                 if "_fg_name" in k:
                     lambda_environment[k] = f"{project_name}-{o}"
 
+        local_scoring_conf = endpoint_conf.get("local_scoring", {})
+        bloom_filters_conf = {
+            **endpoint_conf.get("bloom_filters", {}),
+            "s3_uri": f"s3://{project_bucket_name}/{BLOOM_FILTERS_PREFIX}",
+        }
+        snapshots_conf = {
+            **endpoint_conf.get("feature_snapshots", {}),
+            "s3_uri": f"s3://{project_bucket_name}/{SNAPSHOTS_PREFIX}",
+        }
+        # Model vectors joined after each ingestion by the feature pipeline
+        serving_vector_conf = {}
+        if "serving_vector" in endpoint_conf:
+            serving_vector_conf = {
+                "feature_group_name": f"{project_name}-"
+                f"{endpoint_conf['serving_vector']['feature_group']}"
+            }
+        # Batch scores of a batch transform of the same model, as fallback
+        tiered_serving_conf = dict(endpoint_conf.get("tiered_serving", {}))
+        if "batch_transform" in tiered_serving_conf:
+            tiered_serving_conf["table_name"] = get_scores_table_name(
+                f"{project_name}-{tiered_serving_conf.pop('batch_transform')}"
+            )
+
         prefix = endpoint_conf["prefix"]
 
         schedule_config = endpoint_conf["schedule_config"]
@@ -73,10 +166,21 @@ class ModelEndpointConstruct(Construct):
         comparison_operator = schedule_config["comparison_operator"]
 
         data_capture_uri = f"s3://{project_bucket_name}/{prefix}/datacapture"
+        inference_log_conf = {
+            **endpoint_conf.get("inference_log", {}),
+            "s3_uri": f"s3://{project_bucket_name}/{prefix}/inference-log",
+        }
+        sketches_conf = {
+            **endpoint_conf.get("feature_sketches", {}),
+            "s3_uri": f"s3://{project_bucket_name}/{prefix}/sketches",
+        }
         reporting_uri = f"s3://{project_bucket_name}/{prefix}/monitoring"
 
         try:
             model_package_arn = get_model_package_arn(model_package_group_name)
+            feature_groups_conf = get_feature_groups_conf(
+                endpoint_conf["feature_groups"], features_names
+            )
             variant_config_list = endpoint_conf[
                 "variants"
             ]  # only one variant at the moment
@@ -139,6 +243,20 @@ class ModelEndpointConstruct(Construct):
                 endpoint_name=endpoint_name,
             )
 
+            # Scoring dependencies are only bundled, as a layer, when scoring in process
+            lambda_layers = []
+            if local_scoring_conf.get("enabled"):
+                evaluator = local_scoring_conf.get("evaluator", "compiled")
+                layer_name = "numpy" if evaluator == "compiled" else "xgboost"
+                lambda_layers.append(
+                    lambda_python.PythonLayerVersion(
+                        self,
+                        f"{layer_name}Layer",
+                        entry=f"lambdas/layers/{layer_name}",
+                        compatible_runtimes=[lambda_.Runtime.PYTHON_3_8],
+                    )
+                )
+
             lambda_function = lambda_python.PythonFunction(
                 self,
                 f"FunctionReadOnlineFeatureStore-{endpoint_name}",
@@ -148,9 +266,46 @@ class ModelEndpointConstruct(Construct):
                 handler="lambda_handler",
                 runtime=lambda_.Runtime.PYTHON_3_8,
                 timeout=cdk.Duration.seconds(300),
+                memory_size=local_scoring_conf.get("memory_size", 128),
+                # Snapshots are downloaded to /tmp
+                ephemeral_storage_size=cdk.Size.mebibytes(
+                    snapshots_conf.get("ephemeral_storage_mb", 512)
+                ),
+                layers=lambda_layers,
                 environment={
+                    **get_features_names_environment(
+                        feature_groups_conf, features_names
+                    ),
                     "region": region,
                     "endpoint_name": endpoint_name,
+                    "features_types": get_features_types(
+                        feature_groups_conf, features_names
+                    ),
+                    "feature_groups": to_environment(
+                        [
+                            {k: o for k, o in fg.items() if k != "features_types"}
+                            for fg in feature_groups_conf
+                        ]
+                    ),
+                    "record_cache": to_environment(
+                        endpoint_conf.get("record_cache", {})
+                    ),
+                    "score_cache": to_environment(endpoint_conf.get("score_cache", {})),
+                    "metrics": to_environment(endpoint_conf.get("metrics", {})),
+                    "resilience": to_environment(endpoint_conf.get("resilience", {})),
+                    "tiered_serving": to_environment(tiered_serving_conf),
+                    "bloom_filters": to_environment(bloom_filters_conf),
+                    "feature_snapshots": to_environment(snapshots_conf),
+                    "payload_scoring": to_environment(
+                        endpoint_conf.get("payload_scoring", {})
+                    ),
+                    "inference_log": to_environment(inference_log_conf),
+                    "feature_sketches": to_environment(sketches_conf),
+                    "serving_vector": to_environment(serving_vector_conf),
+                    # A new model package updates the function, resetting its caches
+                    "model_package_arn": model_package_arn,
+                    "model_package_group_name": model_package_group_name,
+                    "local_scoring": to_environment(local_scoring_conf),
                     **lambda_environment,
                 },
                 role=lambda_role,
@@ -171,6 +326,7 @@ class ModelEndpointConstruct(Construct):
                 iam.PolicyStatement(
                     actions=[
                         "sagemaker:GetRecord",
+                        "sagemaker:BatchGetRecord",
                     ],
                     resources=[
                         f"*",
@@ -178,10 +334,96 @@ class ModelEndpointConstruct(Construct):
                 )
             )
 
+            if "table_name" in tiered_serving_conf:
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "dynamodb:GetItem",
+                            "dynamodb:BatchGetItem",
+                        ],
+                        resources=[
+                            f"arn:aws:dynamodb:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:table/{tiered_serving_conf['table_name']}",
+                        ],
+                    )
+                )
+
+            if bloom_filters_conf.get("enabled"):
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "s3:GetObject",
+                        ],
+                        resources=[
+                            f"arn:aws:s3:::{project_bucket_name}/{BLOOM_FILTERS_PREFIX}/*",
+                        ],
+                    )
+                )
+
+            if snapshots_conf.get("enabled") and snapshots_conf.get("feature_groups"):
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "s3:GetObject",
+                        ],
+                        resources=[
+                            f"arn:aws:s3:::{project_bucket_name}/{SNAPSHOTS_PREFIX}/*",
+                        ],
+                    )
+                )
+
+            if inference_log_conf.get("enabled"):
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "s3:PutObject",
+                        ],
+                        resources=[
+                            f"arn:aws:s3:::{project_bucket_name}/{prefix}/inference-log/*",
+                        ],
+                    )
+                )
+
+            if sketches_conf.get("enabled"):
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "s3:PutObject",
+                        ],
+                        resources=[
+                            f"arn:aws:s3:::{project_bucket_name}/{prefix}/sketches/*",
+                        ],
+                    )
+                )
+
+            if local_scoring_conf.get("enabled"):
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "sagemaker:ListModelPackages",
+                            "sagemaker:DescribeModelPackage",
+                        ],
+                        resources=[
+                            f"arn:aws:sagemaker:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:model-package-group/{model_package_group_name.lower()}",
+                            f"arn:aws:sagemaker:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:model-package/{model_package_group_name.lower()}/*",
+                        ],
+                    )
+                )
+                lambda_function.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=[
+                            "s3:GetObject",
+                        ],
+                        resources=[
+                            f"arn:aws:s3:::{project_bucket_name}/*",
+                        ],
+                    )
+                )
+
             api_integration = apigateway.LambdaIntegration(lambda_function)
 
             get_endpoint = api_gw.root.add_resource(f"get-{endpoint_name}")
             get_endpoint.add_method(http_method="GET", integration=api_integration)
+            get_endpoint.add_method(http_method="POST", integration=api_integration)
             endpoint_parameter = ssm.StringParameter(
                 self,
                 f"{endpoint_name}-URL",
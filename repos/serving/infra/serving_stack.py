@@ -9,7 +9,7 @@ from aws_cdk import aws_iam as iam
 from aws_cdk import aws_s3 as s3
 from constructs import Construct
 
-from infra.batch_transform_construct import BatchTransform
+from infra.batch_transform_construct import AsyncScoring, BatchTransform
 from infra.model_endpoint_construct import ModelEndpointConstruct
 from infra.redeploy_construct import Redeploy
 
@@ -76,6 +76,7 @@ class ServingStack(cdk.Stack):
                     f"Endpoint-{endpoint_conf['endpoint_name']}",
                     model_package_group_name=model_package_group_name,
                     endpoint_conf=endpoint_conf,
+                    features_names=features_names,
                     api_gw=api_gw,
                 )
 
@@ -90,6 +91,19 @@ class ServingStack(cdk.Stack):
                     features_names = features_names,
                     api_gw=api_gw,
                 )
+                if "async_scoring" in transform_conf:
+                    AsyncScoring(
+                        self,
+                        f"AsyncScoring-{transform_conf['pipeline_name']}",
+                        pipeline_props=transform_conf,
+                        endpoint_conf=next(
+                            e
+                            for e in model_conf["endpoints"]
+                            if e["endpoint_name"]
+                            == transform_conf["async_scoring"]["endpoint_name"]
+                        ),
+                        features_names=features_names,
+                    )
 
 
 def get_model_conf(file_path: Union[str, Path]) -> dict:
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger()
+
+# Key of the sentinel item holding the load generation of the table
+GENERATION_MARKER_KEY = "__load_generation__"
+
+
+class GenerationCache(object):
+    """Cache of the score table items, valid for one load generation.
+
+    The writers of the table, the Glue loader job and the asynchronous
+    scoring consumer, atomically increment the `generation` attribute of a
+    sentinel item once they wrote their scores. Until the next increment,
+    every read of a `policy_id` returns the same item: items, and the absence
+    of items, are cached under `(generation, policy_id)`. The sentinel is read
+    again at most every `check_seconds`, so a new load is served within that
+    interval, and the items of former generations are dropped.
+
+    Nothing is cached until a generation has been read.
+
+    Args:
+        dynamodb: `dynamodb` boto3 client
+        table_name (str): score table
+        index_name (str): partition key of the table
+        marker_key (str): partition key value of the sentinel item
+        check_seconds (float): interval between two reads of the sentinel
+        max_entries (int): maximum number of cached items, least recently
+            used evicted first
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        dynamodb,
+        table_name: str,
+        index_name: str = "policy_id",
+        marker_key: str = GENERATION_MARKER_KEY,
+        check_seconds: float = 5,
+        max_entries: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.index_name = index_name
+        self.marker_key = marker_key
+        self.check_seconds = check_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.generation: Optional[str] = None
+        self._checked_at = None
+        self._entries: "OrderedDict[Tuple[str, str], Optional[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self) -> Optional[str]:
+        """Current generation, read from the sentinel when it is due
+
+        A failed read keeps the former generation until the next check.
+        """
+        now = self.clock()
+        checked_at = self._checked_at
+        if checked_at is not None and now - checked_at < self.check_seconds:
+            return self.generation
+        self._checked_at = now
+        try:
+            item = self.dynamodb.get_item(
+                TableName=self.table_name,
+                Key={self.index_name: {"S": self.marker_key}},
+                ProjectionExpression="#g",
+                ExpressionAttributeNames={"#g": "generation"},
+            ).get("Item")
+        except Exception:
+            logger.warning("Failed to read the load generation", exc_info=True)
+            return self.generation
+        generation = item["generation"]["N"] if item else None
+        if generation != self.generation:
+            logger.info(f"load generation {self.generation} -> {generation}")
+            with self._lock:
+                self._entries.clear()
+            self.generation = generation
+        return self.generation
+
+    def get(self, policy_id: str) -> Tuple[bool, Optional[dict]]:
+        """(True, item) when cached, item None if the policy has no item"""
+        if self.generation is None:
+            return False, None
+        key = (self.generation, policy_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, policy_id: str, item: Optional[dict]) -> None:
+        if self.generation is None:
+            return
+        with self._lock:
+            self._entries[(self.generation, policy_id)] = item
+            self._entries.move_to_end((self.generation, policy_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,63 @@
+import json
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+from typing import Dict, List
+
+from boto3.dynamodb.types import TypeDeserializer
+
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+class ItemEncoder(object):
+    """Encode low-level DynamoDB items to JSON, for a known schema.
+
+    The attributes of the schema are written straight from their
+    AttributeValue: strings (`S`) escaped as by `json.dumps`, numbers (`N`)
+    as their literal, which is valid JSON. There is no `TypeDeserializer`
+    and no Decimal round trip. Other attributes, or values of another type
+    than in the schema, are deserialized and encoded as before.
+
+    Args:
+        schema (Dict[str, str]): attribute name -> AttributeValue type, `S`
+            or `N`
+    """
+
+    def __init__(self, schema: Dict[str, str]) -> None:
+        self.schema = schema
+        # Encoded once, with the separator
+        self._keys = {name: encode_basestring_ascii(name) + ":" for name in schema}
+        self._deserializer = TypeDeserializer()
+
+    def _encode_other(self, name: str, value: dict) -> str:
+        return (
+            encode_basestring_ascii(name)
+            + ":"
+            + json.dumps(
+                self._deserializer.deserialize(value),
+                cls=DecimalEncoder,
+                separators=(",", ":"),
+            )
+        )
+
+    def encode_item(self, item: dict) -> str:
+        """JSON object of an item, as returned by the low-level client"""
+        schema, keys = self.schema, self._keys
+        parts = []
+        for name, value in item.items():
+            type_ = schema.get(name)
+            if type_ == "S" and "S" in value:
+                parts.append(keys[name] + encode_basestring_ascii(value["S"]))
+            elif type_ == "N" and "N" in value:
+                parts.append(keys[name] + value["N"])
+            else:
+                parts.append(self._encode_other(name, value))
+        return "{" + ",".join(parts) + "}"
+
+    def encode_items(self, items: List[dict]) -> str:
+        """JSON array of items"""
+        return "[" + ",".join(self.encode_item(item) for item in items) + "]"
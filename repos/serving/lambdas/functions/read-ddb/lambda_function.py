@@ -1,80 +1,344 @@
+import base64
 import os
 import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+# Measure the init phase, including the import of boto3
+init_start = time.perf_counter()
+
 import boto3
-from boto3.dynamodb.conditions import Key
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from decimal import Decimal
-import logging
+
+from generation_cache import GENERATION_MARKER_KEY, GenerationCache
+from item_encoding import ItemEncoder
+from score_file import ScoreFileReader
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
 
+# BatchGetItem reads at most 100 keys per call
+MAX_KEYS_PER_BATCH_GET = 100
+THROTTLING_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+}
+
 # Retrieve region where Lambda is being executed
 region_name = os.environ["AWS_REGION"]
+table_name = os.environ["target_ddb_table"]
+index_name = os.getenv("index_name", "policy_id")
+# The key is always read, items are matched to the requested identifiers
+projection = list(
+    dict.fromkeys([index_name] + os.getenv("projection", "score,scored_at").split(","))
+)
+consistent_read = os.getenv("consistent_read", "false").lower() == "true"
+max_batch_size = int(os.getenv("max_batch_size", "500"))
+max_batch_attempts = int(os.getenv("max_batch_attempts", "6"))
+backoff_base_ms = float(os.getenv("backoff_base_ms", "25"))
+backoff_max_ms = float(os.getenv("backoff_max_ms", "1000"))
+generation_marker_key = os.getenv("generation_marker_key", GENERATION_MARKER_KEY)
+generation_check_seconds = float(os.getenv("generation_check_seconds", "5"))
+cache_max_entries = int(os.getenv("cache_max_entries", "100000"))
+cache_control_max_age = int(os.getenv("cache_control_max_age", "60"))
+# `dynamodb`, the table loaded by the Glue job, or `s3_file`, the score file
+# published by the batch transform pipeline
+score_store = os.getenv("score_store", "dynamodb")
+score_file_uri = os.getenv("score_file_uri", "")
+score_file_refresh_seconds = float(os.getenv("score_file_refresh_seconds", "60"))
+score_file_max_blocks = int(os.getenv("score_file_max_blocks", "1024"))
+score_file_max_workers = int(os.getenv("score_file_max_workers", "16"))
+prime_connections = os.getenv("prime_connections", "true").lower() == "true"
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+# Attribute names are aliased, some like `name` or `data` are reserved words
+projection_expression = ", ".join(f"#p{i}" for i in range(len(projection)))
+expression_attribute_names = {f"#p{i}": name for i, name in enumerate(projection)}
 
 
-# Create DynamoDB resource
-dynamodb = boto3.resource("dynamodb")
+# Create DynamoDB client, lighter to create than the boto3 resource layer
+dynamodb = boto3.client(
+    "dynamodb",
+    region_name=region_name,
+    config=Config(retries={"mode": "standard", "max_attempts": 3}),
+)
+# Module scope, the cache survives warm invocations
+generation_cache = GenerationCache(
+    dynamodb,
+    table_name,
+    index_name=index_name,
+    marker_key=generation_marker_key,
+    check_seconds=generation_check_seconds,
+    max_entries=cache_max_entries,
+)
+score_file_reader = None
+score_file_executor = None
+if score_store == "s3_file":
+    # The blocks of a batch request are read concurrently
+    score_file_executor = ThreadPoolExecutor(max_workers=score_file_max_workers)
+    score_file_reader = ScoreFileReader(
+        boto3.client("s3", region_name=region_name),
+        score_file_uri,
+        refresh_seconds=score_file_refresh_seconds,
+        max_blocks=score_file_max_blocks,
+    )
+# Attributes written by the Glue job, all strings
+item_encoder = ItemEncoder({index_name: "S", "score": "S", "scored_at": "S"})
 
 
-def lambda_handler(event, context):
+def current_generation() -> Optional[str]:
+    """Load generation of the table, or version of the score file"""
+    if score_file_reader is not None:
+        return score_file_reader.refresh()
+    return generation_cache.check()
 
-    logger.info(f"Lambda event is [{event}]")
 
-    # Retrieve AWS request identifier for this execution
-    request_id = str(context.aws_request_id)
+def prime_dynamodb_connection():
+    """Open the connection to the score store during the init phase, with the
+    first read of the load generation, or of the latest score file"""
+    current_generation()
 
-    # Retrieve target DynamoDB table name from environment variables
-    val_table_name = os.environ["target_ddb_table"]
-    val_policy_id = str(event["queryStringParameters"]["policy_id"])
 
-    logger.info(f"Input parameters are [{val_table_name}] [{val_policy_id}]")
+if prime_connections:
+    prime_dynamodb_connection()
+logger.info(f"init duration: {(time.perf_counter() - init_start) * 1000:.1f} ms")
 
-    request_data = event.get("requestContext")
 
-    logger.info("Request data is is [{request_data}]")
+def get_item(policy_id: str, consistent: bool) -> Tuple[Optional[dict], float]:
+    """Item of one policy, with the projected attributes only
 
-    # Create a paginator
-    paginator = dynamodb.meta.client.get_paginator("query")
+    Returns:
+        Tuple[Optional[dict], float]: the low-level item, None if there is
+            none, and the read capacity units consumed
+    """
+    response = dynamodb.get_item(
+        TableName=table_name,
+        Key={index_name: {"S": policy_id}},
+        ProjectionExpression=projection_expression,
+        ExpressionAttributeNames=expression_attribute_names,
+        ConsistentRead=consistent,
+        ReturnConsumedCapacity="TOTAL",
+    )
+    item = response.get("Item")
+    capacity = response.get("ConsumedCapacity", {}).get("CapacityUnits", 0.0)
+    return item, capacity
 
-    logger.info("Retrieving data ...")
 
-    try:
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(backoff_max_ms, backoff_base_ms * 2 ** attempt)) / 1000
+
+
+def batch_get_items(
+    policy_ids: List[str], consistent: bool, remaining_ms: float
+) -> Tuple[List[dict], List[str], float]:
+    """Items of many policies, by BatchGetItem calls of up to 100 keys
+
+    Keys left unprocessed by a call, when the table throttles, are read again
+    after an exponential backoff with full jitter, for at most
+    `max_batch_attempts` calls and while the backoff fits in `remaining_ms`.
+
+    Returns:
+        Tuple[List[dict], List[str], float]: the low-level items found, the
+            identifiers still unprocessed and the read capacity units consumed
+    """
+    deadline = time.monotonic() + remaining_ms / 1000
+    items, unprocessed, capacity = [], [], 0.0
+    for i in range(0, len(policy_ids), MAX_KEYS_PER_BATCH_GET):
+        request = {
+            table_name: {
+                "Keys": [
+                    {index_name: {"S": p}}
+                    for p in policy_ids[i : i + MAX_KEYS_PER_BATCH_GET]
+                ],
+                "ProjectionExpression": projection_expression,
+                "ExpressionAttributeNames": expression_attribute_names,
+                "ConsistentRead": consistent,
+            }
+        }
+        for attempt in range(max_batch_attempts):
+            response = dynamodb.batch_get_item(
+                RequestItems=request, ReturnConsumedCapacity="TOTAL"
+            )
+            items += response["Responses"].get(table_name, [])
+            capacity += sum(
+                c.get("CapacityUnits", 0.0)
+                for c in response.get("ConsumedCapacity", [])
+            )
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+            delay = backoff_seconds(attempt)
+            last_attempt = attempt + 1 == max_batch_attempts
+            if last_attempt or time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
+        if request:
+            unprocessed += [k[index_name]["S"] for k in request[table_name]["Keys"]]
+    return items, unprocessed, capacity
+
+
+def get_policy_ids(event: dict) -> List[str]:
+    """Identifiers of a request
+
+    Either a POST body `{"policy_ids": [...]}` or one or many `policy_id`
+    query string parameters.
+    """
+    body = event.get("body")
+    if body:
+        if event.get("isBase64Encoded"):
+            body = base64.b64decode(body)
+        return [str(p) for p in json.loads(body)["policy_ids"]]
+
+    multi_params = event.get("multiValueQueryStringParameters") or {}
+    if multi_params.get("policy_id"):
+        return [str(p) for p in multi_params["policy_id"]]
+    return [str(event["queryStringParameters"]["policy_id"])]
+
+
+def http_response(status_code: int, body, headers: dict = None) -> dict:
+    if not isinstance(body, str):
+        body = json.dumps(body, separators=(",", ":"))
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json", **(headers or {})},
+        "body": body,
+    }
 
-        # Scenario : retrieve all columns from the source table
-        response_iterator = paginator.paginate(
-            TableName=val_table_name,
-            KeyConditionExpression=Key("policy_id").eq(val_policy_id),
-            Select="ALL_ATTRIBUTES",
-            PaginationConfig={"MaxItems": 10, "PageSize": 10},
+
+def get_header(event: dict, name: str) -> Optional[str]:
+    for k, v in (event.get("headers") or {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+def read_score_file_items(policy_ids: List[str]) -> Tuple[List[dict], List[str]]:
+    """Items of the policies in the current score file, shaped as the
+    low-level items of the table
+
+    Returns:
+        Tuple[List[dict], List[str]]: the items found and, when there is no
+            score file yet, all the identifiers as unprocessed
+    """
+    score_file = score_file_reader.score_file
+    if score_file is None:
+        return [], policy_ids
+    scores = score_file.get_many(policy_ids, executor=score_file_executor)
+    scored_at = {"S": str(score_file.scored_at)}
+    return [
+        {index_name: {"S": p}, "score": {"S": scores[p]}, "scored_at": scored_at}
+        for p in policy_ids
+        if p in scores
+    ], []
+
+
+def read_items(
+    policy_ids: List[str], consistent: bool, remaining_ms: float
+) -> Tuple[List[dict], List[str]]:
+    """Items of the policies, from the cache of the current generation or
+    from the table, with GetItem for one policy and BatchGetItem for more
+
+    Strongly consistent reads bypass the cache. With the `s3_file` score
+    store, the items are read from the score file instead, which is always
+    consistent with its version.
+
+    Returns:
+        Tuple[List[dict], List[str]]: the low-level items found and the
+            identifiers still unprocessed
+    """
+    if score_file_reader is not None:
+        return read_score_file_items(policy_ids)
+    items, uncached = [], []
+    for p in policy_ids:
+        hit, item = (False, None) if consistent else generation_cache.get(p)
+        if not hit:
+            uncached.append(p)
+        elif item is not None:
+            items.append(item)
+    if not uncached:
+        return items, []
+
+    if len(uncached) == 1:
+        item, capacity = get_item(uncached[0], consistent)
+        read, unprocessed = ([item] if item else []), []
+    else:
+        read, unprocessed, capacity = batch_get_items(
+            uncached, consistent, remaining_ms
         )
+    logger.info(
+        f"read {len(read)} items of {len(uncached)} uncached policy_ids,"
+        f" {len(unprocessed)} unprocessed, consumed read capacity: {capacity}"
+    )
+    by_id = {item[index_name]["S"]: item for item in read}
+    for p in uncached:
+        if p not in unprocessed:
+            generation_cache.put(p, by_id.get(p))
+    return items + read, unprocessed
 
-        for page in response_iterator:
-            if page["Count"] > 0:
-                converted_items = json.dumps(
-                    page["Items"], cls=DecimalEncoder, indent=2
-                )
 
-        logger.info("no. of items ->[{}]".format(len(converted_items)))
+def lambda_handler(event, context):
+    params = event.get("queryStringParameters") or {}
+    try:
+        # Deduplicated, BatchGetItem rejects duplicated keys
+        policy_ids = list(dict.fromkeys(get_policy_ids(event)))
+    except (ValueError, KeyError, TypeError):
+        return http_response(
+            400, {"Error": "Expected a policy_id or a JSON body with policy_ids"}
+        )
+    if len(policy_ids) > max_batch_size:
+        return http_response(400, {"Error": f"At most {max_batch_size} policy_ids"})
+    if generation_cache.marker_key in policy_ids:
+        return http_response(400, {"Error": "Invalid policy_id"})
+    consistent = params.get("consistent", str(consistent_read)).lower() == "true"
+    single = len(policy_ids) == 1 and not event.get("body")
 
-        # Dummy response
-        responsebody = converted_items
+    # Responses to GET requests stay the same for a generation
+    cache_headers = {}
+    generation = current_generation()
+    if generation is not None and not consistent and not event.get("body"):
+        cache_headers = {
+            "ETag": f'"{generation}"',
+            "Cache-Control": f"max-age={cache_control_max_age}",
+        }
+        if get_header(event, "if-none-match") == cache_headers["ETag"]:
+            return {"statusCode": 304, "headers": cache_headers, "body": ""}
 
-        # Generate response
-        responseObject = {}
-        responseObject["statusCode"] = 200
-        responseObject["headers"] = {}
-        responseObject["headers"]["Content-Type"] = "application/json"
-        responseObject["body"] = responsebody
+    try:
+        items, unprocessed = read_items(
+            policy_ids, consistent, context.get_remaining_time_in_millis() - 1000
+        )
+        if score_file_reader is not None:
+            logger.info(f"score file: {score_file_reader.stats()}")
+        else:
+            logger.info(f"generation cache: {generation_cache.stats()}")
+        if single:
+            if unprocessed:
+                return http_response(503, {"Error": "No scores yet, retry later"})
+            if not items:
+                return http_response(
+                    404, {"policy_id": policy_ids[0], "Error": "No score found"}
+                )
+            # A list of items, as returned by the former query
+            return http_response(200, item_encoder.encode_items(items), cache_headers)
 
-        return responseObject
+        read = {item[index_name]["S"] for item in items}.union(unprocessed)
+        missing = [p for p in policy_ids if p not in read]
+        # Partial responses are not cached by clients
+        if unprocessed:
+            cache_headers = {}
+        return http_response(
+            200,
+            f'{{"items":{item_encoder.encode_items(items)}'
+            f',"missing":{json.dumps(missing, separators=(",", ":"))}'
+            f',"unprocessed":{json.dumps(unprocessed, separators=(",", ":"))}}}',
+            cache_headers,
+        )
     except ClientError as e:
         if e.response["Error"]["Code"] == "AccessDeniedException":
             logger.error("Error - AccessDeniedException", exc_info=True)
@@ -83,5 +347,8 @@ def lambda_handler(event, context):
                 "statusCode": 401,
                 "body": json.dumps("Insufficient rights to perform this operation"),
             }
+        elif e.response["Error"]["Code"] in THROTTLING_ERROR_CODES:
+            logger.warning("Throttled by DynamoDB", exc_info=True)
+            return http_response(503, {"Error": "Throttled, retry later"})
         else:
             raise
@@ -0,0 +1,236 @@
+import bisect
+import json
+import logging
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# Offset and length of the index, then magic, at the end of the file.
+# Written by scripts/build_score_file.py of the batch transform pipeline.
+MAGIC = b"SCF1"
+FOOTER = struct.Struct("<QI4s")
+SCORE_FILE_VERSION = 1
+# Name of the pointer to the latest score file, under the score files prefix
+LATEST_NAME = "latest.json"
+
+
+class ScoreFile(object):
+    """Immutable key-sorted score file in S3, read with byte-range GETs.
+
+    The file holds blocks of `policy_id,score` lines, sorted by `policy_id`
+    and cut at line boundaries every few KB, then a JSON index with the first
+    `policy_id`, offset and length of each block, then a fixed footer. The
+    tail of the file, footer and usually the whole index, is read once with
+    one suffix range GET. A lookup bisects the index in memory and reads its
+    block with one range GET, blocks are kept in an LRU cache.
+
+    Args:
+        s3_client: `s3` boto3 client
+        bucket (str): bucket of the file
+        key (str): key of the file
+        max_blocks (int): maximum number of cached blocks
+        tail_bytes (int): size of the first read of the end of the file
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        key: str,
+        max_blocks: int = 1024,
+        tail_bytes: int = 64 * 1024,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.max_blocks = max_blocks
+        self._blocks: "OrderedDict[int, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_read = 0
+        self.block_hits = 0
+        self.block_misses = 0
+
+        tail = self._read(f"bytes=-{tail_bytes}")
+        index_offset, index_length, magic = FOOTER.unpack_from(
+            tail, len(tail) - FOOTER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"s3://{bucket}/{key} is not a score file")
+        # Offset of the tail in the file
+        tail_offset = index_offset + index_length + FOOTER.size - len(tail)
+        if index_offset >= tail_offset:
+            start = index_offset - tail_offset
+            index = tail[start : start + index_length]
+        else:
+            index = self._read(
+                f"bytes={index_offset}-{index_offset + index_length - 1}"
+            )
+        header = json.loads(index)
+        if header["version"] != SCORE_FILE_VERSION:
+            raise ValueError(f"Unsupported score file version {header['version']}")
+        self.generated_at = header["generated_at"]
+        self.scored_at = header["scored_at"]
+        self.count = header["count"]
+        self._first_keys = [b[0] for b in header["blocks"]]
+        self._extents = [(b[1], b[2]) for b in header["blocks"]]
+
+    def _read(self, byte_range: str) -> bytes:
+        body = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=byte_range
+        )["Body"].read()
+        self.requests += 1
+        self.bytes_read += len(body)
+        return body
+
+    def _block_of(self, policy_id: str) -> int:
+        return bisect.bisect_right(self._first_keys, policy_id) - 1
+
+    def _load_block(self, block: int) -> Dict[str, str]:
+        offset, length = self._extents[block]
+        lines = self._read(f"bytes={offset}-{offset + length - 1}").decode("utf-8")
+        scores = dict(line.split(",", 1) for line in lines.splitlines())
+        with self._lock:
+            self._blocks[block] = scores
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return scores
+
+    def _cached_block(self, block: int) -> Optional[Dict[str, str]]:
+        with self._lock:
+            scores = self._blocks.get(block)
+            if scores is not None:
+                self._blocks.move_to_end(block)
+                self.block_hits += 1
+            else:
+                self.block_misses += 1
+            return scores
+
+    def get(self, policy_id: str) -> Optional[str]:
+        """Score of a policy, None if it is not in the file"""
+        block = self._block_of(policy_id)
+        if block < 0:
+            return None
+        scores = self._cached_block(block)
+        if scores is None:
+            scores = self._load_block(block)
+        return scores.get(policy_id)
+
+    def get_many(
+        self, policy_ids: List[str], executor: ThreadPoolExecutor = None
+    ) -> Dict[str, str]:
+        """Scores of the policies in the file, by policy_id
+
+        Each block is read once, the missing blocks concurrently on
+        `executor` when given.
+        """
+        blocks = {}
+        for p in policy_ids:
+            block = self._block_of(p)
+            if block >= 0:
+                blocks.setdefault(block, []).append(p)
+        loaded = {b: self._cached_block(b) for b in blocks}
+        missing = [b for b, scores in loaded.items() if scores is None]
+        if executor is not None and len(missing) > 1:
+            loaded.update(zip(missing, executor.map(self._load_block, missing)))
+        else:
+            loaded.update((b, self._load_block(b)) for b in missing)
+        return {
+            p: loaded[b][p]
+            for b, ids in blocks.items()
+            for p in ids
+            if p in loaded[b]
+        }
+
+    def stats(self) -> dict:
+        return {
+            "key": self.key,
+            "blocks": len(self._blocks),
+            "block_hits": self.block_hits,
+            "block_misses": self.block_misses,
+            "requests": self.requests,
+            "bytes_read": self.bytes_read,
+        }
+
+
+class ScoreFileReader(object):
+    """Latest score file published under an S3 prefix.
+
+    The batch transform pipeline writes each score file under its own
+    version prefix, then points `latest.json` to it. The pointer is read
+    again at most every `refresh_seconds`, conditionally on its ETag, and a
+    new version replaces the file and its cached blocks.
+
+    Args:
+        s3_client: `s3` boto3 client
+        s3_uri (str): S3 prefix of the score files
+        refresh_seconds (float): interval between two reads of the pointer
+        max_blocks (int): maximum number of cached blocks
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        s3_uri: str,
+        refresh_seconds: float = 60,
+        max_blocks: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.s3_client = s3_client
+        url = urlparse(s3_uri)
+        self.bucket, self.prefix = url.netloc, url.path.strip("/")
+        self.refresh_seconds = refresh_seconds
+        self.max_blocks = max_blocks
+        self.clock = clock
+        self.score_file: Optional[ScoreFile] = None
+        self.version: Optional[str] = None
+        self._etag = None
+        self._checked_at = None
+
+    def refresh(self) -> Optional[str]:
+        """Version of the current score file, the pointer read when it is due
+
+        A failed read keeps the current file until the next refresh.
+        """
+        now = self.clock()
+        checked_at = self._checked_at
+        if checked_at is not None and now - checked_at < self.refresh_seconds:
+            return self.version
+        self._checked_at = now
+        kwargs = {"IfNoneMatch": self._etag} if self._etag else {}
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=f"{self.prefix}/{LATEST_NAME}", **kwargs
+            )
+            latest = json.loads(response["Body"].read())
+            if latest["version"] != self.version:
+                self.score_file = ScoreFile(
+                    self.s3_client,
+                    self.bucket,
+                    latest["key"],
+                    max_blocks=self.max_blocks,
+                )
+                logger.info(f"score file {self.version} -> {latest['version']}")
+                self.version = latest["version"]
+            self._etag = response.get("ETag")
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("304", "NotModified"):
+                logger.warning("Failed to read the latest score file", exc_info=True)
+        except Exception:
+            logger.warning("Failed to read the latest score file", exc_info=True)
+        return self.version
+
+    def stats(self) -> dict:
+        stats = {"version": self.version}
+        if self.score_file is not None:
+            stats.update(self.score_file.stats())
+        return stats
@@ -0,0 +1,252 @@
+"""Consumer of the asynchronous scoring queue.
+
+Callers send messages `{"policy_ids": [...], "callback_url": ...,
+"ttl_seconds": ...}` to the queue, the consumer receives them in batches of
+up to 10 and scores all their identifiers together, with the batched feature
+reads and endpoint invocations of `BatchScorer`. The scores are written to
+the scores table of the batch transform, as the Glue job does, or posted as
+JSON to the `callback_url` of the message.
+
+Writes to the table increment its load generation, as the Glue job does, so
+that the score API drops its cached items, at most once every
+`generation_bump_seconds`: under steady traffic, a bump per batch would empty
+the caches of the score API every few seconds. Scores written less than
+`generation_bump_seconds` after the last bump are only served once the next
+one, by a later batch of the consumer or by the Glue job, invalidates the
+cached items: until then, the score API may serve the former score, or no
+score, of their identifiers. Identifiers without a record, scored 404, are
+not written and are logged with the message. Messages older than their
+`ttl_seconds` are dropped. Messages whose scoring or delivery failed, in a
+way that may succeed later, are reported as batch item failures: SQS makes
+only them visible again.
+"""
+import json
+import logging
+import os
+import time
+import urllib.request
+from typing import Dict, List
+
+import boto3
+from botocore.config import Config
+
+from batch_scoring import BatchScorer
+from feature_store import FeatureGroupsReader
+from feature_vector import FeatureVectorAssembler
+from tiered_scoring import FALLBACK_STATUS_CODES
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# BatchWriteItem writes at most 25 items per call
+MAX_ITEMS_PER_BATCH_WRITE = 25
+
+region = os.environ["region"]
+endpoint_name = os.environ["endpoint_name"]
+content_type = os.environ["content_type"]
+feature_groups = json.loads(os.environ["feature_groups"])
+table_name = os.environ["table_name"]
+index_name = os.getenv("index_name", "policy_id")
+message_ttl_seconds = float(os.getenv("message_ttl_seconds", "900"))
+max_ids_per_message = int(os.getenv("max_ids_per_message", "500"))
+callback_timeout_seconds = float(os.getenv("callback_timeout_seconds", "5"))
+generation_marker_key = os.getenv("generation_marker_key", "__load_generation__")
+generation_bump_seconds = float(os.getenv("generation_bump_seconds", "60"))
+
+boto_session = boto3.Session(region_name=region)
+featurestore_runtime = boto_session.client(
+    service_name="sagemaker-featurestore-runtime",
+    region_name=region,
+    config=Config(retries={"mode": "standard", "max_attempts": 3}),
+)
+client_sm = boto_session.client(
+    "sagemaker-runtime",
+    region_name=region,
+    config=Config(retries={"mode": "standard", "max_attempts": 2}),
+)
+dynamodb = boto_session.client("dynamodb", region_name=region)
+
+if os.getenv("features_names"):
+    col_order = os.environ["features_names"].split(",")
+else:
+    col_order = [f for fg in feature_groups for f in fg["features_names"]]
+
+batch_scorer = BatchScorer(
+    FeatureGroupsReader(featurestore_runtime, feature_groups),
+    FeatureVectorAssembler(col_order),
+    client_sm,
+    endpoint_name,
+    content_type,
+    features_types=os.getenv("features_types", ""),
+)
+
+
+class InvalidMessageError(ValueError):
+    """Raised when a message is not a scoring request, it is not retried"""
+
+
+def parse_message(record: dict) -> dict:
+    """Scoring request of an SQS record
+
+    Raises:
+        InvalidMessageError: if the body has no `policy_ids` list, or too many
+    """
+    try:
+        body = json.loads(record["body"])
+        policy_ids = [str(p) for p in body["policy_ids"]]
+        ttl_seconds = float(body.get("ttl_seconds", message_ttl_seconds))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidMessageError("Expected a JSON body with policy_ids")
+    if len(policy_ids) > max_ids_per_message:
+        raise InvalidMessageError(f"At most {max_ids_per_message} policy_ids")
+    sent_at = int(record["attributes"]["SentTimestamp"]) / 1000
+    return {
+        "policy_ids": policy_ids,
+        "callback_url": body.get("callback_url"),
+        "expires_at": sent_at + ttl_seconds,
+    }
+
+
+def write_scores(results: List[dict], scored_at: float) -> None:
+    """Write the scores to the table, as items of the Glue job
+
+    Raises:
+        RuntimeError: if items remain unprocessed after the retries
+    """
+    items = [
+        {
+            "PutRequest": {
+                "Item": {
+                    index_name: {"S": r["policy_id"]},
+                    "score": {"S": str(r["score"])},
+                    "scored_at": {"S": str(scored_at)},
+                }
+            }
+        }
+        for r in results
+    ]
+    for i in range(0, len(items), MAX_ITEMS_PER_BATCH_WRITE):
+        request = {table_name: items[i : i + MAX_ITEMS_PER_BATCH_WRITE]}
+        for attempt in range(4):
+            request = dynamodb.batch_write_item(RequestItems=request).get(
+                "UnprocessedItems"
+            )
+            if not request:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(
+                f"{len(request[table_name])} scores could not be written"
+            )
+
+
+def bump_generation(min_interval_seconds: float = 0) -> bool:
+    """Increment the load generation of the table, read by the score API to
+    invalidate its cached items, unless it was incremented less than
+    `min_interval_seconds` ago
+
+    Returns:
+        bool: False when the generation was left as it is
+    """
+    now = int(time.time())
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key={index_name: {"S": generation_marker_key}},
+            UpdateExpression="ADD #g :one SET loaded_at = :loaded_at",
+            # Epoch seconds of the same width compare as strings
+            ConditionExpression="attribute_not_exists(loaded_at)"
+            " OR loaded_at <= :bumped_before",
+            ExpressionAttributeNames={"#g": "generation"},
+            ExpressionAttributeValues={
+                ":one": {"N": "1"},
+                ":loaded_at": {"S": str(now)},
+                ":bumped_before": {"S": str(now - int(min_interval_seconds))},
+            },
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def post_callback(url: str, results: List[dict]) -> None:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({"results": results}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=callback_timeout_seconds):
+        pass
+
+
+def deliver(message: dict, results: Dict[str, dict], scored_at: float) -> None:
+    """Deliver the results of a message to its callback or to the table"""
+    message_results = [results[r] for r in message["policy_ids"]]
+    if message["callback_url"]:
+        post_callback(message["callback_url"], message_results)
+    else:
+        write_scores([r for r in message_results if r["statusCode"] == 200], scored_at)
+
+
+def lambda_handler(event, context):
+    now = time.time()
+    messages, failures = {}, []
+    for record in event["Records"]:
+        try:
+            message = parse_message(record)
+        except InvalidMessageError as e:
+            logger.error(f"Dropping message {record['messageId']}: {e}")
+            continue
+        if message["expires_at"] < now:
+            logger.warning(f"Dropping expired message {record['messageId']}")
+            continue
+        messages[record["messageId"]] = message
+
+    policy_ids = list(
+        dict.fromkeys(p for m in messages.values() for p in m["policy_ids"])
+    )
+    results = {r["policy_id"]: r for r in batch_scorer.score(policy_ids)}
+    scored_at = time.time()
+
+    written = []
+    for message_id, message in messages.items():
+        # Transient scoring failures retry the whole message
+        if any(
+            results[r]["statusCode"] in FALLBACK_STATUS_CODES
+            for r in message["policy_ids"]
+        ):
+            failures.append(message_id)
+            continue
+        try:
+            deliver(message, results, scored_at)
+            if not message["callback_url"]:
+                written.append(message_id)
+                # Only the callbacks receive the errors
+                not_written = {
+                    r: results[r]["Error"]
+                    for r in message["policy_ids"]
+                    if results[r]["statusCode"] != 200
+                }
+                if not_written:
+                    logger.warning(
+                        f"Scores of message {message_id} not written: {not_written}"
+                    )
+        except Exception:
+            logger.exception(f"Failed to deliver the scores of message {message_id}")
+            failures.append(message_id)
+
+    if written:
+        try:
+            if not bump_generation(generation_bump_seconds):
+                logger.info("Load generation incremented recently, left as it is")
+        except Exception:
+            # Retried, the score API would serve its cached items otherwise
+            logger.exception("Failed to increment the load generation")
+            failures += written
+
+    logger.info(
+        f"scored {len(policy_ids)} policy_ids of {len(messages)} messages,"
+        f" {len(failures)} failed"
+    )
+    return {"batchItemFailures": [{"itemIdentifier": m} for m in failures]}
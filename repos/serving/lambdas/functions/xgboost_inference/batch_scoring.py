@@ -0,0 +1,251 @@
+import base64
+import json
+import logging
+import re
+from typing import List
+
+from feature_sketches import FeatureSketches
+from feature_store import MAX_RECORDS_PER_FEATURE_GROUP, FeatureGroupsReader
+from feature_vector import FeatureVectorAssembler, MissingFeatureError
+from inference_log import InferenceLog
+from local_model import LocalModel
+from request_encoding import CSV_CONTENT_TYPE, RequestEncoder
+from resilience import CircuitOpenError, DeadlineExceeded
+from score_cache import ScoreCache
+from serving_vectors import ServingVectorReader
+from stage_metrics import NULL_TIMER, StageTimer
+
+logger = logging.getLogger()
+
+# Maximum payload size of a real-time endpoint invocation
+MAX_INVOKE_PAYLOAD_BYTES = 6 * 1024 * 1024
+
+
+def parse_scores(body: bytes) -> List[float]:
+    """Parse the scores of a multi-line CSV invocation, comma or newline separated"""
+    return [float(s) for s in re.split(r"[,\n]", body.decode("utf-8").strip()) if s]
+
+
+def chunk_payload(sizes: List[int], max_bytes: int = MAX_INVOKE_PAYLOAD_BYTES):
+    """Group encoded rows into payloads no bigger than `max_bytes`
+
+    Args:
+        sizes (List[int]): size of each row in a payload, separator included
+
+    Yields:
+        Tuple[int, int]: start and end index of the rows in each payload
+    """
+    start, size = 0, 0
+    for idx, line_size in enumerate(sizes):
+        if line_size > max_bytes:
+            raise ValueError("A single feature vector exceeds the endpoint payload limit")
+        if size + line_size > max_bytes:
+            yield start, idx
+            start, size = idx, 0
+        size += line_size
+    if start < len(sizes):
+        yield start, len(sizes)
+
+
+class BatchScorer(object):
+    """Score many record identifiers with batched feature reads and invocations.
+
+    Identifiers are read by chunks of at most MAX_RECORDS_PER_FEATURE_GROUP
+    with one BatchGetRecord call, and each chunk is scored with one
+    multi-row `invoke_endpoint` call, encoded as `content_type`. With
+    `serving_vectors`, the vectors materialized by the ingestion pipeline are
+    read first and only the identifiers without one are assembled.
+    """
+
+    def __init__(
+        self,
+        feature_groups_reader: FeatureGroupsReader,
+        vector_assembler: FeatureVectorAssembler,
+        client_sm,
+        endpoint_name: str,
+        content_type: str,
+        chunk_size: int = MAX_RECORDS_PER_FEATURE_GROUP,
+        score_cache: ScoreCache = None,
+        local_model: LocalModel = None,
+        features_types: str = "",
+        inference_log: InferenceLog = None,
+        sketches: FeatureSketches = None,
+        serving_vectors: ServingVectorReader = None,
+    ) -> None:
+        self.feature_groups_reader = feature_groups_reader
+        self.vector_assembler = vector_assembler
+        self.client_sm = client_sm
+        self.endpoint_name = endpoint_name
+        self.content_type = content_type
+        self.request_encoder = RequestEncoder(content_type, features_types)
+        self.chunk_size = min(chunk_size, MAX_RECORDS_PER_FEATURE_GROUP)
+        self.score_cache = score_cache
+        self.local_model = local_model
+        self.inference_log = inference_log
+        self.sketches = sketches
+        self.serving_vectors = serving_vectors
+
+    def score(
+        self, record_identifiers: List[str], timer: StageTimer = NULL_TIMER
+    ) -> List[dict]:
+        """Score the record identifiers
+
+        Args:
+            record_identifiers (List[str]): identifiers to score
+            timer (StageTimer): times the feature reads, vector assembly,
+                score cache lookups and scoring of all chunks
+
+        Returns:
+            List[dict]: one result per distinct identifier, in request order,
+                with either a `score` or an `Error` and its `statusCode`
+        """
+        record_identifiers = list(dict.fromkeys(record_identifiers))
+        results = {}
+        for i in range(0, len(record_identifiers), self.chunk_size):
+            chunk = record_identifiers[i : i + self.chunk_size]
+            try:
+                results.update(self._score_chunk(chunk, timer))
+            except CircuitOpenError:
+                for r in chunk:
+                    results.setdefault(r, _error(r, 503, "endpoint unavailable"))
+            except DeadlineExceeded:
+                for r in chunk:
+                    results.setdefault(r, _error(r, 504, "timed out"))
+            except Exception:
+                logger.exception("internal error")
+                for r in chunk:
+                    results.setdefault(r, _error(r, 500, "internal error"))
+
+        return [results[r] for r in record_identifiers]
+
+    def predict(self, lines: List[str], timer: StageTimer = NULL_TIMER) -> List[float]:
+        """Score CSV feature vectors
+
+        The local model is used when loaded, falling back to the endpoint on
+        any error. Endpoint invocations are split to respect the payload limit.
+        The vectors and their scores are queued to the sketches, if any.
+        """
+        scores = self._predict(lines, timer)
+        if self.sketches is not None:
+            self.sketches.observe(lines, scores)
+        return scores
+
+    def _predict(self, lines: List[str], timer: StageTimer) -> List[float]:
+        if self.local_model is not None and self.local_model.ready:
+            try:
+                with timer.stage("LocalModelLatency"):
+                    return self.local_model.predict(lines)
+            except Exception:
+                logger.exception("Local scoring failed, falling back to the endpoint")
+
+        with timer.stage("EncodeLatency"):
+            rows = [self.request_encoder.encode_row(line) for line in lines]
+            sizes = [self.request_encoder.row_size(row) for row in rows]
+        scores = []
+        for start, end in chunk_payload(sizes):
+            with timer.stage("InvokeEndpointLatency"):
+                response = self.client_sm.invoke_endpoint(
+                    EndpointName=self.endpoint_name,
+                    Body=self.request_encoder.join(rows[start:end]),
+                    ContentType=self.content_type,
+                    Accept=CSV_CONTENT_TYPE,
+                )
+                body = response["Body"].read()
+            chunk_scores = parse_scores(body)
+            if len(chunk_scores) != end - start:
+                raise ValueError(
+                    f"Endpoint returned {len(chunk_scores)} scores for {end - start} records"
+                )
+            scores += chunk_scores
+        return scores
+
+    def _score_chunk(self, chunk: List[str], timer: StageTimer) -> dict:
+        results = {}
+        with timer.stage("FeatureStoreLatency"):
+            vectors = {}
+            if self.serving_vectors is not None:
+                vectors = self.serving_vectors.get_many(chunk)
+            pending = [r for r in chunk if r not in vectors]
+            # Records that could not be read only fail their own identifier
+            errors = {}
+            records = (
+                self.feature_groups_reader.get_records(pending, errors=errors)
+                if pending
+                else {}
+            )
+        feature_groups = self.feature_groups_reader.feature_groups
+
+        ids, lines = [], []
+        for r in chunk:
+            line = vectors.get(r)
+            if r in errors:
+                results[r] = _error(r, 503, f"feature store unavailable: {errors[r]}")
+                continue
+            if line is None:
+                r_records = records.get(r, {})
+                missing_fg = self.feature_groups_reader.missing_feature_group(
+                    r_records, r
+                )
+                if missing_fg:
+                    results[r] = _error(
+                        r, 404, f"Record not found in {missing_fg.upper()} feature group"
+                    )
+                    continue
+                try:
+                    with timer.stage("AssembleLatency"):
+                        line = self.vector_assembler.to_csv(
+                            *(r_records[fg["name"]] for fg in feature_groups)
+                        )
+                except MissingFeatureError as e:
+                    results[r] = _error(r, 500, str(e))
+                    continue
+            if self.inference_log:
+                self.inference_log.observe(r, line)
+            score = None
+            if self.score_cache:
+                with timer.stage("ScoreCacheLatency"):
+                    score = self.score_cache.get(r, line)
+            if score is not None:
+                results[r] = {"policy_id": r, "statusCode": 200, "score": score}
+                continue
+            lines.append(line)
+            ids.append(r)
+
+        if lines:
+            for r, line, score in zip(ids, lines, self.predict(lines, timer)):
+                results[r] = {"policy_id": r, "statusCode": 200, "score": score}
+                if self.score_cache:
+                    self.score_cache.put(r, line, score)
+
+        return results
+
+
+def _error(record_identifier: str, status_code: int, message: str) -> dict:
+    return {"policy_id": record_identifier, "statusCode": status_code, "Error": message}
+
+
+def get_json_body(event: dict):
+    """JSON body of an API Gateway event, None when there is no body
+
+    Raises:
+        ValueError: if the body is not JSON
+    """
+    body = event.get("body")
+    if not body:
+        return None
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+
+def get_batch_identifiers(event: dict) -> List[str]:
+    """Extract the identifiers of a batch request
+
+    Either a POST body `{"policy_ids": [...]}` or a repeated `policy_id`
+    query string parameter.
+    """
+    if event.get("body"):
+        return [str(p) for p in get_json_body(event)["policy_ids"]]
+
+    multi_params = event.get("multiValueQueryStringParameters") or {}
+    return [str(p) for p in multi_params.get("policy_id", [])]
@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import math
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger()
+
+# magic, number of hash functions, number of bits, number of identifiers added.
+# Written by scripts/build_bloom_filter.py of the feature ingestion pipeline.
+MAGIC = b"BLM1"
+HEADER = struct.Struct("<4sIQQ")
+
+
+class BloomFilter(object):
+    """Set membership with false positives and no false negatives.
+
+    An identifier is hashed once with BLAKE2b and its `num_hashes` bit
+    positions are derived by double hashing. `might_contain` returning False
+    means the identifier was never added.
+
+    Args:
+        num_bits (int): size of the bit array
+        num_hashes (int): bits set per identifier
+        bits (bytearray): bit array, empty when None
+        count (int): number of identifiers added
+    """
+
+    def __init__(
+        self, num_bits: int, num_hashes: int, bits: bytearray = None, count: int = 0
+    ) -> None:
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> "BloomFilter":
+        """Smallest filter holding `capacity` identifiers at the given rate"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(
+            -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, num_hashes, num_bits, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a Bloom filter")
+        bits = bytearray(data[HEADER.size :])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated Bloom filter")
+        return cls(num_bits, num_hashes, bits, count)
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(MAGIC, self.num_hashes, self.num_bits, self.count) + bytes(
+            self.bits
+        )
+
+    def _start_and_step(self, record_identifier: str) -> tuple:
+        digest = hashlib.blake2b(
+            record_identifier.encode("utf-8"), digest_size=16
+        ).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        # An odd step visits distinct positions
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Positions (h1 + i * h2) % num_bits, without the multiplications
+        return h1 % self.num_bits, h2 % self.num_bits
+
+    def add(self, record_identifier: str) -> None:
+        bits, num_bits = self.bits, self.num_bits
+        p, step = self._start_and_step(record_identifier)
+        for _ in range(self.num_hashes):
+            bits[p >> 3] |= 1 << (p & 7)
+            p += step
+            if p >= num_bits:
+                p -= num_bits
+        self.count += 1
+
+    def update(self, record_identifiers: Iterable[str]) -> None:
+        for r in record_identifiers:
+            self.add(r)
+
+    def might_contain(self, record_identifier: str) -> bool:
+        bits, num_bits = self.bits, self.num_bits
+        p, step = self._start_and_step(record_identifier)
+        for _ in range(self.num_hashes):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+            p += step
+            if p >= num_bits:
+                p -= num_bits
+        return True
+
+    def __contains__(self, record_identifier: str) -> bool:
+        return self.might_contain(record_identifier)
+
+    def expected_false_positive_rate(self) -> float:
+        return (
+            1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        ) ** self.num_hashes
+
+
+class KnownIdentifiers(object):
+    """Bloom filters of the record identifiers of each feature group.
+
+    The feature ingestion pipeline publishes a filter per feature group to S3
+    after each run. Filters are loaded by `load`, during the init phase, and
+    `refresh` reloads them on a background thread at most every
+    `refresh_seconds`, downloading only the filters whose ETag changed. A
+    feature group whose filter cannot be read rejects nothing.
+
+    Identifiers written to the online store by other means than the ingestion
+    pipeline are only known once the next run published its filter.
+
+    Args:
+        s3_client: `s3` boto3 client
+        filters_uris (Dict[str, str]): feature group name (as in the
+            configuration) -> S3 URI of its filter, in configuration order
+        refresh_seconds (float): minimum interval between refreshes
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        filters_uris: Dict[str, str],
+        refresh_seconds: float = 900,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.s3_client = s3_client
+        self.filters_uris = filters_uris
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self.filters: Dict[str, BloomFilter] = {}
+        self._etags: Dict[str, str] = {}
+        self._loaded_at = None
+        self._refreshing = threading.Lock()
+
+    def load(self) -> None:
+        """Download the filters that changed since the last load"""
+        self._loaded_at = self.clock()
+        for name, uri in self.filters_uris.items():
+            try:
+                self._load_filter(name, uri)
+            except Exception:
+                logger.exception(f"Failed to load the Bloom filter of {name}")
+
+    def _load_filter(self, name: str, uri: str) -> None:
+        url = urlparse(uri)
+        kwargs = {"Bucket": url.netloc, "Key": url.path.lstrip("/")}
+        if name in self._etags:
+            kwargs["IfNoneMatch"] = self._etags[name]
+        try:
+            response = self.s3_client.get_object(**kwargs)
+        except Exception as e:
+            status = getattr(e, "response", {}).get("ResponseMetadata", {})
+            if status.get("HTTPStatusCode") == 304:
+                return
+            raise
+        bloom_filter = BloomFilter.from_bytes(response["Body"].read())
+        # Swapped whole, readers never see a partially loaded filter
+        self.filters[name] = bloom_filter
+        self._etags[name] = response["ETag"]
+        logger.info(
+            f"Loaded the Bloom filter of {name}: {bloom_filter.count} identifiers,"
+            f" {len(bloom_filter.bits)} bytes"
+        )
+
+    def refresh(self) -> None:
+        """Reload the filters in the background when `refresh_seconds` elapsed"""
+        if (
+            self._loaded_at is not None
+            and self.clock() - self._loaded_at < self.refresh_seconds
+        ):
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.load()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def first_miss(
+        self, record_identifier: str, names: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """First feature group, in configuration order, that definitely does
+        not hold the identifier, None if all of them might
+
+        Args:
+            record_identifier (str): identifier to look up
+            names (List[str], optional): feature groups checked, all by default
+        """
+        for name in self.filters_uris:
+            if names is not None and name not in names:
+                continue
+            bloom_filter = self.filters.get(name)
+            if bloom_filter is not None and not bloom_filter.might_contain(
+                record_identifier
+            ):
+                return name
+        return None
@@ -0,0 +1,94 @@
+import json
+from typing import List
+
+
+class InvalidClaimError(ValueError):
+    """Raised when a raw claim cannot be encoded as the ingestion pipeline does"""
+
+
+class ClaimEncoder(object):
+    """Encode a raw claim into the record of the claims feature group.
+
+    The encodings are those of the claims Data Wrangler flow, exported by
+    `scripts/export_flow_encodings.py`: string values are lower cased and
+    stripped of symbols, categorical fields are one-hot encoded into
+    `<field>_<label>` features, unknown labels setting none of them, and
+    ordinal fields are replaced by the index of their label. The other
+    features are copied from the claim, as numbers.
+
+    Args:
+        encodings (dict): encodings exported from the flow
+        features_names (List[str]): features of the record, e.g. the model
+            features of the claims feature group
+    """
+
+    def __init__(self, encodings: dict, features_names: List[str]) -> None:
+        self.lower_case = encodings.get("lower_case", False)
+        self.remove_symbols = {
+            column: str.maketrans("", "", symbols)
+            for column, symbols in encodings.get("remove_symbols", {}).items()
+        }
+        self.ordinal = {
+            column: {label: idx for idx, label in enumerate(labels)}
+            for column, labels in encodings.get("ordinal", {}).items()
+        }
+        one_hot = {
+            f"{column}_{label}": (column, label)
+            for column, labels in encodings.get("one_hot", {}).items()
+            for label in labels
+        }
+        # Compiled once: how each feature is computed from the claim
+        self._features = []
+        for name in features_names:
+            if name in one_hot:
+                self._features.append((name, "one_hot") + one_hot[name])
+            elif name in self.ordinal:
+                self._features.append((name, "ordinal", name, None))
+            else:
+                self._features.append((name, "number", name, None))
+
+    @classmethod
+    def from_file(cls, path: str, features_names: List[str]) -> "ClaimEncoder":
+        with open(path, "r") as f:
+            return cls(json.load(f), features_names)
+
+    def _category(self, claim: dict, column: str):
+        value = claim.get(column)
+        if not isinstance(value, str):
+            return value
+        if self.lower_case:
+            value = value.lower()
+        if column in self.remove_symbols:
+            value = value.translate(self.remove_symbols[column])
+        return value
+
+    def encode(self, claim: dict) -> List[dict]:
+        """`Record` list of the claim, as read from the online store
+
+        Raises:
+            InvalidClaimError: if fields are missing, not numbers or, for the
+                ordinal ones, not one of the known labels
+        """
+        record, errors = [], []
+        for name, kind, column, label in self._features:
+            if kind == "one_hot":
+                value = int(self._category(claim, column) == label)
+            elif kind == "ordinal":
+                value = self.ordinal[column].get(self._category(claim, column))
+                if value is None:
+                    errors.append(f"{column} must be one of {list(self.ordinal[column])}")
+                    continue
+            else:
+                value = claim.get(column)
+                if isinstance(value, str):
+                    try:
+                        value = float(value) if "." in value else int(value)
+                    except ValueError:
+                        value = None
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    errors.append(f"{column} must be a number")
+                    continue
+            record.append({"FeatureName": name, "ValueAsString": str(value)})
+        if errors:
+            raise InvalidClaimError("; ".join(errors))
+        return record
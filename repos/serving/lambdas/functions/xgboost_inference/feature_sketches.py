@@ -0,0 +1,330 @@
+import gzip
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger()
+
+# Version of the payloads written by FeatureSketches.flush
+SKETCHES_VERSION = 1
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch with a relative accuracy guarantee (DDSketch).
+
+    Values are counted in logarithmic buckets, `(gamma^(i-1), gamma^i]` for
+    bucket `i` of the positive values and of the absolute negative ones, so
+    any quantile is returned within `relative_accuracy` of its exact value.
+    Merging adds the counts of the buckets: sketches of different containers
+    and time windows merge without loss.
+
+    Args:
+        relative_accuracy (float): relative error of the quantiles
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > 0:
+            i = math.ceil(math.log(value) / self._log_gamma)
+            self.positive[i] = self.positive.get(i, 0) + 1
+        elif value < 0:
+            i = math.ceil(math.log(-value) / self._log_gamma)
+            self.negative[i] = self.negative.get(i, 0) + 1
+        else:
+            self.zeros += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches of different accuracies cannot be merged")
+        for buckets, other_buckets in [
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ]:
+            for i, c in other_buckets.items():
+                buckets[i] = buckets.get(i, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, i: int) -> float:
+        # Middle of the bucket, in relative terms
+        return 2 * self.gamma ** i / (self.gamma + 1)
+
+    def _ordered(self):
+        """(value, count) of the buckets, in increasing value order"""
+        for i in sorted(self.negative, reverse=True):
+            yield -self._value(i), self.negative[i]
+        if self.zeros:
+            yield 0.0, self.zeros
+        for i in sorted(self.positive):
+            yield self._value(i), self.positive[i]
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, c in self._ordered():
+            seen += c
+            if seen > rank:
+                return value
+        return value
+
+    def cdf(self, x: float) -> Optional[float]:
+        """Fraction of the values lower or equal to `x`"""
+        if not self.count:
+            return None
+        return sum(c for value, c in self._ordered() if value <= x) / self.count
+
+    def to_dict(self) -> dict:
+        return {
+            "a": self.relative_accuracy,
+            "z": self.zeros,
+            "p": self.positive,
+            "n": self.negative,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        sketch = cls(d["a"])
+        sketch.zeros = d["z"]
+        sketch.positive = {int(i): c for i, c in d["p"].items()}
+        sketch.negative = {int(i): c for i, c in d["n"].items()}
+        sketch.count = (
+            sketch.zeros + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        )
+        return sketch
+
+
+class FeatureSketch(object):
+    """Mergeable summary of one feature: counts, moments, range and quantiles"""
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        # Sum of the squared differences to the mean
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = QuantileSketch(relative_accuracy)
+
+    def add(self, value: Optional[float]) -> None:
+        if value is None or math.isnan(value):
+            self.nulls += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.quantiles.add(value)
+
+    def merge(self, other: "FeatureSketch") -> None:
+        self.nulls += other.nulls
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.mean += delta * other.count / count
+            self.count = count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.quantiles.merge(other.quantiles)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "c": self.count,
+            "u": self.nulls,
+            "m": self.mean,
+            "m2": self.m2,
+            "lo": self.min if self.count else None,
+            "hi": self.max if self.count else None,
+            "q": self.quantiles.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FeatureSketch":
+        sketch = cls()
+        sketch.count = d["c"]
+        sketch.nulls = d["u"]
+        sketch.mean = d["m"]
+        sketch.m2 = d["m2"]
+        if sketch.count:
+            sketch.min, sketch.max = d["lo"], d["hi"]
+        sketch.quantiles = QuantileSketch.from_dict(d["q"])
+        return sketch
+
+
+def _parse(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class FeatureSketches(object):
+    """Sketches of the scored feature vectors and scores, written to S3 periodically.
+
+    The feature vectors and scores of the model are only queued by `observe`,
+    during the request: they are parsed into one `FeatureSketch` per feature,
+    and one for the score, by `flush`, which runs after the response is sent
+    by the `PostResponseExtension`. Every `emit_seconds` the sketches of the
+    window are then written as one compact gzip JSON object under hourly
+    partitions `year=/month=/day=/hour=` of `s3_uri`, and reset: the objects
+    of all containers are merged by `scripts/aggregate_sketches.py`.
+
+    Args:
+        s3_client: `s3` boto3 client
+        s3_uri (str): S3 prefix of the sketches
+        features_names (List[str]): features of the vectors, in model order
+        emit_seconds (float): length of the windows
+        relative_accuracy (float): relative error of the quantiles
+        clock (Callable): monotonic clock, in seconds
+        wall_clock (Callable): wall clock, in epoch seconds
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        s3_uri: str,
+        features_names: List[str],
+        emit_seconds: float = 60,
+        relative_accuracy: float = 0.01,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.s3_client = s3_client
+        url = urlparse(s3_uri)
+        self.bucket, self.prefix = url.netloc, url.path.strip("/")
+        self.features_names = features_names
+        self.emit_seconds = emit_seconds
+        self.relative_accuracy = relative_accuracy
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.instance = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._pending = []
+        self._reset()
+        self.written = 0
+
+    def _reset(self) -> None:
+        self.sketches = {
+            name: FeatureSketch(self.relative_accuracy)
+            for name in self.features_names + ["score"]
+        }
+        self._window_start = self.clock()
+        self._window_start_time = self.wall_clock()
+
+    def observe(self, lines: List[str], scores: List[float]) -> None:
+        """Queue the CSV feature vectors scored and their scores"""
+        with self._lock:
+            self._pending.append((lines, scores))
+
+    def update(self) -> None:
+        """Add the queued vectors and scores to the sketches"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        sketches = [self.sketches[name] for name in self.features_names]
+        score = self.sketches["score"]
+        for lines, scores in pending:
+            for line, s in zip(lines, scores):
+                for sketch, value in zip(sketches, line.split(",")):
+                    sketch.add(_parse(value))
+                score.add(s)
+
+    def is_due(self) -> bool:
+        return bool(self._pending) or (
+            self.clock() - self._window_start >= self.emit_seconds
+        )
+
+    def flush(self) -> int:
+        """Add the queued vectors to the sketches, after each request, and
+        write the sketches to S3 then start a new window every `emit_seconds`
+
+        Returns:
+            int: number of scores written
+        """
+        self.update()
+        if self.clock() - self._window_start < self.emit_seconds:
+            return 0
+        return self.close()
+
+    def close(self) -> int:
+        """Write the sketches of the current window, e.g. before shutdown"""
+        with self._lock:
+            self.update()
+            count = self.sketches["score"].count
+            if not count:
+                self._reset()
+                return 0
+            payload = {
+                "version": SKETCHES_VERSION,
+                "instance": self.instance,
+                "window_start": self._window_start_time,
+                "window_end": self.wall_clock(),
+                "sketches": {n: s.to_dict() for n, s in self.sketches.items()},
+            }
+            self._reset()
+        now = time.gmtime(payload["window_end"])
+        key = "/".join(
+            p
+            for p in (
+                self.prefix,
+                time.strftime("year=%Y/month=%m/day=%d/hour=%H", now),
+                f"{time.strftime('%Y%m%dT%H%M%SZ', now)}-{self.instance}.json.gz",
+            )
+            if p
+        )
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=gzip.compress(
+                    json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                ),
+                ContentType="application/json",
+                ContentEncoding="gzip",
+            )
+        except Exception:
+            # Sketches are statistics: a lost window only lowers the counts
+            logger.exception(f"Failed to write the sketches of {count} scores")
+            return 0
+        self.written += count
+        return count
+
+    def stats(self) -> dict:
+        return {"window": self.sketches["score"].count, "written": self.written}
+
+
+def merge_payloads(payloads: List[dict]) -> Dict[str, FeatureSketch]:
+    """Merge the sketches written by `FeatureSketches.flush`, by feature"""
+    merged: Dict[str, FeatureSketch] = {}
+    for payload in payloads:
+        if payload.get("version") != SKETCHES_VERSION:
+            raise ValueError(f"Unsupported sketches version {payload.get('version')}")
+        for name, d in payload["sketches"].items():
+            sketch = FeatureSketch.from_dict(d)
+            if name in merged:
+                merged[name].merge(sketch)
+            else:
+                merged[name] = sketch
+    return merged
@@ -0,0 +1,219 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger()
+
+# magic and length of the JSON header that follows.
+# Written by scripts/build_snapshot.py of the feature ingestion pipeline.
+MAGIC = b"FSS1"
+PREAMBLE = struct.Struct("<4sI")
+
+
+class FeatureSnapshot(object):
+    """Memory-mapped snapshot of the latest records of a feature group.
+
+    Rows are sorted by record identifier and fixed width: the identifier then
+    each feature value, as the online store `ValueAsString`, NUL padded to the
+    width of their column. The key index holds the identifier of every
+    `index_every` row, so a lookup bisects the index in memory then binary
+    searches one block of rows in the mapped file.
+
+    Args:
+        path (str): local path of the snapshot file
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = PREAMBLE.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a feature snapshot")
+        header = json.loads(
+            self._mmap[PREAMBLE.size : PREAMBLE.size + header_size].decode("utf-8")
+        )
+        self.feature_group_name = header["feature_group_name"]
+        self.generated_at = header["generated_at"]
+        self.count = header["count"]
+        self.key_width = header["key_width"]
+        self.index_every = header["index_every"]
+        self._features = [(name, width) for name, width in header["features"]]
+        self.row_width = self.key_width + sum(w for _, w in self._features)
+        self._names = [name for name, _ in self._features]
+        self._values = struct.Struct("".join(f"{w}s" for _, w in self._features))
+        self._data_offset = PREAMBLE.size + header_size
+        index_offset = self._data_offset + self.count * self.row_width
+        kw = self.key_width
+        self._index = [
+            self._mmap[i : i + kw]
+            for i in range(
+                index_offset,
+                index_offset + kw * -(-self.count // self.index_every),
+                kw,
+            )
+        ]
+
+    def _key(self, row: int) -> bytes:
+        offset = self._data_offset + row * self.row_width
+        return self._mmap[offset : offset + self.key_width]
+
+    def get(self, record_identifier: str) -> Optional[List[dict]]:
+        """`Record` list of an identifier, None if it is not in the snapshot"""
+        key = record_identifier.encode("utf-8")
+        if len(key) > self.key_width:
+            return None
+        key = key.ljust(self.key_width, b"\0")
+        block = bisect.bisect_right(self._index, key) - 1
+        if block < 0:
+            return None
+        lo = block * self.index_every
+        hi = min(lo + self.index_every, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count or self._key(lo) != key:
+            return None
+
+        offset = self._data_offset + lo * self.row_width + self.key_width
+        record = []
+        values = self._values.unpack_from(self._mmap, offset)
+        for name, value in zip(self._names, values):
+            value = value.rstrip(b"\0")
+            # Features without a value are left out, as by the online store
+            if value:
+                record.append({"FeatureName": name, "ValueAsString": value.decode()})
+        return record
+
+
+class FeatureSnapshots(object):
+    """Local snapshots of slow changing feature groups, read without network calls.
+
+    The feature ingestion pipeline publishes a snapshot of the feature group
+    to S3 after each run. Snapshots are downloaded to `local_dir` by `load`,
+    during the init phase, and `refresh` downloads them again on a background
+    thread at most every `refresh_seconds`, when their ETag changed. A
+    snapshot is stamped with the latest event time of the offline store
+    records it was built from: the records written since are only in the
+    online store, and a snapshot serves them as of that time. A snapshot
+    older than `max_age_seconds`, or that could not be loaded, serves
+    nothing: its records are read from the online store, as are the
+    identifiers missing from it. Snapshots are thus only enabled for feature
+    groups that change less often than `max_age_seconds`.
+
+    Args:
+        s3_client: `s3` boto3 client
+        snapshots_uris (Dict[str, str]): feature group name (as in the
+            configuration) -> S3 URI of its snapshot
+        max_age_seconds (float): age of the snapshots served
+        refresh_seconds (float): minimum interval between refreshes
+        local_dir (str): directory of the downloaded snapshots
+        clock (Callable): monotonic clock, in seconds
+        wall_clock (Callable): wall clock, in epoch seconds
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        snapshots_uris: Dict[str, str],
+        max_age_seconds: float = 172800,
+        refresh_seconds: float = 900,
+        local_dir: str = "/tmp/snapshots",
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.s3_client = s3_client
+        self.snapshots_uris = snapshots_uris
+        self.max_age_seconds = max_age_seconds
+        self.refresh_seconds = refresh_seconds
+        self.local_dir = local_dir
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.snapshots: Dict[str, FeatureSnapshot] = {}
+        self._etags: Dict[str, str] = {}
+        self._loaded_at = None
+        self._refreshing = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_snapshotted(self, name: str) -> bool:
+        return name in self.snapshots_uris
+
+    def load(self) -> None:
+        """Download the snapshots that changed since the last load"""
+        self._loaded_at = self.clock()
+        os.makedirs(self.local_dir, exist_ok=True)
+        for name, uri in self.snapshots_uris.items():
+            try:
+                self._load_snapshot(name, uri)
+            except Exception:
+                logger.exception(f"Failed to load the snapshot of {name}")
+
+    def _load_snapshot(self, name: str, uri: str) -> None:
+        url = urlparse(uri)
+        bucket, key = url.netloc, url.path.lstrip("/")
+        etag = self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        if etag == self._etags.get(name):
+            return
+        path = os.path.join(self.local_dir, f"{name}.snapshot")
+        # /tmp is limited, the previous file is replaced, its mapping stays valid
+        self.s3_client.download_file(
+            Bucket=bucket, Key=key, Filename=f"{path}.part"
+        )
+        os.replace(f"{path}.part", path)
+        snapshot = FeatureSnapshot(path)
+        self.snapshots[name] = snapshot
+        self._etags[name] = etag
+        logger.info(
+            f"Loaded the snapshot of {name}: {snapshot.count} records"
+            f" generated at {snapshot.generated_at}"
+        )
+
+    def refresh(self) -> None:
+        """Download the snapshots in the background when `refresh_seconds` elapsed"""
+        if (
+            self._loaded_at is not None
+            and self.clock() - self._loaded_at < self.refresh_seconds
+        ):
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.load()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, name: str, record_identifier: str) -> Optional[List[dict]]:
+        """Record of the snapshot, None if missing, stale or not loaded"""
+        snapshot = self.snapshots.get(name)
+        if snapshot is None or (
+            self.wall_clock() - snapshot.generated_at > self.max_age_seconds
+        ):
+            self.misses += 1
+            return None
+        record = snapshot.get(record_identifier)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated_at": {n: s.generated_at for n, s in self.snapshots.items()},
+        }
@@ -0,0 +1,313 @@
+import logging
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+from bloom_filter import KnownIdentifiers
+from feature_snapshot import FeatureSnapshots
+from record_cache import RecordCache
+
+logger = logging.getLogger()
+
+# BatchGetRecord service limits
+MAX_FEATURE_GROUPS_PER_CALL = 10
+MAX_RECORDS_PER_FEATURE_GROUP = 100
+
+
+class FeatureStoreReadError(Exception):
+    """Raised when the online store returns errors for some of the records"""
+
+
+UNPROCESSED_ERROR = "Unprocessed identifier"
+
+
+class FeatureGroupsReader(object):
+    """Read the records of several feature groups in a single BatchGetRecord call.
+
+    Args:
+        featurestore_runtime: `sagemaker-featurestore-runtime` boto3 client
+        feature_groups (List[dict]): ordered list of
+            `{"name": ..., "feature_group_name": ..., "features_names": [...],
+            "event_time_feature_name": ...}`, `features_names` being the subset
+            of features requested from the group
+        max_attempts (int): number of calls made while the service returns
+            `UnprocessedIdentifiers`
+        backoff_base_ms (float): maximum backoff before the first retry, the
+            backoff is drawn uniformly (full jitter) and doubles at each retry
+        backoff_max_ms (float): maximum backoff
+        record_cache (RecordCache, optional): cache of the records of slow
+            changing feature groups
+        known_identifiers (KnownIdentifiers, optional): Bloom filters of the
+            identifiers of each feature group, identifiers definitely missing
+            from one of them are not read
+        snapshots (FeatureSnapshots, optional): local snapshots of slow
+            changing feature groups, read before the cache and the online store
+        sleep (Callable): sleep function, in seconds
+    """
+
+    def __init__(
+        self,
+        featurestore_runtime,
+        feature_groups: List[dict],
+        max_attempts: int = 3,
+        record_cache: RecordCache = None,
+        known_identifiers: KnownIdentifiers = None,
+        snapshots: FeatureSnapshots = None,
+        backoff_base_ms: float = 10,
+        backoff_max_ms: float = 100,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if len(feature_groups) > MAX_FEATURE_GROUPS_PER_CALL:
+            raise ValueError(
+                f"At most {MAX_FEATURE_GROUPS_PER_CALL} feature groups can be read in one call"
+            )
+        self.featurestore_runtime = featurestore_runtime
+        self.feature_groups = feature_groups
+        self.max_attempts = max_attempts
+        self.record_cache = record_cache
+        self.known_identifiers = known_identifiers
+        self.snapshots = snapshots
+        self.backoff_base = backoff_base_ms / 1000
+        self.backoff_max = backoff_max_ms / 1000
+        self.sleep = sleep
+        self._names = {fg["feature_group_name"]: fg["name"] for fg in feature_groups}
+        self._event_time_features = {
+            fg["name"]: fg.get("event_time_feature_name") for fg in feature_groups
+        }
+        # The event time is needed to keep cached records up to date
+        self._fetched_features = {
+            fg["name"]: fg["features_names"]
+            + (
+                [fg["event_time_feature_name"]]
+                if record_cache is not None
+                and record_cache.is_cached(fg["name"])
+                and fg.get("event_time_feature_name")
+                and fg["event_time_feature_name"] not in fg["features_names"]
+                else []
+            )
+            for fg in feature_groups
+        }
+
+    def get_records(
+        self,
+        record_identifiers: List[str],
+        names: Optional[List[str]] = None,
+        errors: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Dict[str, list]]:
+        """Fetch the records of every feature group for the given identifiers
+
+        Records of feature groups with a local snapshot are read from it, then
+        records of feature groups cached in `record_cache` are served from the
+        cache, and the remaining ones are read in a single BatchGetRecord call.
+        Cached records of feature groups with `invalidate_on_event_time` are
+        checked against the online store event time in that same call.
+
+        `UnprocessedIdentifiers` are read again after a jittered exponential
+        backoff, for at most `max_attempts` calls and within the deadline of
+        the request, if any. The errors of the service, and the identifiers
+        still unprocessed, only fail their own record identifiers: the
+        records read for the others are returned.
+
+        Args:
+            record_identifiers (List[str]): record identifiers, at most
+                MAX_RECORDS_PER_FEATURE_GROUP
+            names (List[str], optional): feature groups read, all by default
+            errors (Dict[str, str], optional): receives the error of each
+                record identifier that could not be read, instead of raising
+
+        Raises:
+            FeatureStoreReadError: if a record could not be read and `errors`
+                is not given
+
+        Returns:
+            Dict[str, Dict[str, list]]: record identifier -> feature group name
+                (as in the configuration) -> `Record` list. Records not found in
+                the online store are absent.
+        """
+        if len(record_identifiers) > MAX_RECORDS_PER_FEATURE_GROUP:
+            raise ValueError(
+                f"At most {MAX_RECORDS_PER_FEATURE_GROUP} records can be read in one call"
+            )
+        if self.known_identifiers is not None:
+            # A record missing from any feature group cannot be scored
+            record_identifiers = [
+                r
+                for r in record_identifiers
+                if self.known_identifiers.first_miss(r, names) is None
+            ]
+            if not record_identifiers:
+                return {}
+        cache = self.record_cache
+        records = {}
+        to_fetch, to_check = [], []
+        for fg in self.feature_groups:
+            name = fg["name"]
+            if names is not None and name not in names:
+                continue
+            pending = record_identifiers
+            if self.snapshots is not None and self.snapshots.is_snapshotted(name):
+                pending = []
+                for r in record_identifiers:
+                    record = self.snapshots.get(name, r)
+                    if record is None:
+                        pending.append(r)
+                    else:
+                        records.setdefault(r, {})[name] = record
+                if not pending:
+                    continue
+            if cache is None or not cache.is_cached(name):
+                to_fetch.append((fg, list(pending)))
+                continue
+
+            misses, hits = [], []
+            for r in pending:
+                record = cache.get(name, r)
+                if record is None:
+                    misses.append(r)
+                else:
+                    records.setdefault(r, {})[name] = record
+                    hits.append(r)
+            if hits and cache.revalidates(name) and fg.get("event_time_feature_name"):
+                if misses:
+                    # A feature group can only be listed once per call
+                    misses += hits
+                else:
+                    to_check.append((fg, hits))
+            if misses:
+                to_fetch.append((fg, misses))
+
+        fetched, checked, failed = self._batch_get(to_fetch, to_check)
+
+        to_refetch = []
+        for fg, hits in to_check:
+            name = fg["name"]
+            stale = []
+            for r in hits:
+                event_time = checked.get((name, r))
+                if event_time is None or cache.is_stale(name, r, event_time):
+                    cache.invalidate(name, r)
+                    del records[r][name]
+                    stale.append(r)
+            if stale:
+                to_refetch.append((fg, stale))
+        if to_refetch:
+            refetched, _, refailed = self._batch_get(to_refetch, [])
+            fetched.update(refetched)
+            failed.update(refailed)
+
+        for (name, r), record in fetched.items():
+            records.setdefault(r, {})[name] = record
+            if cache is not None:
+                cache.put(name, r, record, self._event_time(name, record))
+
+        if failed:
+            if errors is None:
+                raise FeatureStoreReadError(next(iter(failed.values())))
+            for (name, r), message in failed.items():
+                errors.setdefault(r, f"{message} in {name.upper()} feature group")
+                # A record missing from any feature group cannot be scored
+                records.pop(r, None)
+        return records
+
+    def _batch_get(self, to_fetch: list, to_check: list) -> tuple:
+        """Read full records for `to_fetch` and only event times for `to_check`
+
+        Returns:
+            tuple: (feature group name, record identifier) -> `Record` list,
+                (feature group name, record identifier) -> event time, and
+                (feature group name, record identifier) -> error message of
+                the records of `to_fetch` that could not be read
+        """
+        identifiers = [
+            {
+                "FeatureGroupName": fg["feature_group_name"],
+                "RecordIdentifiersValueAsString": ids,
+                "FeatureNames": self._fetched_features[fg["name"]],
+            }
+            for fg, ids in to_fetch
+        ] + [
+            {
+                "FeatureGroupName": fg["feature_group_name"],
+                "RecordIdentifiersValueAsString": ids,
+                "FeatureNames": [fg["event_time_feature_name"]],
+            }
+            for fg, ids in to_check
+        ]
+        checked_groups = {fg["feature_group_name"] for fg, _ in to_check}
+
+        fetched, checked, failed = {}, {}, {}
+        calls = 0
+        while identifiers:
+            if calls == self.max_attempts or (calls and not self._backoff(calls - 1)):
+                break
+            calls += 1
+            response = self.featurestore_runtime.batch_get_record(
+                Identifiers=identifiers
+            )
+            for r in response.get("Records", []):
+                name = self._names[r["FeatureGroupName"]]
+                key = (name, r["RecordIdentifierValueAsString"])
+                if r["FeatureGroupName"] in checked_groups:
+                    checked[key] = self._event_time(name, r["Record"])
+                else:
+                    fetched[key] = r["Record"]
+            if response.get("Errors"):
+                logger.error(response["Errors"])
+            for e in response.get("Errors", []):
+                # Failed event time checks are read again, as stale records
+                if e["FeatureGroupName"] not in checked_groups:
+                    name = self._names[e["FeatureGroupName"]]
+                    failed[(name, e["RecordIdentifierValueAsString"])] = (
+                        f"{e['ErrorCode']}: {e['ErrorMessage']}"
+                    )
+            identifiers = response.get("UnprocessedIdentifiers")
+
+        if identifiers:
+            logger.error(f"Unprocessed identifiers after {calls} calls")
+        for i in identifiers or []:
+            if i["FeatureGroupName"] not in checked_groups:
+                name = self._names[i["FeatureGroupName"]]
+                for r in i["RecordIdentifiersValueAsString"]:
+                    failed[(name, r)] = UNPROCESSED_ERROR
+        return fetched, checked, failed
+
+    def _backoff(self, attempt: int) -> bool:
+        """Exponential backoff with full jitter, False when the request
+        deadline leaves no time for it and the next call"""
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        )
+        deadline = getattr(self.featurestore_runtime, "deadline", None)
+        if deadline is not None and delay >= deadline.remaining():
+            return False
+        self.sleep(delay)
+        return True
+
+    def _event_time(self, name: str, record: List[dict]) -> str:
+        event_time_feature_name = self._event_time_features.get(name)
+        for feature in record:
+            if feature["FeatureName"] == event_time_feature_name:
+                return feature["ValueAsString"]
+        return None
+
+    def missing_feature_group(
+        self,
+        records: Dict[str, list],
+        record_identifier: str = None,
+        names: Optional[List[str]] = None,
+    ) -> str:
+        """Return the first feature group, in configuration order, without a record
+
+        When records are missing, the feature group whose Bloom filter
+        rejected `record_identifier`, if any, is returned: none was read.
+        Only the feature groups in `names` are checked, if given.
+        """
+        for fg in self.feature_groups:
+            if names is not None and fg["name"] not in names:
+                continue
+            if not records.get(fg["name"]):
+                known = self.known_identifiers
+                if record_identifier is not None and known is not None:
+                    return known.first_miss(record_identifier, names) or fg["name"]
+                return fg["name"]
+        return None
@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List
+
+
+class MissingFeatureError(KeyError):
+    """Raised when a feature expected by the model is absent from the records"""
+
+    def __init__(self, missing: List[str]) -> None:
+        super().__init__(missing)
+        self.missing = missing
+
+    def __str__(self) -> str:
+        return f"Missing features for model input: {', '.join(self.missing)}"
+
+
+class FeatureVectorAssembler(object):
+    """Assemble the model input vector from feature store records.
+
+    The feature order is compiled once into a feature name -> slot index so
+    that each request only fills a preallocated list, without building any
+    intermediate DataFrame.
+    """
+
+    def __init__(self, features_names: Iterable[str]) -> None:
+        self.features_names = list(features_names)
+        self._slots: Dict[str, int] = {
+            name: idx for idx, name in enumerate(self.features_names)
+        }
+        if len(self._slots) != len(self.features_names):
+            raise ValueError("Duplicated feature names in model input definition")
+        self.size = len(self.features_names)
+
+    def assemble(self, *records: List[dict]) -> List[str]:
+        """Fill the slots of the model vector from one or more records
+
+        Args:
+            records (List[dict]): `Record` lists as returned by `get_record`,
+                i.e. lists of `{"FeatureName": ..., "ValueAsString": ...}`
+
+        Raises:
+            MissingFeatureError: if any of the model features is not found
+
+        Returns:
+            List[str]: feature values, as strings, in model order
+        """
+        slots = self._slots
+        vector = [None] * self.size
+        for record in records:
+            for feature in record:
+                idx = slots.get(feature["FeatureName"])
+                if idx is not None:
+                    vector[idx] = feature["ValueAsString"]
+
+        if None in vector:
+            raise MissingFeatureError(
+                [n for n, v in zip(self.features_names, vector) if v is None]
+            )
+        return vector
+
+    def to_csv(self, *records: List[dict]) -> str:
+        """Assemble the records into a single CSV line in model order"""
+        return ",".join(self.assemble(*records))
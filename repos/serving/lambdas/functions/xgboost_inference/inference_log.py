@@ -0,0 +1,181 @@
+import gzip
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger()
+
+# Bytes of a record besides its feature vector, to estimate the buffer size
+RECORD_OVERHEAD_BYTES = 200
+
+
+class InferenceLog(object):
+    """Buffer the served scores and write them to S3 in batches.
+
+    Each score answered with a 200 is logged with its policy, feature vector
+    (None for the scores of the batch tier), tier, model version and the
+    latency of its request, to be joined with the fraud labels later. The
+    requests only append to an in-memory buffer: `flush` writes it as one
+    gzip compressed newline-delimited JSON object, under hourly partitions
+    `year=/month=/day=/hour=` of `s3_uri`, and is called after the response
+    is sent, when `is_due`, by the `PostResponseExtension`.
+
+    A failed write puts the records back in the buffer, which drops its
+    oldest records beyond `max_buffered_records`.
+
+    Args:
+        s3_client: `s3` boto3 client
+        s3_uri (str): S3 prefix of the log
+        max_records (int): records buffered before a flush is due
+        max_bytes (int): estimated size of the buffered records before a
+            flush is due
+        max_age_seconds (float): age of the oldest buffered record before a
+            flush is due
+        max_buffered_records (int): records kept when writes fail
+        clock (Callable): monotonic clock, in seconds
+        wall_clock (Callable): wall clock, in epoch seconds
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        s3_uri: str,
+        max_records: int = 1000,
+        max_bytes: int = 4 * 1024 * 1024,
+        max_age_seconds: float = 60,
+        max_buffered_records: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.s3_client = s3_client
+        url = urlparse(s3_uri)
+        self.bucket, self.prefix = url.netloc, url.path.strip("/")
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_buffered_records = max_buffered_records
+        self.clock = clock
+        self.wall_clock = wall_clock
+        # Reentrant, the SIGTERM handler flushes on the main thread
+        self._lock = threading.RLock()
+        self._buffer: List[dict] = []
+        self._bytes = 0
+        self._oldest = None
+        self._features = {}
+        self._served = []
+        self.written = 0
+        self.dropped = 0
+
+    def begin(self) -> None:
+        """Start a new request"""
+        self._features = {}
+        self._served = []
+
+    def observe(self, record_identifier: str, features: str) -> None:
+        """Feature vector scored for an identifier of the current request"""
+        self._features[record_identifier] = features
+
+    def add(self, result: dict) -> None:
+        """Result served for the current request, only 200s are logged"""
+        if result.get("statusCode") == 200:
+            self._served.append(result)
+
+    def end(self, latency_ms: float, model_version: str, request_id: str) -> None:
+        """Move the results of the current request to the buffer"""
+        if not self._served:
+            return
+        timestamp = self.wall_clock()
+        records, size = [], 0
+        for result in self._served:
+            features = self._features.get(result["policy_id"])
+            records.append(
+                {
+                    "policy_id": result["policy_id"],
+                    "score": result["score"],
+                    "tier": result.get("tier", "realtime"),
+                    "score_age_seconds": result.get("score_age_seconds", 0),
+                    "features": features,
+                    "model_version": model_version,
+                    "latency_ms": latency_ms,
+                    "request_id": request_id,
+                    "timestamp": timestamp,
+                }
+            )
+            size += len(features or "") + RECORD_OVERHEAD_BYTES
+        self.begin()
+        with self._lock:
+            if self._oldest is None:
+                self._oldest = self.clock()
+            self._buffer += records
+            self._bytes += size
+
+    def is_due(self) -> bool:
+        with self._lock:
+            return bool(self._buffer) and (
+                len(self._buffer) >= self.max_records
+                or self._bytes >= self.max_bytes
+                or self.clock() - self._oldest >= self.max_age_seconds
+            )
+
+    def flush(self) -> int:
+        """Write the buffered records to one S3 object
+
+        Returns:
+            int: number of records written
+        """
+        with self._lock:
+            records, oldest = self._buffer, self._oldest
+            self._buffer, self._bytes, self._oldest = [], 0, None
+        if not records:
+            return 0
+        try:
+            body = gzip.compress(
+                "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+            )
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self._key(),
+                Body=body,
+                ContentType="application/x-ndjson",
+                ContentEncoding="gzip",
+            )
+        except Exception:
+            logger.exception(f"Failed to write {len(records)} inference log records")
+            self._restore(records, oldest)
+            return 0
+        self.written += len(records)
+        return len(records)
+
+    def close(self) -> int:
+        """Write the buffered records, e.g. before shutdown"""
+        return self.flush()
+
+    def _restore(self, records: List[dict], oldest: float) -> None:
+        with self._lock:
+            records += self._buffer
+            if len(records) > self.max_buffered_records:
+                self.dropped += len(records) - self.max_buffered_records
+                records = records[-self.max_buffered_records :]
+            self._buffer = records
+            self._bytes = sum(
+                len(r["features"] or "") + RECORD_OVERHEAD_BYTES for r in records
+            )
+            self._oldest = oldest
+
+    def _key(self) -> str:
+        now = time.gmtime(self.wall_clock())
+        partition = time.strftime("year=%Y/month=%m/day=%d/hour=%H", now)
+        name = f"{time.strftime('%Y%m%dT%H%M%SZ', now)}-{uuid.uuid4().hex}.json.gz"
+        return "/".join(p for p in (self.prefix, partition, name) if p)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
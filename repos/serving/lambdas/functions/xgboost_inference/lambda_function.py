@@ -1,23 +1,108 @@
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Measure the init phase, including the import of boto3
+init_start = time.perf_counter()
 
 import boto3
-import pandas as pd
+from botocore.config import Config
+
+from batch_scoring import BatchScorer, get_batch_identifiers, get_json_body
+from bloom_filter import KnownIdentifiers
+from claim_encoding import ClaimEncoder, InvalidClaimError
+from feature_sketches import FeatureSketches
+from feature_snapshot import FeatureSnapshots
+from feature_store import FeatureGroupsReader
+from feature_vector import FeatureVectorAssembler, MissingFeatureError
+from inference_log import InferenceLog
+from local_model import LocalModel
+from record_cache import RecordCache
+from post_response import PostResponseExtension, flush_due
+from resilience import (
+    API_GATEWAY_TIMEOUT_MS,
+    CircuitBreaker,
+    CircuitOpenError,
+    Deadline,
+    DeadlineExceeded,
+    GuardedClient,
+)
+from score_cache import ScoreCache
+from serving_vectors import ServingVectorReader
+from stage_metrics import NULL_TIMER, StageMetrics, StageTimer
+from tiered_scoring import RACE, REALTIME_ONLY, BatchScoreReader, TieredScorer
 
 logger = logging.getLogger()
+logger.setLevel(logging.INFO)
 
 region = os.environ["region"]
 endpoint_name = os.environ["endpoint_name"]
 content_type = os.environ["content_type"]
-customers_fg_name = os.environ["customers_fg_name"]
-claims_fg_name = os.environ["claims_fg_name"]
+feature_groups = json.loads(os.environ["feature_groups"])
+max_batch_size = int(os.getenv("max_batch_size", "500"))
+record_cache_conf = json.loads(os.getenv("record_cache", "{}"))
+score_cache_conf = json.loads(os.getenv("score_cache", "{}"))
+model_package_arn = os.getenv("model_package_arn", "")
+prime_connections = os.getenv("prime_connections", "true").lower() == "true"
+local_scoring_conf = json.loads(os.getenv("local_scoring", "{}"))
+metrics_conf = json.loads(os.getenv("metrics", "{}"))
+resilience_conf = json.loads(os.getenv("resilience", "{}"))
+tiered_serving_conf = json.loads(os.getenv("tiered_serving", "{}"))
+bloom_filters_conf = json.loads(os.getenv("bloom_filters", "{}"))
+snapshots_conf = json.loads(os.getenv("feature_snapshots", "{}"))
+payload_scoring_conf = json.loads(os.getenv("payload_scoring", "{}"))
+inference_log_conf = json.loads(os.getenv("inference_log", "{}"))
+sketches_conf = json.loads(os.getenv("feature_sketches", "{}"))
+serving_vector_conf = json.loads(os.getenv("serving_vector", "{}"))
+feature_store_timeout_ms = resilience_conf.get("feature_store_timeout_ms", 1000)
+endpoint_timeout_ms = resilience_conf.get("endpoint_timeout_ms", 5000)
 
 boto_session = boto3.Session(region_name=region)
+# Abandoned calls end at the read timeout, retries stay within the call timeout
 featurestore_runtime = boto_session.client(
-    service_name="sagemaker-featurestore-runtime", region_name=region
+    service_name="sagemaker-featurestore-runtime",
+    region_name=region,
+    config=Config(
+        connect_timeout=feature_store_timeout_ms / 1000,
+        read_timeout=feature_store_timeout_ms / 1000,
+        retries={"mode": "standard", "max_attempts": 2},
+    ),
+)
+client_sm = boto_session.client(
+    "sagemaker-runtime",
+    region_name=region,
+    config=Config(
+        connect_timeout=endpoint_timeout_ms / 1000,
+        read_timeout=endpoint_timeout_ms / 1000,
+        retries={"mode": "standard", "max_attempts": 1},
+    ),
+)
+# Downstream calls run on worker threads, bounded by the request deadline. An
+# abandoned call keeps its worker until the read timeout of its client, each
+# client has its own workers so that it does not hold back the others
+feature_store_max_workers = resilience_conf.get("feature_store_max_workers", 8)
+endpoint_max_workers = resilience_conf.get("endpoint_max_workers", 4)
+hedge_conf = resilience_conf.get("hedge", {})
+guarded_featurestore = GuardedClient(
+    featurestore_runtime,
+    ThreadPoolExecutor(max_workers=feature_store_max_workers),
+    feature_store_timeout_ms,
+    hedged=("batch_get_record",) if hedge_conf.get("enabled", True) else (),
+    hedge_quantile=hedge_conf.get("quantile", 0.95),
+    hedge_min_delay_ms=hedge_conf.get("min_delay_ms", 10),
+    hedge_default_delay_ms=hedge_conf.get("default_delay_ms", 50),
+    max_in_flight=feature_store_max_workers,
+)
+circuit_breaker = CircuitBreaker(**resilience_conf.get("circuit_breaker", {}))
+guarded_sm = GuardedClient(
+    client_sm,
+    ThreadPoolExecutor(max_workers=endpoint_max_workers),
+    endpoint_timeout_ms,
+    circuit_breaker=circuit_breaker,
+    guarded=("invoke_endpoint",),
 )
-client_sm = boto_session.client("sagemaker-runtime", region_name=region)
 
 col_order = [
     "incident_severity",
@@ -66,66 +151,492 @@ col_order = [
     "policy_state_nv",
     "policy_state_id",
 ]
+if os.getenv("features_names"):
+    col_order = os.environ["features_names"].split(",")
+elif all(fg.get("features_names") for fg in feature_groups):
+    # Left out of the environment when the feature groups hold the model
+    # features in model order
+    col_order = [f for fg in feature_groups for f in fg["features_names"]]
+
+vector_assembler = FeatureVectorAssembler(col_order)
+# Module scope, the cache survives warm invocations
+record_cache = RecordCache(
+    record_cache_conf.get("feature_groups", {}),
+    max_entries=record_cache_conf.get("max_entries", 10000),
+    max_bytes=record_cache_conf.get("max_bytes", 64 * 1024 * 1024),
+)
+known_identifiers = None
+if bloom_filters_conf.get("enabled"):
+    known_identifiers = KnownIdentifiers(
+        boto_session.client("s3", region_name=region),
+        {
+            fg["name"]: f"{bloom_filters_conf['s3_uri']}"
+            f"/{fg['feature_group_name']}/known-ids.bloom"
+            for fg in feature_groups
+        },
+        refresh_seconds=bloom_filters_conf.get("refresh_seconds", 900),
+    )
+    known_identifiers.load()
+snapshots = None
+if snapshots_conf.get("enabled") and snapshots_conf.get("feature_groups"):
+    snapshots = FeatureSnapshots(
+        boto_session.client("s3", region_name=region),
+        {
+            fg["name"]: f"{snapshots_conf['s3_uri']}"
+            f"/{fg['feature_group_name']}/snapshot.bin"
+            for fg in feature_groups
+            if fg["name"] in snapshots_conf["feature_groups"]
+        },
+        max_age_seconds=snapshots_conf.get("max_age_seconds", 172800),
+        refresh_seconds=snapshots_conf.get("refresh_seconds", 900),
+    )
+    snapshots.load()
+feature_groups_reader = FeatureGroupsReader(
+    guarded_featurestore,
+    feature_groups,
+    record_cache=record_cache,
+    known_identifiers=known_identifiers,
+    snapshots=snapshots,
+)
+# Vectors joined by the ingestion pipeline: one read, no assembly
+serving_vectors = None
+if serving_vector_conf.get("feature_group_name"):
+    serving_vectors = ServingVectorReader(
+        guarded_featurestore, serving_vector_conf["feature_group_name"], col_order
+    )
+score_cache = ScoreCache(
+    model_package_arn,
+    ttl_seconds=score_cache_conf.get("ttl_seconds", 0),
+    max_entries=score_cache_conf.get("max_entries", 10000),
+)
+local_model = None
+if local_scoring_conf.get("enabled"):
+    local_model = LocalModel(
+        boto_session.client("sagemaker", region_name=region),
+        boto_session.client("s3", region_name=region),
+        os.environ["model_package_group_name"],
+        refresh_seconds=local_scoring_conf.get("refresh_seconds", 300),
+        evaluator=local_scoring_conf.get("evaluator", "compiled"),
+    )
+    # Loaded during the init phase, then refreshed in the background
+    local_model.check()
+batch_scores = None
+if tiered_serving_conf.get("policy", REALTIME_ONLY) != REALTIME_ONLY:
+    batch_scores_timeout_ms = tiered_serving_conf.get("timeout_ms", 200)
+    guarded_dynamodb = GuardedClient(
+        boto_session.client(
+            "dynamodb",
+            region_name=region,
+            config=Config(
+                connect_timeout=batch_scores_timeout_ms / 1000,
+                read_timeout=batch_scores_timeout_ms / 1000,
+                retries={"mode": "standard", "max_attempts": 2},
+            ),
+        ),
+        ThreadPoolExecutor(max_workers=tiered_serving_conf.get("max_workers", 4)),
+        batch_scores_timeout_ms,
+    )
+    batch_scores = BatchScoreReader(
+        guarded_dynamodb,
+        tiered_serving_conf["table_name"],
+        index_name=tiered_serving_conf.get("index_name", "policy_id"),
+    )
+tiered_scorer = TieredScorer(
+    tiered_serving_conf.get("policy", REALTIME_ONLY),
+    batch_scores,
+    max_age_seconds=tiered_serving_conf.get("max_age_seconds", 86400),
+    latency_budget_ms=tiered_serving_conf.get("latency_budget_ms", 100),
+)
+# Claims sent in the request body are encoded as by the ingestion flow, only
+# the other feature groups are read
+claim_encoder = None
+payload_feature_group = payload_scoring_conf.get("feature_group")
+if payload_feature_group:
+    claim_encoder = ClaimEncoder.from_file(
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            payload_scoring_conf.get("encodings_file", "claims_encodings.json"),
+        ),
+        next(
+            fg["features_names"]
+            for fg in feature_groups
+            if fg["name"] == payload_feature_group
+        ),
+    )
+# Served scores and sketches of the scored vectors are buffered, and written
+# to S3 after the responses are sent
+post_response_buffers = {}
+inference_log = None
+if inference_log_conf.get("enabled"):
+    inference_log = InferenceLog(
+        boto_session.client("s3", region_name=region),
+        inference_log_conf["s3_uri"],
+        max_records=inference_log_conf.get("max_records", 1000),
+        max_bytes=inference_log_conf.get("max_bytes", 4 * 1024 * 1024),
+        max_age_seconds=inference_log_conf.get("max_age_seconds", 60),
+    )
+    post_response_buffers["inference log"] = inference_log
+sketches = None
+if sketches_conf.get("enabled"):
+    sketches = FeatureSketches(
+        boto_session.client("s3", region_name=region),
+        sketches_conf["s3_uri"],
+        col_order,
+        emit_seconds=sketches_conf.get("emit_seconds", 60),
+        relative_accuracy=sketches_conf.get("relative_accuracy", 0.01),
+    )
+    post_response_buffers["feature sketches"] = sketches
+post_response_extension = None
+if post_response_buffers:
+    post_response_extension = PostResponseExtension.start(post_response_buffers)
+stage_metrics = StageMetrics(
+    metrics_conf.get("namespace", "fraud-detection/serving"),
+    endpoint_name,
+    sample_rate=metrics_conf.get("sample_rate", 1.0),
+)
+# Model package ARNs end with <group name>/<version>
+stage_metrics.model_version = model_package_arn.split("/")[-1]
+batch_scorer = BatchScorer(
+    feature_groups_reader,
+    vector_assembler,
+    guarded_sm,
+    endpoint_name,
+    content_type,
+    score_cache=score_cache,
+    local_model=local_model,
+    features_types=os.getenv("features_types", ""),
+    inference_log=inference_log,
+    sketches=sketches,
+    serving_vectors=serving_vectors,
+)
+
+
+def prime_featurestore_connection():
+    """Open the connection to the online store during the init phase
+
+    The init phase runs with boosted CPU and before the first request is
+    received, so credentials resolution and the TLS handshake are paid there.
+    The sagemaker-runtime connection is not primed: any invocation would reach
+    the model and its data capture.
+    """
+    fg = feature_groups[0]
+    try:
+        featurestore_runtime.batch_get_record(
+            Identifiers=[
+                {
+                    "FeatureGroupName": fg["feature_group_name"],
+                    "RecordIdentifiersValueAsString": ["prime-connection"],
+                    "FeatureNames": fg["features_names"][:1],
+                }
+            ]
+        )
+    except Exception:
+        logger.warning("Failed to prime the online store connection", exc_info=True)
+
+
+def refresh_local_model():
+    """Follow newly approved model packages when scoring in process"""
+    if local_model is None:
+        return
+    local_model.refresh()
+    if local_model.ready:
+        score_cache.model_version = local_model.model_package_arn
+        stage_metrics.model_version = local_model.model_package_arn.split("/")[-1]
+
+
+if prime_connections:
+    prime_featurestore_connection()
+refresh_local_model()
+logger.info(f"init duration: {(time.perf_counter() - init_start) * 1000:.1f} ms")
 
 
 def lambda_handler(event, context):
+    refresh_local_model()
+    if known_identifiers is not None:
+        known_identifiers.refresh()
+    if snapshots is not None:
+        snapshots.refresh()
+    deadline = Deadline(
+        context.get_remaining_time_in_millis(),
+        budget_ms=resilience_conf.get("request_budget_ms", API_GATEWAY_TIMEOUT_MS),
+        margin_ms=resilience_conf.get("margin_ms", 200),
+    )
+    guarded_featurestore.begin(deadline)
+    guarded_sm.begin(deadline)
+    if batch_scores is not None:
+        batch_scores.dynamodb.begin(deadline)
+    timer = stage_metrics.timer()
+    if inference_log is not None:
+        inference_log.begin()
+    start = time.perf_counter()
+    response = None
+    try:
+        with timer.stage("TotalLatency"):
+            response = score_handler(event, timer)
+        return response
+    finally:
+        stage_metrics.emit(
+            timer,
+            counts={
+                "Hedges": guarded_featurestore.hedges,
+                "CircuitBreakerOpen": int(
+                    circuit_breaker.state != CircuitBreaker.CLOSED
+                ),
+            },
+            circuitBreakerState=circuit_breaker.state,
+            requestId=getattr(context, "aws_request_id", ""),
+            statusCode=response["statusCode"] if response else 500,
+        )
+        logger.info(f"record cache: {record_cache.stats()}")
+        logger.info(f"score cache: {score_cache.stats()}")
+        if snapshots is not None:
+            logger.info(f"snapshots: {snapshots.stats()}")
+        if serving_vectors is not None:
+            logger.info(f"serving vectors: {serving_vectors.stats()}")
+        if inference_log is not None:
+            inference_log.end(
+                (time.perf_counter() - start) * 1000,
+                stage_metrics.model_version,
+                getattr(context, "aws_request_id", ""),
+            )
+        end_invocation()
+
+
+def end_invocation():
+    """Flush the buffers that are due
+
+    They are flushed after the response by the extension or, when it could
+    not be registered, here at the end of the invocation.
+    """
+    if post_response_extension is not None:
+        post_response_extension.handled()
+    elif post_response_buffers:
+        flush_due(post_response_buffers)
+
+
+def score_handler(event, timer: StageTimer):
     # Get data from online feature store
     logger.info(event)
-    val_policy_id = str(event["queryStringParameters"]["policy_id"])
+    if event.get("httpMethod") == "POST" and claim_encoder is not None:
+        try:
+            body = get_json_body(event)
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and "claim" in body:
+            return claim_handler(body, timer)
 
-    claims_response = featurestore_runtime.get_record(
-        FeatureGroupName=claims_fg_name,
-        RecordIdentifierValueAsString=str(val_policy_id),
-    )
+    multi_params = event.get("multiValueQueryStringParameters") or {}
+    if event.get("httpMethod") == "POST" or len(multi_params.get("policy_id", [])) > 1:
+        return batch_handler(event, timer)
 
-    if claims_response.get("Record"):
-        claims_record = claims_response["Record"]
-        claims_df = pd.DataFrame(claims_record).set_index("FeatureName")
+    val_policy_id = str(event["queryStringParameters"]["policy_id"])
+    if tiered_scorer.policy == RACE:
+        result = score_race(val_policy_id, timer)
     else:
-        logging.info("No Record returned / Record Key in claims feature group\n")
+        result = tiered_scorer.score(
+            val_policy_id, lambda r: score_realtime(r, timer), timer
+        )
+    return score_response(val_policy_id, result)
+
+
+def score_race(val_policy_id: str, timer: StageTimer) -> dict:
+    """Race the real-time scoring of a policy against its batch score
+
+    The real-time scoring runs on a thread of the race and, when the batch
+    score wins, completes after the response, possibly during the next
+    invocations. It has its own timer, and the deadline of this request set
+    on its thread, so that no call outlives the request, and its vector is
+    kept aside: only its score cache write remains once the batch score is
+    returned. Its stages and vector are kept when it answers.
+    """
+    deadline = guarded_featurestore.deadline
+    race_timer = StageTimer() if timer is not NULL_TIMER else NULL_TIMER
+    vectors = {}
+
+    def realtime(r: str) -> dict:
+        guarded_featurestore.begin(deadline)
+        guarded_sm.begin(deadline)
+        return score_realtime(r, race_timer, vectors=vectors)
+
+    result = tiered_scorer.score(val_policy_id, realtime, timer)
+    if result.get("tier") != "batch":
+        # The real-time scoring completed
+        for name, ms in race_timer.timings.items():
+            timer.timings[name] = timer.timings.get(name, 0.0) + ms
+        if inference_log is not None and val_policy_id in vectors:
+            inference_log.observe(val_policy_id, vectors[val_policy_id])
+    return result
+
+
+def claim_handler(body: dict, timer: StageTimer):
+    """Score a claim sent as `{"policy_id": ..., "claim": {<raw claim fields>}}`
+
+    The claim does not need to be ingested yet: its record is encoded from
+    the raw fields and merged with the records of the other feature groups.
+    """
+    claim = body["claim"]
+    if not isinstance(claim, dict) or body.get("policy_id") is None:
         return {
-            "statusCode": 404,
-            "body": json.dumps({"Error": "Record not found in CLAIMS feature group"}),
+            "statusCode": 400,
+            "body": json.dumps(
+                {"Error": "Expected a JSON body with a policy_id and a claim object"}
+            ),
         }
+    val_policy_id = str(body["policy_id"])
+    try:
+        with timer.stage("EncodeClaimLatency"):
+            claim_record = claim_encoder.encode(claim)
+    except InvalidClaimError as e:
+        return {"statusCode": 400, "body": json.dumps({"Error": f"Invalid claim: {e}"})}
 
-    customers_response = featurestore_runtime.get_record(
-        FeatureGroupName=customers_fg_name,
-        RecordIdentifierValueAsString=str(val_policy_id),
+    result = score_realtime(
+        val_policy_id, timer, payload_records={payload_feature_group: claim_record}
     )
+    if result["statusCode"] == 200:
+        result = {**result, "tier": "realtime", "score_age_seconds": 0}
+    return score_response(val_policy_id, result)
 
-    if customers_response.get("Record"):
-        customer_record = customers_response["Record"]
-        customer_df = pd.DataFrame(customer_record).set_index("FeatureName")
-    else:
-        logging.info("No Record returned / Record Key in CUSTOMERS feature group\n")
+
+def score_response(val_policy_id: str, result: dict) -> dict:
+    if inference_log is not None:
+        inference_log.add(result)
+    if result["statusCode"] != 200:
         return {
-            "statusCode": 404,
-            "body": json.dumps(
-                {"Error": "Record not found in CUSTOMERS feature group"}
-            ),
+            "statusCode": result["statusCode"],
+            "body": json.dumps({"Error": result["Error"]}),
         }
+    return {
+        "statusCode": 200,
+        "body": json.dumps(
+            {
+                "policy_id": val_policy_id,
+                "score": result["score"],
+                "tier": result["tier"],
+                "score_age_seconds": result["score_age_seconds"],
+            }
+        ),
+    }
 
+
+def score_realtime(
+    val_policy_id: str,
+    timer: StageTimer,
+    payload_records: dict = None,
+    vectors: dict = None,
+) -> dict:
+    """Score one policy from its online features
+
+    Args:
+        val_policy_id (str): policy to score
+        timer (StageTimer): times the stages of the request
+        payload_records (dict, optional): records sent with the request, by
+            feature group name, these feature groups are not read
+        vectors (dict, optional): receives the scored vector, by policy,
+            instead of the inference log of the request
+
+    Returns:
+        dict: the `score`, or the `Error` with its `statusCode`
+    """
+    names = None
+    if payload_records:
+        names = [
+            fg["name"] for fg in feature_groups if fg["name"] not in payload_records
+        ]
     try:
-        blended_df = pd.concat([claims_df, customer_df]).loc[col_order]
-        data_input = ",".join(blended_df["ValueAsString"])
+        data_input = None
+        if serving_vectors is not None and not payload_records:
+            # Vector materialized by the ingestion pipeline, in model order
+            with timer.stage("FeatureStoreLatency"):
+                data_input = serving_vectors.get(val_policy_id)
+        if data_input is None:
+            with timer.stage("FeatureStoreLatency"):
+                records = feature_groups_reader.get_records(
+                    [val_policy_id], names
+                ).get(val_policy_id, {})
 
-        logging.info("data_input: ", data_input)
-        response = client_sm.invoke_endpoint(
-            EndpointName=endpoint_name, Body=data_input, ContentType=content_type
-        )
+            missing_fg = feature_groups_reader.missing_feature_group(
+                records, val_policy_id, names
+            )
+            if missing_fg:
+                logging.info(
+                    f"No Record returned / Record Key in {missing_fg} feature group\n"
+                )
+                return error_result(
+                    val_policy_id,
+                    404,
+                    f"Record not found in {missing_fg.upper()} feature group",
+                )
+
+            if payload_records:
+                records = {**records, **payload_records}
+            with timer.stage("AssembleLatency"):
+                data_input = vector_assembler.to_csv(
+                    *(records[fg["name"]] for fg in feature_groups)
+                )
+        if vectors is not None:
+            vectors[val_policy_id] = data_input
+        elif inference_log is not None:
+            inference_log.observe(val_policy_id, data_input)
 
-        score = json.loads(response["Body"].read())
+        logging.info(f"data_input: {data_input}")
+        with timer.stage("ScoreCacheLatency"):
+            score = score_cache.get(val_policy_id, data_input)
+        if score is None:
+            score = batch_scorer.predict([data_input], timer)[0]
+            score_cache.put(val_policy_id, data_input, score)
         logging.info(f"score: {score}")
 
-        return {
-            "statusCode": 200,
-            "body": json.dumps({"policy_id": val_policy_id, "score": score}),
-        }
+        return {"policy_id": val_policy_id, "statusCode": 200, "score": score}
+    except MissingFeatureError as e:
+        logging.exception("incomplete feature vector")
+        return error_result(val_policy_id, 500, str(e))
+    except CircuitOpenError as e:
+        logging.warning(str(e))
+        return error_result(val_policy_id, 503, "Endpoint unavailable, retry later")
+    except DeadlineExceeded as e:
+        logging.warning(str(e))
+        return error_result(
+            val_policy_id, 504, "Timed out calling downstream services"
+        )
     except Exception:
         logging.exception(f"internal error")
+        return error_result(
+            val_policy_id, 500, "internal error. Check Logs for more details"
+        )
+
+
+def error_result(val_policy_id: str, status_code: int, message: str) -> dict:
+    return {"policy_id": val_policy_id, "statusCode": status_code, "Error": message}
+
+
+def batch_handler(event, timer: StageTimer):
+    try:
+        policy_ids = get_batch_identifiers(event)
+    except (ValueError, KeyError, TypeError):
+        logging.exception("invalid batch request")
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"Error": "Expected a JSON body with policy_ids"}),
+        }
+
+    if len(policy_ids) > max_batch_size:
         return {
-            "statusCode": 500,
+            "statusCode": 413,
             "body": json.dumps(
-                {"Error": f"internal error. Check Logs for more details"}
+                {"Error": f"At most {max_batch_size} policy_ids per request"}
             ),
         }
+
+    results = tiered_scorer.score_many(
+        policy_ids, lambda ids: batch_scorer.score(ids, timer), timer
+    )
+    if inference_log is not None:
+        for r in results:
+            inference_log.add(r)
+    failed = sum(1 for r in results if r["statusCode"] != 200)
+    logging.info(f"scored {len(results) - failed} / {len(results)} policy_ids")
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"results": results, "failed": failed}),
+    }
@@ -0,0 +1,198 @@
+import logging
+import os
+import pickle
+import shutil
+import tarfile
+import threading
+import time
+from typing import Callable, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger()
+
+MODEL_FILE_NAME = "xgboost-model"
+COMPILED_MODEL_FILE_NAME = "xgboost-model.npz"
+# Output data of the training job, next to its model.tar.gz
+COMPILED_MODEL_ARCHIVE_NAME = "output.tar.gz"
+
+
+def get_model_package_arn(sm_client, model_package_group_name: str) -> str:
+    return sm_client.list_model_packages(
+        ModelPackageGroupName=model_package_group_name,
+        ModelApprovalStatus="Approved",
+        SortBy="CreationTime",
+        SortOrder="Descending",
+    )["ModelPackageSummaryList"][0]["ModelPackageArn"]
+
+
+class LocalModel(object):
+    """XGBoost model of the latest approved model package, scored in process.
+
+    The artifacts written by `xgboost_starter_script.py` are downloaded to
+    `model_dir`, which survives warm starts, and the model package group is
+    polled at most every `refresh_seconds`, on a background thread, so that
+    a newly approved model package is loaded without redeploying the Lambda
+    and without delaying a request. Only the artifacts of the loaded model
+    package are kept in `model_dir`. With the `compiled`
+    evaluator, the flattened trees (`xgboost-model.npz`), read from the
+    output data of the training job, are scored with numpy only; with
+    `xgboost`, the pickled booster of the model artifact is loaded with
+    xgboost.
+
+    Args:
+        sm_client: `sagemaker` boto3 client
+        s3_client: `s3` boto3 client
+        model_package_group_name (str): model package group to follow
+        refresh_seconds (float): minimum interval between registry checks
+        model_dir (str): local directory of the downloaded artifacts
+        evaluator (str): `compiled` or `xgboost`
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        sm_client,
+        s3_client,
+        model_package_group_name: str,
+        refresh_seconds: float = 300,
+        model_dir: str = "/tmp/model",
+        evaluator: str = "compiled",
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if evaluator not in ("compiled", "xgboost"):
+            raise ValueError(f"Unknown evaluator {evaluator}")
+        self.sm_client = sm_client
+        self.s3_client = s3_client
+        self.model_package_group_name = model_package_group_name
+        self.refresh_seconds = refresh_seconds
+        self.model_dir = model_dir
+        self.evaluator = evaluator
+        self.clock = clock
+        # Model package ARN and booster, replaced together
+        self._model = (None, None)
+        self._checked_at = None
+        self._refreshing = threading.Lock()
+
+    @property
+    def model_package_arn(self) -> str:
+        return self._model[0]
+
+    @property
+    def booster(self):
+        return self._model[1]
+
+    @property
+    def ready(self) -> bool:
+        return self.booster is not None
+
+    def check(self) -> None:
+        """Load the latest approved model package if it changed since last check
+
+        Errors are logged and the current model, if any, is kept.
+        """
+        self._checked_at = self.clock()
+        try:
+            model_package_arn = get_model_package_arn(
+                self.sm_client, self.model_package_group_name
+            )
+            if model_package_arn != self.model_package_arn:
+                self._model = (model_package_arn, self.load(model_package_arn))
+                logger.info(f"Loaded local model {model_package_arn}")
+        except Exception:
+            logger.exception("Failed to refresh the local model")
+        finally:
+            self._remove_other_versions()
+
+    def refresh(self) -> None:
+        """Check the model package group in the background when
+        `refresh_seconds` elapsed"""
+        if (
+            self._checked_at is not None
+            and self.clock() - self._checked_at < self.refresh_seconds
+        ):
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.check()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def load(self, model_package_arn: str):
+        model_data_url = self.sm_client.describe_model_package(
+            ModelPackageName=model_package_arn
+        )["InferenceSpecification"]["Containers"][0]["ModelDataUrl"]
+
+        # model package ARNs end with <group name>/<version>
+        version_dir = os.path.join(
+            self.model_dir, "-".join(model_package_arn.split("/")[-2:])
+        )
+        file_name, archive_url = MODEL_FILE_NAME, model_data_url
+        if self.evaluator == "compiled":
+            file_name = COMPILED_MODEL_FILE_NAME
+            archive_url = (
+                f"{model_data_url.rsplit('/', 1)[0]}/{COMPILED_MODEL_ARCHIVE_NAME}"
+            )
+        model_path = os.path.join(version_dir, file_name)
+        if not os.path.exists(model_path):
+            os.makedirs(version_dir, exist_ok=True)
+            url = urlparse(archive_url)
+            archive_path = os.path.join(version_dir, "archive.tar.gz")
+            self.s3_client.download_file(
+                Bucket=url.netloc, Key=url.path.lstrip("/"), Filename=archive_path
+            )
+            with tarfile.open(archive_path) as archive:
+                member = next(
+                    m
+                    for m in archive.getmembers()
+                    if os.path.basename(m.name) == file_name
+                )
+                with archive.extractfile(member) as src, open(
+                    f"{model_path}.part", "wb"
+                ) as dst:
+                    dst.write(src.read())
+            os.replace(f"{model_path}.part", model_path)
+            os.remove(archive_path)
+
+        return self.load_booster(model_path)
+
+    def _remove_other_versions(self) -> None:
+        """/tmp is limited, only keep the artifacts of the loaded version,
+        those of a failed load included"""
+        if not os.path.isdir(self.model_dir):
+            return
+        keep = None
+        if self.model_package_arn is not None:
+            keep = "-".join(self.model_package_arn.split("/")[-2:])
+        for entry in os.listdir(self.model_dir):
+            if entry != keep:
+                shutil.rmtree(os.path.join(self.model_dir, entry), ignore_errors=True)
+
+    def load_booster(self, model_path: str):
+        # numpy and xgboost are only needed, and imported, in local scoring mode
+        if self.evaluator == "compiled":
+            from tree_ensemble import TreeEnsemble
+
+            return TreeEnsemble.load(model_path)
+
+        import xgboost  # noqa: F401
+
+        with open(model_path, "rb") as f:
+            return pickle.load(f)
+
+    def predict(self, lines: List[str]) -> List[float]:
+        """Score CSV feature vectors, in model order"""
+        if self.evaluator == "compiled":
+            return self.booster.predict_csv(lines)
+
+        import numpy as np
+        import xgboost
+
+        data = np.array(
+            [[float(v) for v in line.split(",")] for line in lines], dtype=np.float32
+        )
+        return self.booster.predict(xgboost.DMatrix(data)).tolist()
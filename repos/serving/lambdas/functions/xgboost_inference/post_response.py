@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import signal
+import threading
+import urllib.request
+from typing import Dict, Optional
+
+logger = logging.getLogger()
+
+
+def flush_due(buffers: Dict[str, object]) -> None:
+    """Flush the buffers that are due, logging the failures"""
+    for name, buffer in buffers.items():
+        try:
+            if buffer.is_due():
+                buffer.flush()
+        except Exception:
+            logger.exception(f"Failed to flush the {name}")
+
+
+def close_all(buffers: Dict[str, object]) -> None:
+    """Flush all the buffers before shutdown, logging their stats"""
+    for name, buffer in buffers.items():
+        logger.info(f"Shutting down, {name}: {buffer.stats()}")
+        try:
+            buffer.close()
+        except Exception:
+            logger.exception(f"Failed to flush the {name}")
+
+
+class PostResponseExtension(object):
+    """Internal Lambda extension flushing buffers after the response is sent.
+
+    The extension registers with the Extensions API during the init phase and
+    runs on its own thread. Lambda returns the response as soon as the handler
+    does, but only freezes the execution environment once the extension asks
+    for the next event: the buffers are flushed in between, when `is_due`,
+    and do not delay the caller. A registered extension also has the runtime
+    sent a SIGTERM before shutdown, on which all buffers are flushed.
+
+    Args:
+        buffers (Dict[str, object]): name -> buffer, with `is_due`, `flush`,
+            `close` and `stats` methods, e.g. `InferenceLog` or
+            `FeatureSketches`
+        runtime_api (str): host:port of the Lambda runtime API
+    """
+
+    def __init__(self, buffers: Dict[str, object], runtime_api: str) -> None:
+        self.buffers = buffers
+        self.base_url = f"http://{runtime_api}/2020-01-01/extension"
+        self.extension_id = None
+        self._handled = threading.Event()
+
+    @classmethod
+    def start(cls, buffers: Dict[str, object]) -> Optional["PostResponseExtension"]:
+        """Register the extension, None outside of Lambda or if it failed"""
+        runtime_api = os.getenv("AWS_LAMBDA_RUNTIME_API")
+        if not runtime_api:
+            return None
+        extension = cls(buffers, runtime_api)
+        try:
+            extension._register()
+        except Exception:
+            logger.exception("Failed to register the post-response extension")
+            return None
+        threading.Thread(target=extension._run, daemon=True).start()
+        signal.signal(signal.SIGTERM, extension._on_sigterm)
+        return extension
+
+    def handled(self) -> None:
+        """Signal the end of the handler, called by each invocation"""
+        self._handled.set()
+
+    def _register(self) -> None:
+        request = urllib.request.Request(
+            f"{self.base_url}/register",
+            data=json.dumps({"events": ["INVOKE"]}).encode("utf-8"),
+            headers={"Lambda-Extension-Name": "post_response"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            self.extension_id = response.headers["Lambda-Extension-Identifier"]
+
+    def _next(self) -> dict:
+        request = urllib.request.Request(
+            f"{self.base_url}/event/next",
+            headers={"Lambda-Extension-Identifier": self.extension_id},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def _run(self) -> None:
+        while True:
+            self._next()
+            # The INVOKE event arrives as the handler starts
+            self._handled.wait()
+            self._handled.clear()
+            flush_due(self.buffers)
+
+    def _on_sigterm(self, signum, frame) -> None:
+        close_all(self.buffers)
+        raise SystemExit(0)
@@ -0,0 +1,144 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+def parse_event_time(value: str):
+    """Event times are either fractional seconds or ISO-8601 strings"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def record_size(record: List[dict]) -> int:
+    """Approximate memory footprint of a `Record` list, in bytes"""
+    size = sys.getsizeof(record)
+    for feature in record:
+        size += sys.getsizeof(feature)
+        for v in feature.values():
+            size += sys.getsizeof(v)
+    return size
+
+
+class RecordCache(object):
+    """In-process TTL/LRU cache of online feature store records.
+
+    Created at module scope, it survives warm invocations of the Lambda.
+    Entries are keyed by (feature group name, record identifier) and expire
+    after the TTL of their feature group; the least recently used entries are
+    evicted once `max_entries` or `max_bytes` is exceeded.
+
+    Args:
+        feature_groups (Dict[str, dict]): feature group name (as in the
+            configuration) -> `{"ttl_seconds": ..., "invalidate_on_event_time": ...}`.
+            Feature groups not listed are never cached.
+        max_entries (int): maximum number of cached records
+        max_bytes (int): maximum approximate memory used by cached records
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        feature_groups: Dict[str, dict],
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.feature_groups = {
+            k: o for k, o in feature_groups.items() if o.get("ttl_seconds", 0) > 0
+        }
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def is_cached(self, feature_group: str) -> bool:
+        return feature_group in self.feature_groups
+
+    def revalidates(self, feature_group: str) -> bool:
+        """Whether cached records are checked against the online store event time"""
+        return self.feature_groups.get(feature_group, {}).get(
+            "invalidate_on_event_time", False
+        )
+
+    def get(self, feature_group: str, record_identifier: str) -> Optional[List[dict]]:
+        key = (feature_group, record_identifier)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, record, _ = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return record
+
+    def event_time(self, feature_group: str, record_identifier: str):
+        entry = self._entries.get((feature_group, record_identifier))
+        return entry[1] if entry else None
+
+    def put(
+        self,
+        feature_group: str,
+        record_identifier: str,
+        record: List[dict],
+        event_time: str = None,
+    ) -> None:
+        """Cache a record, unless a record with a later event time is cached"""
+        if not self.is_cached(feature_group):
+            return
+        key = (feature_group, record_identifier)
+        event_time = parse_event_time(event_time)
+        cached = self._entries.get(key)
+        if cached is not None:
+            if (
+                event_time is not None
+                and cached[1] is not None
+                and event_time < cached[1]
+            ):
+                return
+            self._remove(key)
+
+        size = record_size(record)
+        if size > self.max_bytes:
+            return
+        expires_at = self.clock() + self.feature_groups[feature_group]["ttl_seconds"]
+        self._entries[key] = (expires_at, event_time, record, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, feature_group: str, record_identifier: str) -> None:
+        key = (feature_group, record_identifier)
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def is_stale(self, feature_group: str, record_identifier: str, event_time: str) -> bool:
+        """Whether the online store holds a record newer than the cached one"""
+        cached = self.event_time(feature_group, record_identifier)
+        return cached is None or parse_event_time(event_time) > cached
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remove(self, key) -> None:
+        self._bytes -= self._entries.pop(key)[3]
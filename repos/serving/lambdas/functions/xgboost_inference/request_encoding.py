@@ -0,0 +1,148 @@
+import math
+import struct
+from typing import Callable, List
+
+CSV_CONTENT_TYPE = "text/csv"
+LIBSVM_CONTENT_TYPE = "text/libsvm"
+RECORDIO_PROTOBUF_CONTENT_TYPE = "application/x-recordio-protobuf"
+
+# Feature types of the feature store, one letter per feature in the
+# `features_types` Lambda environment variable
+FEATURE_TYPE_CODES = {"Integral": "I", "Fractional": "F", "String": "S"}
+
+# RecordIO framing of the SageMaker built-in algorithms
+_RECORDIO_MAGIC = struct.pack("<I", 0xCED7230A)
+_RECORDIO_PADDING = [b"", b"\x00\x00\x00", b"\x00\x00", b"\x00"]
+
+
+def _format_integral(value: float) -> str:
+    return str(int(value))
+
+
+_FLOAT32 = struct.Struct("<f")
+
+
+def _to_float32(value: float) -> float:
+    return _FLOAT32.unpack(_FLOAT32.pack(value))[0]
+
+
+def _format_fractional(value: float) -> str:
+    # Shortest text that reads back as the float32 value, the precision the
+    # model works at: 9 significant digits always do, and any precision above
+    # one that does also does, so search for the lowest
+    value = _to_float32(value)
+    low, high = 1, 9
+    text = f"{value:.9g}"
+    while low < high:
+        precision = (low + high) // 2
+        candidate = f"{value:.{precision}g}"
+        if _to_float32(float(candidate)) == value:
+            high, text = precision, candidate
+        else:
+            low = precision + 1
+    if text in ("inf", "-inf", "nan"):
+        return text
+    # `g` switches to an exponent from `precision` integer digits on
+    positional = repr(float(text))
+    if positional.endswith(".0"):
+        positional = positional[:-2]
+    return min(text, positional, key=len)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _length_delimited(tag: int, payload: bytes) -> bytes:
+    return bytes([tag]) + _varint(len(payload)) + payload
+
+
+class RequestEncoder(object):
+    """Encode CSV feature vectors into the body of an endpoint invocation.
+
+    Feature vectors are assembled as CSV lines, which also key the score cache
+    and feed the local model. Other content types convert the values to the
+    float32 the model is evaluated on, and write them according to their
+    feature store type, Integral or Fractional:
+
+    - `text/csv`: the lines, unchanged
+    - `text/libsvm`: `index:value` pairs. Zeros are written as well, XGBoost
+      reads an absent entry as missing, not as 0, and would take the default
+      branch of the splits. Only NaN values, missing in the CSV lines too,
+      are left out. Integral values are written as integers, Fractional ones
+      with float32 precision
+    - `application/x-recordio-protobuf`: one dense float32 tensor per record,
+      as written by `sagemaker.amazon.common.write_numpy_to_dense_tensor`
+
+    Args:
+        content_type (str): content type of the invocations
+        features_types (str): one type code per feature, in model order, see
+            FEATURE_TYPE_CODES. Defaults to Fractional for all features.
+    """
+
+    def __init__(self, content_type: str, features_types: str = "") -> None:
+        encoders = {
+            CSV_CONTENT_TYPE: self._encode_csv,
+            LIBSVM_CONTENT_TYPE: self._encode_libsvm,
+            RECORDIO_PROTOBUF_CONTENT_TYPE: self._encode_recordio_protobuf,
+        }
+        if content_type not in encoders:
+            raise ValueError(f"Unsupported content type {content_type}")
+        if "S" in features_types:
+            raise ValueError("String features must be encoded before scoring")
+        self.content_type = content_type
+        self.encode_row: Callable[[str], bytes] = encoders[content_type]
+        self._formatters = [
+            _format_integral if code == "I" else _format_fractional
+            for code in features_types
+        ]
+        self._separator = b"" if content_type == RECORDIO_PROTOBUF_CONTENT_TYPE else b"\n"
+
+    def values(self, line: str) -> List[float]:
+        """Values of a CSV feature vector"""
+        values = list(map(float, line.split(",")))
+        if self._formatters and len(values) != len(self._formatters):
+            raise ValueError(
+                f"Expected {len(self._formatters)} features, got {len(values)}"
+            )
+        return values
+
+    def row_size(self, row: bytes) -> int:
+        """Size of an encoded row in a payload, separator included"""
+        return len(row) + len(self._separator)
+
+    def join(self, rows: List[bytes]) -> bytes:
+        """Payload of a multi-row invocation"""
+        return self._separator.join(rows)
+
+    def _encode_csv(self, line: str) -> bytes:
+        return line.encode("utf-8")
+
+    def _encode_libsvm(self, line: str) -> bytes:
+        values = self.values(line)
+        formatters = self._formatters or [_format_fractional] * len(values)
+        pairs = " ".join(
+            f"{i}:{formatters[i](v)}" for i, v in enumerate(values) if not math.isnan(v)
+        )
+        # The label is ignored at inference but expected by the parser
+        return f"0 {pairs}".encode("utf-8")
+
+    def _encode_recordio_protobuf(self, line: str) -> bytes:
+        values = self.values(line)
+        # Record { features: map<string, Value> } with a single "values" entry,
+        # Value { float32_tensor: Float32Tensor { repeated float values } }
+        tensor = _length_delimited(0x0A, struct.pack(f"<{len(values)}f", *values))
+        value = _length_delimited(0x12, tensor)
+        entry = _length_delimited(0x0A, b"values") + _length_delimited(0x12, value)
+        record = _length_delimited(0x0A, entry)
+        return (
+            _RECORDIO_MAGIC
+            + struct.pack("<I", len(record))
+            + record
+            + _RECORDIO_PADDING[len(record) % 4]
+        )
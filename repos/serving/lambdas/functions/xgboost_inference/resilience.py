@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+logger = logging.getLogger()
+
+# API Gateway integrations time out after 29 seconds, whatever the Lambda timeout
+API_GATEWAY_TIMEOUT_MS = 29000
+
+
+class DeadlineExceeded(TimeoutError):
+    """A downstream call did not complete within its timeout or the request deadline"""
+
+
+class CircuitOpenError(Exception):
+    """The endpoint circuit breaker is open, the call was not attempted"""
+
+
+class Deadline(object):
+    """Time left to answer a request
+
+    Args:
+        remaining_ms (float): time left, e.g. `context.get_remaining_time_in_millis()`
+        budget_ms (float): cap of the time left, the API Gateway timeout
+        margin_ms (float): time kept to build and return the response
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        remaining_ms: float,
+        budget_ms: float = API_GATEWAY_TIMEOUT_MS,
+        margin_ms: float = 200,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.expires_at = clock() + (min(remaining_ms, budget_ms) - margin_ms) / 1000
+
+    def remaining(self) -> float:
+        """Seconds left, negative once expired"""
+        return self.expires_at - self.clock()
+
+
+class LatencyTracker(object):
+    """Rolling window of call latencies, in seconds"""
+
+    def __init__(self, window: int = 200) -> None:
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def observe(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class CircuitBreaker(object):
+    """Stop calling a failing or slow dependency for a while.
+
+    The outcome of the last `window` calls is tracked, a call slower than
+    `slow_call_ms` counting as a failure. Once at least `min_calls` outcomes
+    are known and the failure rate reaches `failure_rate`, the breaker opens
+    and calls fail fast for `open_seconds`. It then lets one trial call
+    through (half-open), which closes it on success or opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        slow_call_ms: float = 2000,
+        window: int = 20,
+        min_calls: int = 10,
+        open_seconds: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call_ms / 1000
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            # Only the trial call goes through while half-open
+            return self.state == self.CLOSED
+
+    def record(self, success: bool, latency: float) -> None:
+        failure = not success or latency > self.slow_call
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failure:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failure)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit breaker open for {self.open_seconds} seconds")
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+
+
+class GuardedClient(object):
+    """Bound the calls of a boto3 client by a timeout and the request deadline.
+
+    Calls run on worker threads so that the caller stops waiting at the
+    timeout; the abandoned call ends at the client `read_timeout`. `hedged`
+    operations get a duplicate call when the first one is slower than the
+    `hedge_quantile` of their recent latencies, which suits reads: a
+    duplicate endpoint invocation would score the request twice. The
+    `guarded` operations go through the `circuit_breaker`.
+
+    The deadline and the hedge count are those of the calling thread: a call
+    left running on another thread, such as the real-time scoring of a race,
+    keeps the deadline it began with and does not count in the next request.
+
+    Abandoned calls keep their worker until they end, the executor should
+    not be shared with other clients, and no hedge is sent while
+    `max_in_flight` calls, abandoned ones included, hold a worker.
+
+    Args:
+        client: boto3 client
+        executor (ThreadPoolExecutor): runs the calls
+        timeout_ms (float): timeout of a call, hedge included
+        hedged (tuple): names of the operations to hedge
+        hedge_quantile (float): quantile of the latencies used as hedge delay
+        hedge_min_delay_ms (float): lower bound of the hedge delay
+        hedge_default_delay_ms (float): hedge delay until enough latencies are known
+        circuit_breaker (CircuitBreaker): breaker of the `guarded` operations
+        guarded (tuple): names of the operations behind the breaker
+        max_in_flight (int, optional): calls in flight from which hedges are
+            not sent, usually the workers of the executor
+    """
+
+    def __init__(
+        self,
+        client,
+        executor: ThreadPoolExecutor,
+        timeout_ms: float,
+        hedged: tuple = (),
+        hedge_quantile: float = 0.95,
+        hedge_min_delay_ms: float = 10,
+        hedge_default_delay_ms: float = 50,
+        circuit_breaker: CircuitBreaker = None,
+        guarded: tuple = (),
+        max_in_flight: Optional[int] = None,
+    ) -> None:
+        self.client = client
+        self.executor = executor
+        self.timeout = timeout_ms / 1000
+        self.hedged = hedged
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.hedge_default_delay = hedge_default_delay_ms / 1000
+        self.circuit_breaker = circuit_breaker
+        self.guarded = guarded
+        self.max_in_flight = max_in_flight
+        self.latencies = LatencyTracker()
+        self._request = threading.local()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def deadline(self) -> Optional[Deadline]:
+        """Deadline of the request of the calling thread"""
+        return getattr(self._request, "deadline", None)
+
+    @property
+    def in_flight(self) -> int:
+        """Calls submitted to the executor and not ended, abandoned included"""
+        return self._in_flight
+
+    @property
+    def hedges(self) -> int:
+        """Hedged calls of the request of the calling thread"""
+        return getattr(self._request, "hedges", 0)
+
+    def begin(self, deadline: Optional[Deadline]) -> None:
+        """Start a new request on the calling thread: set its deadline and
+        reset the hedge count"""
+        self._request.deadline = deadline
+        self._request.hedges = 0
+
+    def __getattr__(self, name: str):
+        operation = getattr(self.client, name)
+        if not callable(operation) or name.startswith("_"):
+            return operation
+
+        def call(**kwargs):
+            return self._call(name, lambda: operation(**kwargs))
+
+        return call
+
+    def _call(self, name: str, fn: Callable):
+        timeout = self.timeout
+        deadline = self.deadline
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        if timeout <= 0:
+            raise DeadlineExceeded(f"No time left to call {name}")
+
+        breaker = self.circuit_breaker if name in self.guarded else None
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker open, {name} not called")
+
+        start = time.monotonic()
+        try:
+            hedge_delay = self._hedge_delay() if name in self.hedged else None
+            result = self._run(fn, timeout, hedge_delay)
+        except Exception:
+            if breaker is not None:
+                breaker.record(False, time.monotonic() - start)
+            raise
+        latency = time.monotonic() - start
+        self.latencies.observe(latency)
+        if breaker is not None:
+            breaker.record(True, latency)
+        return result
+
+    def _hedge_delay(self) -> float:
+        if len(self.latencies) < 20:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, self.latencies.quantile(self.hedge_quantile))
+
+    def _submit(self, fn: Callable):
+        with self._in_flight_lock:
+            self._in_flight += 1
+        future = self.executor.submit(fn)
+        future.add_done_callback(self._ended)
+        return future
+
+    def _ended(self, future) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def _run(self, fn: Callable, timeout: float, hedge_delay: Optional[float]):
+        expires_at = time.monotonic() + timeout
+        futures = [self._submit(fn)]
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            # A hedge waiting for a worker would not answer sooner
+            if not done and (
+                self.max_in_flight is None or self.in_flight < self.max_in_flight
+            ):
+                futures.append(self._submit(fn))
+                self._request.hedges = self.hedges + 1
+
+        pending, error = set(futures), None
+        try:
+            while pending:
+                done, pending = wait(
+                    pending,
+                    timeout=max(0, expires_at - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            if not pending:
+                raise error
+            raise DeadlineExceeded(f"Call timed out after {timeout * 1000:.0f} ms")
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,71 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+def fingerprint(data_input: str) -> str:
+    """Fingerprint of an assembled feature vector"""
+    return hashlib.blake2b(data_input.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ScoreCache(object):
+    """In-process TTL/LRU memoization of endpoint scores.
+
+    Scores are keyed by (record identifier, model version, feature vector
+    fingerprint), so a score is reused only when the same model is asked about
+    exactly the same features. The model version is the model package ARN
+    deployed by ModelEndpointConstruct: deploying a new package updates the
+    Lambda environment, which both changes the key and recycles the containers.
+
+    Args:
+        model_version (str): deployed model package ARN
+        ttl_seconds (float): time to live of the scores, 0 disables the cache
+        max_entries (int): maximum number of cached scores
+        clock (Callable): monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        model_version: str,
+        ttl_seconds: float = 0,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.model_version = model_version
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, record_identifier: str, data_input: str) -> Optional[float]:
+        if not self.enabled:
+            return None
+        key = (record_identifier, self.model_version, fingerprint(data_input))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, record_identifier: str, data_input: str, score: float) -> None:
+        if not self.enabled:
+            return
+        key = (record_identifier, self.model_version, fingerprint(data_input))
+        self._entries[key] = (self.clock() + self.ttl_seconds, score)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
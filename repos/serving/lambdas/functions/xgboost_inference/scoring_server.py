@@ -0,0 +1,390 @@
+"""Long-lived scoring server, an alternative to one Lambda invocation per request.
+
+Serves the `/get-<endpoint_name>?policy_id=` contract of the API Gateway
+integration of ModelEndpointConstruct, with the same responses as
+`lambda_function.lambda_handler`, and is configured by the same environment
+variables. Concurrent requests are coalesced into micro-batches, bounded by
+a maximum size and a maximum wait, and each batch is scored by the
+`TieredScorer` of the Lambda, with `BatchScorer.score`: one BatchGetRecord
+and one multi-row `invoke_endpoint`.
+
+`GET /metrics` returns the queue depth and batch size histograms, and the
+number of requests rejected. Requests are answered 503 once `--max-queue-size`
+requests are waiting, so that an overloaded server sheds load instead of
+queueing it, and each micro-batch is scored within `--deadline-ms`, as a
+Lambda invocation within its request budget.
+
+Each micro-batch is one request of the inference log. There is no
+post-response extension outside of Lambda: the inference log and the
+feature sketches are flushed every `--flush-seconds` when due, off the
+event loop, and closed on shutdown.
+
+Usage:
+    python scoring_server.py --port 8080 --max-batch-size 100 --max-wait-ms 5
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import signal
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from batch_scoring import get_batch_identifiers
+from feature_store import MAX_RECORDS_PER_FEATURE_GROUP
+from post_response import close_all, flush_due
+from resilience import API_GATEWAY_TIMEOUT_MS, Deadline
+
+logger = logging.getLogger()
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while the queue of the batcher is full"""
+
+
+class Histogram(object):
+    """Counts of observed values in power of two buckets"""
+
+    def __init__(self, max_value: int) -> None:
+        self.bounds = [0]
+        while self.bounds[-1] < max_value:
+            self.bounds.append(max(1, self.bounds[-1] * 2))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value: int) -> None:
+        idx = next(
+            (i for i, bound in enumerate(self.bounds) if value <= bound),
+            len(self.bounds),
+        )
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class MicroBatcher(object):
+    """Coalesce concurrent requests into batches scored off the event loop.
+
+    A batch is dispatched when it holds `max_batch_size` requests, or
+    `max_wait_ms` after its first request. Batches are scored one at a time
+    on a single worker thread, since the caches of the scoring path are not
+    thread safe; requests received meanwhile form the next batch.
+
+    Args:
+        score_batch (Callable): scores a list of identifiers, returning one
+            result per distinct identifier as `BatchScorer.score`
+        max_batch_size (int): maximum identifiers per batch, at most
+            MAX_RECORDS_PER_FEATURE_GROUP for a single BatchGetRecord call
+        max_wait_ms (float): maximum wait of the first request of a batch
+        max_queue_size (int): maximum number of waiting requests, the next
+            ones are rejected
+    """
+
+    def __init__(
+        self,
+        score_batch: Callable[[List[str]], List[dict]],
+        max_batch_size: int = MAX_RECORDS_PER_FEATURE_GROUP,
+        max_wait_ms: float = 5,
+        max_queue_size: int = 1000,
+    ) -> None:
+        self.score_batch = score_batch
+        self.max_batch_size = min(max_batch_size, MAX_RECORDS_PER_FEATURE_GROUP)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue: asyncio.Queue = None
+        self.queue_depth = Histogram(4096)
+        self.batch_size = Histogram(self.max_batch_size)
+        self.rejected = 0
+        self._task = None
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, policy_id: str) -> dict:
+        """Score one identifier, as part of the next batch
+
+        Raises:
+            QueueFullError: if `max_queue_size` requests are already waiting
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue_depth.observe(self.queue.qsize())
+        try:
+            self.queue.put_nowait((policy_id, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"{self.queue.qsize()} requests waiting")
+        return await future
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "rejected": self.rejected,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_size.observe(len(batch))
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.score_batch, [policy_id for policy_id, _ in batch]
+            )
+            results = {r["policy_id"]: r for r in results}
+            for policy_id, future in batch:
+                if not future.done():
+                    future.set_result(results[policy_id])
+        except Exception as e:
+            logger.exception("internal error")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class ScoringServer(object):
+    """Minimal HTTP/1.1 server of the scoring API, with keep-alive
+
+    Args:
+        batcher (MicroBatcher): scores the requested identifiers
+        endpoint_name (str): name of the endpoint, in the `/get-` path
+    """
+
+    def __init__(self, batcher: MicroBatcher, endpoint_name: str) -> None:
+        self.batcher = batcher
+        self.path = f"/get-{endpoint_name}"
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        self.batcher.start()
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.route(method, target, body)
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(data)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                        "\r\n"
+                    ).encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, target: str, body: bytes) -> Tuple[int, dict]:
+        url = urlsplit(target)
+        if url.path == "/metrics" and method == "GET":
+            return 200, self.batcher.metrics()
+        if url.path != self.path or method not in ("GET", "POST"):
+            return 404, {"Error": "Not found"}
+
+        policy_ids = parse_qs(url.query).get("policy_id", [])
+        if method == "GET" and len(policy_ids) == 1:
+            return self.to_response(await self.score(policy_ids[0]))
+
+        try:
+            policy_ids = get_batch_identifiers(
+                {"body": body.decode("utf-8")}
+                if method == "POST"
+                else {"multiValueQueryStringParameters": {"policy_id": policy_ids}}
+            )
+        except (ValueError, KeyError, TypeError):
+            return 400, {"Error": "Expected a JSON body with policy_ids"}
+        if not policy_ids:
+            return 400, {"Error": "Expected a policy_id"}
+        results = await asyncio.gather(
+            *(self.score(p) for p in dict.fromkeys(policy_ids))
+        )
+        failed = sum(1 for r in results if r["statusCode"] != 200)
+        return 200, {"results": results, "failed": failed}
+
+    async def score(self, policy_id: str) -> dict:
+        try:
+            return await self.batcher.submit(str(policy_id))
+        except QueueFullError:
+            return {
+                "policy_id": policy_id,
+                "statusCode": 503,
+                "Error": "Server overloaded, retry later",
+            }
+        except Exception:
+            return {
+                "policy_id": policy_id,
+                "statusCode": 500,
+                "Error": "internal error. Check Logs for more details",
+            }
+
+    @staticmethod
+    def to_response(result: dict) -> Tuple[int, dict]:
+        if result["statusCode"] == 200:
+            return 200, {
+                "policy_id": result["policy_id"],
+                "score": result["score"],
+                "tier": result["tier"],
+                "score_age_seconds": result["score_age_seconds"],
+            }
+        return result["statusCode"], {"Error": result["Error"]}
+
+
+def score_batch(
+    policy_ids: List[str], deadline_ms: float = API_GATEWAY_TIMEOUT_MS
+) -> List[dict]:
+    import lambda_function
+
+    # Downstream calls and their retries stop at the deadline of the batch,
+    # the responses are written by the event loop
+    deadline = Deadline(deadline_ms, budget_ms=deadline_ms, margin_ms=0)
+    lambda_function.guarded_featurestore.begin(deadline)
+    lambda_function.guarded_sm.begin(deadline)
+    if lambda_function.batch_scores is not None:
+        lambda_function.batch_scores.dynamodb.begin(deadline)
+    lambda_function.refresh_local_model()
+    # Reloaded in the background, as by `lambda_handler`
+    if lambda_function.known_identifiers is not None:
+        lambda_function.known_identifiers.refresh()
+    if lambda_function.snapshots is not None:
+        lambda_function.snapshots.refresh()
+    inference_log = lambda_function.inference_log
+    if inference_log is not None:
+        inference_log.begin()
+    start = time.perf_counter()
+    # Races are not run for many identifiers, `race` is `prefer-realtime`
+    results = lambda_function.tiered_scorer.score_many(
+        policy_ids, lambda_function.batch_scorer.score
+    )
+    if inference_log is not None:
+        for r in results:
+            inference_log.add(r)
+        inference_log.end(
+            (time.perf_counter() - start) * 1000,
+            lambda_function.stage_metrics.model_version,
+            f"micro-batch-{uuid.uuid4().hex}",
+        )
+    return results
+
+
+async def flush_buffers(buffers: Dict[str, object], interval: float) -> None:
+    """Flush the due buffers every `interval` seconds, on a worker thread"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, flush_due, buffers)
+
+
+async def main(args) -> None:
+    # The scoring path is configured by the Lambda environment variables
+    import lambda_function
+
+    # The inference log and the feature sketches
+    buffers = lambda_function.post_response_buffers
+    deadline_ms = args.deadline_ms or lambda_function.resilience_conf.get(
+        "request_budget_ms", API_GATEWAY_TIMEOUT_MS
+    )
+    batcher = MicroBatcher(
+        functools.partial(score_batch, deadline_ms=deadline_ms),
+        args.max_batch_size,
+        args.max_wait_ms,
+        args.max_queue_size,
+    )
+    server = await ScoringServer(batcher, lambda_function.endpoint_name).serve(
+        args.host, args.port
+    )
+    flusher = asyncio.get_running_loop().create_task(
+        flush_buffers(buffers, args.flush_seconds)
+    )
+    # Container runtimes stop the server with a SIGTERM
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    logger.info(f"Serving /get-{lambda_function.endpoint_name} on port {args.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        flusher.cancel()
+        await batcher.stop()
+        close_all(buffers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--max-batch-size", type=int, default=MAX_RECORDS_PER_FEATURE_GROUP
+    )
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--max-queue-size", type=int, default=1000)
+    # The request budget of the resilience configuration by default
+    parser.add_argument("--deadline-ms", type=float, default=None)
+    parser.add_argument("--flush-seconds", type=float, default=1)
+    asyncio.run(main(parser.parse_args()))
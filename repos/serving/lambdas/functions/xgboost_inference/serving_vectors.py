@@ -0,0 +1,86 @@
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from feature_store import MAX_RECORDS_PER_FEATURE_GROUP, FeatureStoreReadError
+
+logger = logging.getLogger()
+
+VECTOR_FEATURE_NAME = "vector"
+LAYOUT_VERSION_FEATURE_NAME = "layout_version"
+
+
+def layout_version(features_names: List[str]) -> str:
+    """Version of a vector layout, the hash of its ordered features names
+
+    Computed as by `scripts/build_serving_vectors.py` of the feature
+    ingestion pipeline.
+    """
+    return hashlib.sha256(",".join(features_names).encode("utf-8")).hexdigest()[:16]
+
+
+class ServingVectorReader(object):
+    """Read the model vectors materialized in the serving feature group.
+
+    The feature ingestion pipeline joins the records of the source feature
+    groups after each ingestion and writes, for each record identifier, the
+    CSV model vector, in model order, and its layout version. A vector is only
+    used when its layout is the layout of the model: others, and identifiers
+    without a vector, are read from the source feature groups and assembled.
+
+    Args:
+        featurestore_runtime: `sagemaker-featurestore-runtime` boto3 client
+        feature_group_name (str): serving feature group
+        features_names (List[str]): features of the model, in model order
+    """
+
+    def __init__(
+        self, featurestore_runtime, feature_group_name: str, features_names: List[str]
+    ) -> None:
+        self.featurestore_runtime = featurestore_runtime
+        self.feature_group_name = feature_group_name
+        self.layout_version = layout_version(features_names)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, record_identifier: str) -> Optional[str]:
+        """CSV vector of an identifier, None if there is none of this layout"""
+        return self.get_many([record_identifier]).get(record_identifier)
+
+    def get_many(self, record_identifiers: List[str]) -> Dict[str, str]:
+        """CSV vectors of identifiers, by identifier, missing ones left out
+
+        Raises:
+            FeatureStoreReadError: if the service reports errors
+        """
+        vectors = {}
+        for i in range(0, len(record_identifiers), MAX_RECORDS_PER_FEATURE_GROUP):
+            chunk = record_identifiers[i : i + MAX_RECORDS_PER_FEATURE_GROUP]
+            response = self.featurestore_runtime.batch_get_record(
+                Identifiers=[
+                    {
+                        "FeatureGroupName": self.feature_group_name,
+                        "RecordIdentifiersValueAsString": chunk,
+                        "FeatureNames": [
+                            VECTOR_FEATURE_NAME,
+                            LAYOUT_VERSION_FEATURE_NAME,
+                        ],
+                    }
+                ]
+            )
+            if response.get("Errors"):
+                logger.error(response["Errors"])
+                raise FeatureStoreReadError(response["Errors"][0]["ErrorMessage"])
+            # Unprocessed identifiers are read from the source feature groups
+            for r in response.get("Records", []):
+                values = {f["FeatureName"]: f["ValueAsString"] for f in r["Record"]}
+                if values.get(LAYOUT_VERSION_FEATURE_NAME) == self.layout_version:
+                    vectors[r["RecordIdentifierValueAsString"]] = values[
+                        VECTOR_FEATURE_NAME
+                    ]
+        self.hits += len(vectors)
+        self.misses += len(record_identifiers) - len(vectors)
+        return vectors
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,117 @@
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict
+
+
+def _stdout_sink(record: dict) -> None:
+    # EMF records must be whole log lines, without the logging prefix
+    sys.stdout.write(json.dumps(record) + "\n")
+
+
+class StageTimer(object):
+    """Time the stages of one request with a monotonic clock, in milliseconds
+
+    A stage timed more than once, e.g. once per chunk, adds up.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.timings[name] = (
+                self.timings.get(name, 0.0) + (self.clock() - start) * 1000
+            )
+
+
+class _NullTimer(StageTimer):
+    """Timer of the requests that are not sampled, times nothing"""
+
+    _context = nullcontext()
+
+    def __init__(self) -> None:
+        self.timings = {}
+
+    def stage(self, name: str):
+        return self._context
+
+
+NULL_TIMER = _NullTimer()
+
+
+class StageMetrics(object):
+    """Emit the stage timings of sampled requests as CloudWatch EMF records.
+
+    Records are written to stdout by default, where the Lambda log agent turns
+    Embedded Metric Format records into metrics, one per stage, with the
+    endpoint name and model version as dimensions. Any other `sink` callable,
+    e.g. `list.append`, receives the same records.
+
+    Args:
+        namespace (str): CloudWatch namespace of the metrics
+        endpoint_name (str): value of the EndpointName dimension
+        sample_rate (float): fraction of the requests timed, 0 disables
+        sink (Callable): receives each EMF record, as a dict
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        endpoint_name: str,
+        sample_rate: float = 1.0,
+        sink: Callable[[dict], None] = _stdout_sink,
+    ) -> None:
+        self.namespace = namespace
+        self.endpoint_name = endpoint_name
+        self.sample_rate = sample_rate
+        self.sink = sink
+        self.model_version = ""
+
+    def timer(self) -> StageTimer:
+        """A timer for a new request, NULL_TIMER if it is not sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return NULL_TIMER
+        return StageTimer()
+
+    def emit(self, timer: StageTimer, counts: dict = None, **properties) -> None:
+        """Write the timings of a sampled request
+
+        Args:
+            timer (StageTimer): timings of the request, nothing is written
+                when it was not sampled
+            counts (dict): extra metrics, with a Count unit
+            properties: extra values of the record, not metrics
+        """
+        if not timer.timings:
+            return
+        counts = counts or {}
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["EndpointName", "ModelVersion"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": "Milliseconds"}
+                            for name in timer.timings
+                        ]
+                        + [{"Name": name, "Unit": "Count"} for name in counts],
+                    }
+                ],
+            },
+            "EndpointName": self.endpoint_name,
+            "ModelVersion": self.model_version,
+            **properties,
+            **timer.timings,
+            **counts,
+        }
+        self.sink(record)
@@ -0,0 +1,272 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+
+from stage_metrics import NULL_TIMER, StageTimer
+
+logger = logging.getLogger()
+
+REALTIME_ONLY = "realtime-only"
+PREFER_REALTIME = "prefer-realtime"
+PREFER_BATCH = "prefer-batch"
+RACE = "race"
+POLICIES = (REALTIME_ONLY, PREFER_REALTIME, PREFER_BATCH, RACE)
+
+# Real-time failures that a batch score can stand in for
+FALLBACK_STATUS_CODES = (500, 503, 504)
+
+# BatchGetItem reads at most 100 keys per call
+MAX_KEYS_PER_BATCH_GET = 100
+
+
+class BatchScoreReader(object):
+    """Read the batch transform scores loaded in DynamoDB by the Glue job.
+
+    Items are keyed by `index_name` and hold the `score` and `scored_at`, the
+    epoch seconds at which the batch transform wrote its output.
+
+    Args:
+        dynamodb: `dynamodb` boto3 client
+        table_name (str): scores table
+        index_name (str): partition key of the table
+    """
+
+    def __init__(
+        self, dynamodb, table_name: str, index_name: str = "policy_id"
+    ) -> None:
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.index_name = index_name
+
+    def get(self, record_identifier: str) -> Optional[dict]:
+        """Batch score of an identifier, None if there is none"""
+        item = self.dynamodb.get_item(
+            TableName=self.table_name,
+            Key={self.index_name: {"S": record_identifier}},
+            ProjectionExpression="#score, scored_at",
+            ExpressionAttributeNames={"#score": "score"},
+        ).get("Item")
+        return self._parse(item) if item else None
+
+    def get_many(self, record_identifiers: List[str]) -> Dict[str, dict]:
+        """Batch scores of identifiers, by identifier, missing ones left out"""
+        scores = {}
+        for i in range(0, len(record_identifiers), MAX_KEYS_PER_BATCH_GET):
+            keys = [
+                {self.index_name: {"S": r}}
+                for r in record_identifiers[i : i + MAX_KEYS_PER_BATCH_GET]
+            ]
+            request = {
+                self.table_name: {
+                    "Keys": keys,
+                    "ProjectionExpression": "#index, #score, scored_at",
+                    "ExpressionAttributeNames": {
+                        "#index": self.index_name,
+                        "#score": "score",
+                    },
+                }
+            }
+            # Unprocessed keys are served in real time, not retried
+            response = self.dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(self.table_name, []):
+                score = self._parse(item)
+                if score is not None:
+                    scores[item[self.index_name]["S"]] = score
+        return scores
+
+    @staticmethod
+    def _parse(item: dict) -> Optional[dict]:
+        try:
+            return {
+                "score": float(item["score"]["S"]),
+                "scored_at": float(item["scored_at"]["S"]),
+            }
+        except (KeyError, ValueError):
+            # Items loaded before scored_at was recorded have no age
+            return None
+
+
+class TieredScorer(object):
+    """Answer with a real-time score or a precomputed batch score.
+
+    Policies:
+
+    - `realtime-only`: real-time scores only
+    - `prefer-realtime`: real-time score, the batch score when it fails
+    - `prefer-batch`: batch score when not older than `max_age_seconds`,
+      real-time otherwise, the older batch score when that fails
+    - `race`: real-time and batch read run concurrently, the real-time score
+      is used when it comes within `latency_budget_ms`, else the batch score
+      when not older than `max_age_seconds`, else the real-time score
+
+    Results get the `tier` that answered and the `score_age_seconds`, 0 for
+    real-time scores.
+
+    Args:
+        policy (str): one of POLICIES
+        batch_scores (BatchScoreReader): reader of the batch scores
+        max_age_seconds (float): age of the batch scores preferred to the
+            real-time ones
+        latency_budget_ms (float): wait for the real-time score in a race
+        clock (Callable): wall clock, in epoch seconds
+    """
+
+    def __init__(
+        self,
+        policy: str,
+        batch_scores: Optional[BatchScoreReader],
+        max_age_seconds: float = 86400,
+        latency_budget_ms: float = 100,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown tiered serving policy {policy}")
+        if policy != REALTIME_ONLY and batch_scores is None:
+            raise ValueError(f"The {policy} policy needs batch scores")
+        self.policy = policy
+        self.batch_scores = batch_scores
+        self.max_age_seconds = max_age_seconds
+        self.latency_budget = latency_budget_ms / 1000
+        self.clock = clock
+        # The real-time scoring of a race, its calls use the executors of the clients
+        self._race_executor = (
+            ThreadPoolExecutor(max_workers=2) if policy == RACE else None
+        )
+
+    def score(
+        self,
+        record_identifier: str,
+        realtime: Callable[[str], dict],
+        timer: StageTimer = NULL_TIMER,
+    ) -> dict:
+        """Score one identifier
+
+        Args:
+            record_identifier (str): identifier to score
+            realtime (Callable): scores one identifier in real time, returning
+                a result with its `statusCode`, and a `score` or an `Error`.
+                In a race, it runs on a thread of the race and may complete
+                after `score` returned: it must not share the state of the
+                request.
+            timer (StageTimer): times the batch score reads
+        """
+        if self.policy == REALTIME_ONLY:
+            return self._realtime_result(realtime(record_identifier))
+        if self.policy == RACE:
+            return self._race(record_identifier, realtime, timer)
+
+        batch = None
+        if self.policy == PREFER_BATCH:
+            batch = self._read_batch(record_identifier, timer)
+            if batch is not None and self._is_fresh(batch):
+                return self._batch_result(record_identifier, batch)
+
+        result = realtime(record_identifier)
+        if result["statusCode"] not in FALLBACK_STATUS_CODES:
+            return self._realtime_result(result)
+        if self.policy == PREFER_REALTIME:
+            batch = self._read_batch(record_identifier, timer)
+        if batch is None:
+            return self._realtime_result(result)
+        logger.info(f"Real-time scoring failed, batch score for {record_identifier}")
+        return self._batch_result(record_identifier, batch)
+
+    def score_many(
+        self,
+        record_identifiers: List[str],
+        realtime_many: Callable[[List[str]], List[dict]],
+        timer: StageTimer = NULL_TIMER,
+    ) -> List[dict]:
+        """Score many identifiers, `realtime_many` scoring them as a batch
+
+        Races are not run for many identifiers: `race` behaves as
+        `prefer-realtime`.
+        """
+        record_identifiers = list(dict.fromkeys(record_identifiers))
+        if self.policy == REALTIME_ONLY:
+            return [self._realtime_result(r) for r in realtime_many(record_identifiers)]
+
+        results, batch = {}, {}
+        if self.policy == PREFER_BATCH:
+            batch = self._read_batch_many(record_identifiers, timer)
+            for r, b in batch.items():
+                if self._is_fresh(b):
+                    results[r] = self._batch_result(r, b)
+
+        to_score = [r for r in record_identifiers if r not in results]
+        realtime_results = realtime_many(to_score) if to_score else []
+        failed = [
+            r["policy_id"]
+            for r in realtime_results
+            if r["statusCode"] in FALLBACK_STATUS_CODES
+        ]
+        if failed and self.policy != PREFER_BATCH:
+            batch = self._read_batch_many(failed, timer)
+        for r in realtime_results:
+            if r["policy_id"] in failed and r["policy_id"] in batch:
+                results[r["policy_id"]] = self._batch_result(
+                    r["policy_id"], batch[r["policy_id"]]
+                )
+            else:
+                results[r["policy_id"]] = self._realtime_result(r)
+        return [results[r] for r in record_identifiers]
+
+    def _race(
+        self, record_identifier: str, realtime: Callable[[str], dict], timer: StageTimer
+    ) -> dict:
+        started_at = time.monotonic()
+        future = self._race_executor.submit(realtime, record_identifier)
+        batch = self._read_batch(record_identifier, timer)
+        try:
+            result = future.result(
+                timeout=max(0, self.latency_budget - (time.monotonic() - started_at))
+            )
+            if result["statusCode"] not in FALLBACK_STATUS_CODES or batch is None:
+                return self._realtime_result(result)
+        except FutureTimeoutError:
+            if batch is not None and self._is_fresh(batch):
+                # Not run yet, or it completes in the background and fills
+                # the score cache
+                future.cancel()
+                return self._batch_result(record_identifier, batch)
+            result = future.result()
+            if result["statusCode"] not in FALLBACK_STATUS_CODES or batch is None:
+                return self._realtime_result(result)
+        return self._batch_result(record_identifier, batch)
+
+    def _read_batch(self, record_identifier: str, timer: StageTimer) -> Optional[dict]:
+        try:
+            with timer.stage("BatchScoreLatency"):
+                return self.batch_scores.get(record_identifier)
+        except Exception:
+            logger.exception("Failed to read the batch score")
+            return None
+
+    def _read_batch_many(
+        self, record_identifiers: List[str], timer: StageTimer
+    ) -> Dict[str, dict]:
+        try:
+            with timer.stage("BatchScoreLatency"):
+                return self.batch_scores.get_many(record_identifiers)
+        except Exception:
+            logger.exception("Failed to read the batch scores")
+            return {}
+
+    def _is_fresh(self, batch: dict) -> bool:
+        return self.clock() - batch["scored_at"] <= self.max_age_seconds
+
+    def _batch_result(self, record_identifier: str, batch: dict) -> dict:
+        return {
+            "policy_id": record_identifier,
+            "statusCode": 200,
+            "score": batch["score"],
+            "tier": "batch",
+            "score_age_seconds": round(max(0.0, self.clock() - batch["scored_at"])),
+        }
+
+    def _realtime_result(self, result: dict) -> dict:
+        if result["statusCode"] == 200:
+            return {**result, "tier": "realtime", "score_age_seconds": 0}
+        return result
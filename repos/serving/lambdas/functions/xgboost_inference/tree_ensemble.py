@@ -0,0 +1,80 @@
+from typing import List
+
+import numpy as np
+
+
+class TreeEnsemble(object):
+    """Vectorized evaluator of a booster compiled into flat arrays.
+
+    The arrays are written at training time by `compile_booster` in the build
+    pipeline `xgboost_starter_script.py`. All trees are walked together, one
+    level per step, so scoring costs `max_depth` vectorized steps whatever the
+    number of rows and trees.
+    """
+
+    def __init__(self, arrays) -> None:
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.missing = arrays["missing"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.objective = str(arrays["objective"])
+        self.feature_names = [str(n) for n in arrays["feature_names"]]
+
+        base_score = float(arrays["base_score"])
+        if self.objective.startswith("binary:logistic"):
+            self.base_margin = float(np.log(base_score / (1 - base_score)))
+        else:
+            self.base_margin = base_score
+        # Leaves point to themselves, a safe feature index avoids masking
+        self._split_feature = np.maximum(self.feature, 0).astype(np.intp)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self._children = np.stack([self.left, self.right], axis=1).ravel().astype(np.intp)
+        self._roots = self.roots.astype(np.intp)
+
+    @classmethod
+    def load(cls, path: str) -> "TreeEnsemble":
+        with np.load(path) as arrays:
+            return cls({k: arrays[k] for k in arrays.files})
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Score a batch of rows, or a single row
+
+        Args:
+            data (np.ndarray): rows of features, in model order. NaN are
+                treated as missing values.
+
+        Returns:
+            np.ndarray: one score per row, as `Booster.predict`
+        """
+        data = np.atleast_2d(np.asarray(data, dtype=np.float32))
+        n_rows, n_features = data.shape
+        flat = data.ravel()
+        offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.tile(self._roots, (n_rows, 1))
+        has_missing = np.isnan(flat).any()
+
+        for _ in range(self.max_depth):
+            values = flat.take(offsets + self._split_feature.take(nodes))
+            next_nodes = self._children.take(
+                2 * nodes + (values >= self.threshold.take(nodes))
+            )
+            if has_missing:
+                missing = np.isnan(values)
+                next_nodes[missing] = self.missing.take(nodes[missing])
+            nodes = next_nodes
+
+        margin = self.value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_margin
+        if self.objective.startswith("binary:logistic"):
+            return 1 / (1 + np.exp(-margin))
+        return margin
+
+    def predict_csv(self, lines: List[str]) -> List[float]:
+        """Score CSV feature vectors, in model order"""
+        data = np.array(
+            [[float(v) for v in line.split(",")] for line in lines], dtype=np.float32
+        )
+        return self.predict(data).tolist()
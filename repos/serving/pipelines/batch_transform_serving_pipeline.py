@@ -48,6 +48,7 @@ def create_pipeline(
     customers_fg_name = kwargs["customers_fg_name"]
     claims_fg_name = kwargs["claims_fg_name"]
     features_names = kwargs["features_names"]
+    score_store_conf = kwargs.get("score_store", {"type": "dynamodb"})
 
 
     model_package_group_name = kwargs["model_package_group_name"]
@@ -195,6 +196,42 @@ def create_pipeline(
 
     step_callback_data.add_depends_on([step_transform])
 
+    # ##################################################################
+    # 3b. ProcessingStep: publish the scores as a score file in S3
+    # ##################################################################
+    # Replaces the load of the table by the Glue job
+    if score_store_conf["type"] == "s3_file":
+        score_file_processor = SKLearnProcessor(
+            framework_version="0.23-1",
+            role=role,
+            instance_type="ml.m5.large",
+            instance_count=1,
+            base_job_name=f"{prefix}/score-file",
+            sagemaker_session=sagemaker_session,
+        )
+        step_score_file = ProcessingStep(
+            name="PublishScoreFile",
+            processor=score_file_processor,
+            inputs=[
+                ProcessingInput(
+                    input_name="transform_output",
+                    source=f"s3://{default_bucket}/step_transform/output",
+                    destination="/opt/ml/processing/input",
+                )
+            ],
+            job_arguments=[
+                "--score-file-uri",
+                f"s3://{default_bucket}/{prefix}/score-files",
+                "--block-bytes",
+                str(score_store_conf.get("block_bytes", 4096)),
+            ],
+            code=score_store_conf.get("script_path", "scripts/build_score_file.py"),
+        )
+        step_score_file.add_depends_on([step_transform])
+        load_steps = [step_transform, step_score_file]
+    else:
+        load_steps = [step_transform, step_callback_data]
+
     # ##################################################################
     # 4. ConditionStep: Check data freshness
     # ##################################################################
@@ -205,7 +242,7 @@ def create_pipeline(
     step_cond = ConditionStep(
         name="DataFreshCond",
         conditions=[cond_e],
-        if_steps=[step_transform, step_callback_data],
+        if_steps=load_steps,
         else_steps=[],
     )
 
@@ -0,0 +1,170 @@
+"""Merge the feature sketches of the inference Lambda and compare them with the baseline.
+
+The sketches written by all the containers of the inference Lambda during the
+last `--minutes` are merged, by feature, and compared with the data quality
+statistics of the `DriftCheckBaselines` of the model package:
+
+- mean shift: distance between the means, in baseline standard deviations
+- missing rate: fraction of null values, served and baseline
+- CDF distance: largest difference between the served and baseline
+  cumulative distributions, at the bounds of the baseline KLL buckets
+
+A feature drifts when its mean shift or CDF distance exceeds its threshold.
+The score has no baseline, its quantiles are reported. The report is printed
+as JSON, the command exits with 1 when a feature drifts.
+
+Usage:
+    python scripts/aggregate_sketches.py \
+        --sketches-uri s3://<project bucket>/realtime-inference/sketches \
+        --model-package-group-name fraud-classification-xgboost --minutes 15
+"""
+import argparse
+import gzip
+import json
+import math
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import boto3
+
+sys.path.insert(0, "lambdas/functions/xgboost_inference")
+
+from feature_sketches import FeatureSketch, merge_payloads  # noqa: E402
+
+QUANTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+
+def read_payloads(s3, sketches_uri: str, since: datetime) -> list:
+    """Sketches written since `since`, listed by hourly partition"""
+    url = urlparse(sketches_uri)
+    bucket, prefix = url.netloc, url.path.strip("/")
+    payloads = []
+    hour = since.replace(minute=0, second=0, microsecond=0)
+    while hour <= datetime.now(timezone.utc):
+        partition = hour.strftime("year=%Y/month=%m/day=%d/hour=%H")
+        for page in s3.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket, Prefix=f"{prefix}/{partition}/"
+        ):
+            for o in page.get("Contents", []):
+                if o["LastModified"] < since:
+                    continue
+                body = s3.get_object(Bucket=bucket, Key=o["Key"])["Body"].read()
+                payloads.append(json.loads(gzip.decompress(body)))
+        hour += timedelta(hours=1)
+    return payloads
+
+
+def read_baseline(sm, s3, model_package_arn: str) -> dict:
+    """Data quality statistics of the model package, by feature name"""
+    baselines = sm.describe_model_package(ModelPackageName=model_package_arn)[
+        "DriftCheckBaselines"
+    ]
+    url = urlparse(baselines["ModelDataQuality"]["Statistics"]["S3Uri"])
+    statistics = json.loads(
+        s3.get_object(Bucket=url.netloc, Key=url.path.lstrip("/"))["Body"].read()
+    )
+    return {f["name"]: f for f in statistics["features"]}
+
+
+def summarize(sketch: FeatureSketch) -> dict:
+    total = sketch.count + sketch.nulls
+    return {
+        "count": sketch.count,
+        "missing_rate": sketch.nulls / total if total else 0.0,
+        "mean": sketch.mean,
+        "std_dev": math.sqrt(sketch.variance),
+        "min": sketch.min if sketch.count else None,
+        "max": sketch.max if sketch.count else None,
+        "quantiles": {str(q): sketch.quantiles.quantile(q) for q in QUANTILES},
+    }
+
+
+def compare(sketch: FeatureSketch, baseline: dict) -> dict:
+    """Drift statistics of a served feature against its baseline statistics"""
+    numerical = baseline.get("numerical_statistics")
+    if not numerical or not sketch.count:
+        return {}
+    common = numerical["common"]
+    baseline_total = common["num_present"] + common["num_missing"]
+    std_dev = numerical.get("std_dev") or 0.0
+    delta = abs(sketch.mean - numerical["mean"])
+    if std_dev:
+        mean_shift = delta / std_dev
+    else:
+        mean_shift = 0.0 if delta == 0 else math.inf
+
+    cdf_distance = 0.0
+    buckets = numerical.get("distribution", {}).get("kll", {}).get("buckets", [])
+    baseline_count = sum(b["count"] for b in buckets)
+    seen = 0
+    for b in buckets:
+        seen += b["count"]
+        cdf_distance = max(
+            cdf_distance,
+            abs(seen / baseline_count - sketch.quantiles.cdf(b["upper_bound"])),
+        )
+    return {
+        "baseline_mean": numerical["mean"],
+        "baseline_std_dev": std_dev,
+        "baseline_missing_rate": (
+            common["num_missing"] / baseline_total if baseline_total else 0.0
+        ),
+        "mean_shift": mean_shift,
+        "cdf_distance": cdf_distance,
+    }
+
+
+def get_model_package_arn(sm, model_package_group_name: str) -> str:
+    return sm.list_model_packages(
+        ModelPackageGroupName=model_package_group_name,
+        ModelApprovalStatus="Approved",
+        SortBy="CreationTime",
+        SortOrder="Descending",
+    )["ModelPackageSummaryList"][0]["ModelPackageArn"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sketches-uri", type=str, required=True)
+    parser.add_argument("--model-package-arn", type=str)
+    parser.add_argument("--model-package-group-name", type=str)
+    parser.add_argument("--minutes", type=float, default=15)
+    parser.add_argument("--max-mean-shift", type=float, default=0.5)
+    parser.add_argument("--max-cdf-distance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    s3 = boto3.client("s3")
+    sm = boto3.client("sagemaker")
+    model_package_arn = args.model_package_arn or get_model_package_arn(
+        sm, args.model_package_group_name
+    )
+    since = datetime.now(timezone.utc) - timedelta(minutes=args.minutes)
+    payloads = read_payloads(s3, args.sketches_uri, since)
+    sketches = merge_payloads(payloads)
+    baseline = read_baseline(sm, s3, model_package_arn)
+
+    features, drifted = {}, []
+    for name, sketch in sketches.items():
+        if name == "score":
+            continue
+        features[name] = {**summarize(sketch), **compare(sketch, baseline.get(name, {}))}
+        if (
+            features[name].get("mean_shift", 0) > args.max_mean_shift
+            or features[name].get("cdf_distance", 0) > args.max_cdf_distance
+        ):
+            drifted.append(name)
+
+    report = {
+        "model_package_arn": model_package_arn,
+        "generated_at": time.time(),
+        "window_start": min((p["window_start"] for p in payloads), default=None),
+        "window_end": max((p["window_end"] for p in payloads), default=None),
+        "containers": len({p["instance"] for p in payloads}),
+        "score": summarize(sketches["score"]) if "score" in sketches else None,
+        "features": features,
+        "drifted": drifted,
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if drifted else 0)
@@ -0,0 +1,122 @@
+"""Publish the batch transform scores as a key-sorted, block-indexed file.
+
+The output of the batch transform, CSV lines with the `policy_id` first and
+the score last as loaded by the Glue job, is sorted by `policy_id` and
+written in the format read by the `read-ddb` Lambda (`score_file.py`):
+
+- blocks of `policy_id,score` lines, cut at line boundaries once they reach
+  `--block-bytes`
+- the JSON index: version, generation and scoring times, count and the first
+  `policy_id`, offset and length of each block
+- a little endian footer: offset and length of the index, magic
+
+The file is immutable, written under its own version prefix, then
+`latest.json` is pointed to it.
+"""
+import argparse
+import json
+import logging
+import struct
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+
+import boto3
+import pandas as pd
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAGIC = b"SCF1"
+FOOTER = struct.Struct("<QI4s")
+SCORE_FILE_VERSION = 1
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--score-file-uri", type=str)
+parser.add_argument("--block-bytes", type=int, default=4096)
+parser.add_argument("--input-data", type=str, default="/opt/ml/processing/input")
+parser.add_argument("--output-path", type=str, default="/opt/ml/processing/output")
+
+
+def read_scores(input_path: str) -> pd.DataFrame:
+    frames = []
+    for path in sorted(Path(input_path).glob("**/*.out")):
+        df = pd.read_csv(path, header=None, dtype=str)
+        frames.append(
+            pd.DataFrame({"policy_id": df.iloc[:, 0], "score": df.iloc[:, -1]})
+        )
+    scores = pd.concat(frames).dropna()
+    # The last score of a policy wins, as with the table
+    return scores.drop_duplicates("policy_id", keep="last")
+
+
+def write_score_file(
+    path: Path, scores: dict, block_bytes: int, scored_at: str
+) -> dict:
+    """Write the scores, by policy_id, and return the index"""
+    blocks = []
+    offset = 0
+    with path.open("wb") as f:
+        block, block_size, first_key = [], 0, None
+        for policy_id in sorted(scores):
+            line = f"{policy_id},{scores[policy_id]}\n".encode("utf-8")
+            if first_key is None:
+                first_key = policy_id
+            block.append(line)
+            block_size += len(line)
+            if block_size >= block_bytes:
+                f.write(b"".join(block))
+                blocks.append([first_key, offset, block_size])
+                offset += block_size
+                block, block_size, first_key = [], 0, None
+        if block:
+            f.write(b"".join(block))
+            blocks.append([first_key, offset, block_size])
+            offset += block_size
+        index = {
+            "version": SCORE_FILE_VERSION,
+            "generated_at": time.time(),
+            "scored_at": scored_at,
+            "count": len(scores),
+            "blocks": blocks,
+        }
+        encoded = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        f.write(encoded)
+        f.write(FOOTER.pack(offset, len(encoded), MAGIC))
+    return index
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    scores = read_scores(args.input_data)
+    # The step runs right after the transform, which scored the records
+    scored_at = str(int(time.time()))
+    now = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    version = f"{now}-{uuid.uuid4().hex[:8]}"
+    output_path = Path(args.output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    path = output_path / "scores.scf"
+    index = write_score_file(
+        path,
+        dict(zip(scores["policy_id"], scores["score"])),
+        args.block_bytes,
+        scored_at,
+    )
+
+    url = urlparse(args.score_file_uri)
+    bucket, prefix = url.netloc, url.path.strip("/")
+    key = f"{prefix}/{version}/scores.scf"
+    s3 = boto3.client("s3")
+    s3.upload_file(str(path), bucket, key)
+    # Pointed to once the file is complete
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}/latest.json",
+        Body=json.dumps({"version": version, "key": key}).encode("utf-8"),
+        ContentType="application/json",
+    )
+    logger.info(
+        f"{index['count']} scores in {len(index['blocks'])} blocks"
+        f" written to s3://{bucket}/{key}"
+    )
@@ -0,0 +1,79 @@
+"""Export the categorical encodings of a Data Wrangler flow for the inference Lambda.
+
+The string indexers fitted by the flow (one-hot and ordinal encodings) are
+stored in its nodes as base85 encoded zip archives of Spark models, whose
+labels are in a parquet file. They are written, with the string formatting
+steps that precede them, to a JSON file bundled with the Lambda, so that raw
+claims sent to the endpoint are encoded as by the ingestion pipeline.
+
+Usage:
+    python scripts/export_flow_encodings.py \
+        --flow ../features_ingestion_pipeline/pipelines/claims.flow \
+        --output lambdas/functions/xgboost_inference/claims_encodings.json
+"""
+import argparse
+import base64
+import io
+import json
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+
+ENCODE_CATEGORICAL = "sagemaker.spark.encode_categorical_0.1"
+FORMAT_STRING = "sagemaker.spark.format_string_0.1"
+CUSTOM_PANDAS = "sagemaker.spark.custom_pandas_0.1"
+
+
+def get_labels(string_indexer_model: str) -> list:
+    """Labels of a fitted Spark StringIndexerModel, in index order"""
+    with zipfile.ZipFile(io.BytesIO(base64.b85decode(string_indexer_model))) as z:
+        data = next(
+            n for n in z.namelist() if n.startswith("data/") and n.endswith(".parquet")
+        )
+        labels = pd.read_parquet(io.BytesIO(z.read(data)))["labelsArray"][0]
+    return [str(label) for label in labels[0]]
+
+
+def get_encodings(flow: dict) -> dict:
+    encodings = {
+        "lower_case": False,
+        "remove_symbols": {},
+        "one_hot": {},
+        "ordinal": {},
+    }
+    for node in flow["nodes"]:
+        parameters = node.get("parameters", {})
+        if node["operator"] == CUSTOM_PANDAS and ".str.lower()" in parameters["code"]:
+            encodings["lower_case"] = True
+        elif (
+            node["operator"] == FORMAT_STRING
+            and parameters["operator"] == "Remove symbols"
+        ):
+            remove_symbols = parameters["remove_symbols_parameters"]
+            encodings["remove_symbols"][remove_symbols["input_column"]] = remove_symbols[
+                "symbols"
+            ]
+        elif node["operator"] == ENCODE_CATEGORICAL:
+            if parameters["operator"] == "One-hot encode":
+                key, kind = "one_hot_encode_parameters", "one_hot"
+            else:
+                key, kind = "ordinal_encode_parameters", "ordinal"
+            column = parameters[key]["input_column"]
+            encodings[kind][column] = get_labels(
+                node["trained_parameters"][key]["string_indexer_model"]
+            )
+    return encodings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flow", type=str, required=True)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+
+    with open(args.flow, "r") as f:
+        encodings = get_encodings(json.load(f))
+    encodings = {"flow": Path(args.flow).name, **encodings}
+    with open(args.output, "w") as f:
+        json.dump(encodings, f, indent=2)
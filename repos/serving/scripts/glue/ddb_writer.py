@@ -0,0 +1,269 @@
+import logging
+import random
+import time
+from typing import Callable, Iterable, List, Optional
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+logger = logging.getLogger()
+
+# BatchWriteItem writes at most 25 items per call
+MAX_ITEMS_PER_BATCH_WRITE = 25
+THROTTLING_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+}
+# Retried as they are, without lowering the rate, as are the connection errors,
+# read timeouts and closed connections
+TRANSIENT_ERROR_CODES = {"InternalServerError", "ServiceUnavailable"}
+
+
+class AdaptiveBatchWriter(object):
+    """Write items to a DynamoDB table at a rate adapted to its capacity.
+
+    Batches of 25 items are written with BatchWriteItem once a token bucket,
+    filled at `rate` write capacity units per second, holds their estimated
+    cost. The actual `ConsumedCapacity` of each call is then charged to the
+    bucket, and the units per item of the estimates follow it.
+
+    The rate is adapted additive increase, multiplicative decrease: a
+    throttle, a `ProvisionedThroughputExceededException` or unprocessed
+    items, multiplies the rate by `decrease_factor`, at most once every
+    `adjust_seconds`, and each `adjust_seconds` without throttles during
+    which the bucket held the writes back adds `increase` to it. The rate
+    stays below `target_utilization` of the provisioned write capacity, when
+    the table has one. Unprocessed items are written again after an
+    exponential backoff with full jitter, for at most `max_attempts` calls;
+    the units taken for them are not given back. Batches failing on a
+    transient error, a connection error or a read timeout, are written again
+    the same way, without lowering the rate: a put of the same item twice
+    writes it once.
+
+    The botocore client should not retry itself, or the writer would not see
+    the throttles.
+
+    Args:
+        dynamodb: `dynamodb` boto3 client
+        table_name (str): target table
+        index_name (str): partition key of the table, an item replaces the
+            pending item of the same key
+        write_capacity (Optional[float]): provisioned write capacity units of
+            the table, None for an on-demand table
+        target_utilization (float): fraction of `write_capacity` used at most
+        initial_rate (float): initial rate, in units per second
+        max_rate (float): maximum rate of an on-demand table
+        min_rate (float): minimum rate
+        increase (Optional[float]): additive increase, in units per second,
+            by default 5% of the maximum rate of a provisioned table and 100
+            for an on-demand table
+        decrease_factor (float): multiplicative decrease
+        adjust_seconds (float): minimum interval between two adjustments
+        max_attempts (int): maximum number of calls per batch
+        backoff_base_seconds (float): backoff of the first retry
+        backoff_max_seconds (float): maximum backoff
+        clock (Callable): monotonic clock, in seconds
+        sleep (Callable): sleep function, in seconds
+    """
+
+    def __init__(
+        self,
+        dynamodb,
+        table_name: str,
+        index_name: str = "policy_id",
+        write_capacity: Optional[float] = None,
+        target_utilization: float = 0.8,
+        initial_rate: float = 100.0,
+        max_rate: float = 40000.0,
+        min_rate: float = 1.0,
+        increase: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        adjust_seconds: float = 1.0,
+        max_attempts: int = 10,
+        backoff_base_seconds: float = 0.05,
+        backoff_max_seconds: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.index_name = index_name
+        if write_capacity:
+            self.max_rate = max(min_rate, write_capacity * target_utilization)
+            default_increase = 0.05 * self.max_rate
+        else:
+            self.max_rate = max_rate
+            default_increase = 100.0
+        self.min_rate = min_rate
+        self.rate = min(max(initial_rate, min_rate), self.max_rate)
+        self.increase = increase if increase is not None else default_increase
+        self.decrease_factor = decrease_factor
+        self.adjust_seconds = adjust_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+        self._pending = {}
+        self._tokens = 0.0
+        self._filled_at = None
+        self._increased_at = None
+        self._decreased_at = None
+        self._held_back = False
+        # Write capacity units per item, 1 for items of up to 1 KB
+        self._units_per_item = 1.0
+
+        self.started_at = None
+        self.rows = 0
+        self.consumed = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.retries = 0
+        self.rates = [self.rate]
+
+    def _acquire(self, units: float) -> None:
+        """Wait until the bucket holds `units`, then take them"""
+        now = self.clock()
+        if self._filled_at is not None:
+            # At most one second of writes in the bucket
+            refill = (now - self._filled_at) * self.rate
+            self._tokens = min(max(self.rate, units), self._tokens + refill)
+        self._filled_at = now
+        if self._tokens < units:
+            self._held_back = True
+            wait = (units - self._tokens) / self.rate
+            self.sleep(wait)
+            self._tokens = units
+            self._filled_at = self.clock()
+        self._tokens -= units
+
+    def _backoff(self, attempt: int) -> None:
+        """Exponential backoff with full jitter"""
+        self.sleep(
+            random.uniform(
+                0,
+                min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt),
+            )
+        )
+
+    def _decrease(self) -> None:
+        now = self.clock()
+        decreased_at = self._decreased_at
+        if decreased_at is not None and now - decreased_at < self.adjust_seconds:
+            return
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self.rates.append(self.rate)
+        # Writes of the former rate are not bursted
+        self._tokens = min(self._tokens, 0.0)
+        self._decreased_at = self._increased_at = now
+        self._held_back = False
+
+    def _increase(self) -> None:
+        now = self.clock()
+        if self._increased_at is None:
+            self._increased_at = now
+        if now - self._increased_at < self.adjust_seconds or not self._held_back:
+            return
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        self.rates.append(self.rate)
+        self._increased_at = now
+        self._held_back = False
+
+    def _write_batch(self, requests: List[dict]) -> None:
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                self.retries += 1
+                self._backoff(attempt - 1)
+            estimate = len(requests) * self._units_per_item
+            self._acquire(estimate)
+            self.calls += 1
+            try:
+                response = self.dynamodb.batch_write_item(
+                    RequestItems={self.table_name: requests},
+                    ReturnConsumedCapacity="TOTAL",
+                )
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code in THROTTLING_ERROR_CODES:
+                    self.throttles += 1
+                    self._decrease()
+                elif code not in TRANSIENT_ERROR_CODES:
+                    raise
+                continue
+            except (ConnectionError, HTTPClientError) as e:
+                logger.warning(f"Retrying a batch of {len(requests)} items: {e}")
+                continue
+
+            consumed = sum(
+                c.get("CapacityUnits", 0.0)
+                for c in response.get("ConsumedCapacity", [])
+            )
+            unprocessed = response.get("UnprocessedItems", {}).get(self.table_name)
+            written = len(requests) - len(unprocessed or [])
+            self.consumed += consumed
+            self.rows += written
+            # The written items are charged their actual units
+            self._tokens += written * self._units_per_item - consumed
+            if written and consumed:
+                self._units_per_item = consumed / written
+            if not unprocessed:
+                self._increase()
+                return
+            self.throttles += 1
+            self._decrease()
+            requests = unprocessed
+        raise RuntimeError(
+            f"{len(requests)} items still unprocessed after {self.max_attempts} calls"
+        )
+
+    def flush(self) -> None:
+        """Write the pending items"""
+        if self._pending:
+            self._write_batch(
+                [{"PutRequest": {"Item": item}} for item in self._pending.values()]
+            )
+            self._pending = {}
+
+    def write(self, items: Iterable[dict]) -> None:
+        """Write low-level items, by batches of 25, the last batch is pending
+        until the next write or `flush`"""
+        if self.started_at is None:
+            self.started_at = self.clock()
+        for item in items:
+            key = item[self.index_name]["S"]
+            # A batch cannot hold the same key twice, the last item wins
+            if key in self._pending:
+                self.flush()
+            self._pending[key] = item
+            if len(self._pending) == MAX_ITEMS_PER_BATCH_WRITE:
+                self.flush()
+
+    def stats(self) -> dict:
+        started_at = self.started_at
+        seconds = self.clock() - started_at if started_at is not None else 0.0
+        return {
+            "rows": self.rows,
+            "seconds": seconds,
+            "rows_per_second": self.rows / seconds if seconds else 0.0,
+            "consumed_wcu": self.consumed,
+            "wcu_per_second": self.consumed / seconds if seconds else 0.0,
+            "calls": self.calls,
+            "throttles": self.throttles,
+            "retries": self.retries,
+            "rate": self.rate,
+            "min_rate": min(self.rates),
+            "max_rate": max(self.rates),
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['rows']} rows in {stats['seconds']:.1f} s"
+            f" ({stats['rows_per_second']:.0f} rows/s),"
+            f" {stats['consumed_wcu']:.0f} WCU consumed"
+            f" ({stats['wcu_per_second']:.0f} WCU/s), {stats['calls']} calls,"
+            f" {stats['throttles']} throttles, {stats['retries']} retries,"
+            f" rate {stats['rate']:.0f} WCU/s"
+            f" (min {stats['min_rate']:.0f}, max {stats['max_rate']:.0f})"
+        )
@@ -3,6 +3,8 @@ import sys
 import time
 
 import awswrangler as wr
+import boto3
+from botocore.config import Config
 from awsglue.context import GlueContext
 from awsglue.dynamicframe import DynamicFrame
 from awsglue.job import Job
@@ -13,6 +15,8 @@ from pyspark.sql import SparkSession
 from pyspark.sql.functions import udf
 from pyspark.sql.types import StringType
 
+from ddb_writer import AdaptiveBatchWriter
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
@@ -25,6 +29,9 @@ args = getResolvedOptions(
         "S3_BUCKET",
         "S3_PREFIX_PROCESSED",
         "TABLE_HEADER_NAME",
+        "GENERATION_MARKER_KEY",
+        "TARGET_UTILIZATION",
+        "INITIAL_WRITE_RATE",
     ],
 )
 
@@ -32,17 +39,47 @@ target_ddb_table = args["TARGET_DDB_TABLE"]
 
 s3_bucket = args["S3_BUCKET"]
 s3_prefix_processed = args["S3_PREFIX_PROCESSED"]
-table_header_name = args["TABLE_HEADER_NAME"].split(",")
+table_header_name = [h.strip() for h in args["TABLE_HEADER_NAME"].split(",")]
 
 logger.info("Read processed file (model pipeline output) (no header) ...")
 source_s3_proc = f"s3://{s3_bucket}/{s3_prefix_processed}"
 input_df_proc = wr.s3.read_csv(source_s3_proc, header=None, chunksize=1000)
 
+# The batch transform scored the records when it wrote its output, the serving
+# Lambda uses it as the age of the scores
+scored_at = str(
+    int(
+        max(
+            o["LastModified"] for o in wr.s3.describe_objects(source_s3_proc).values()
+        ).timestamp()
+    )
+)
+logger.info("Scores written at [{}]".format(scored_at))
+
 glueContext = GlueContext(SparkContext.getOrCreate())
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
 
 logger.info("Target DDB Table: [{}]".format(target_ddb_table))
+dynamodb = boto3.client("dynamodb")
+write_capacity = (
+    dynamodb.describe_table(TableName=target_ddb_table)["Table"]
+    .get("ProvisionedThroughput", {})
+    .get("WriteCapacityUnits")
+)
+logger.info("Provisioned write capacity: [{}]".format(write_capacity or "on-demand"))
+# The writer adapts its rate to the throttles and retries the transient
+# errors, its client must not retry them
+writer = AdaptiveBatchWriter(
+    boto3.client(
+        "dynamodb", config=Config(retries={"mode": "standard", "max_attempts": 1})
+    ),
+    target_ddb_table,
+    index_name=table_header_name[0],
+    write_capacity=write_capacity,
+    target_utilization=float(args["TARGET_UTILIZATION"]),
+    initial_rate=float(args["INITIAL_WRITE_RATE"]),
+)
 logger.info("START: Loading data to DDB Table ...")
 
 t2 = time.time()
@@ -54,14 +91,35 @@ for input_df in input_df_proc:
     input_df = input_df.iloc[:, [0, -1]]
     input_df.columns = table_header_name
     input_df = input_df.astype(str)
+    input_df["scored_at"] = scored_at
     rec_cnt += input_df.shape[0]
-    wr.dynamodb.put_df(df=input_df, table_name=target_ddb_table)
-    time.sleep(1)
+    writer.write(
+        {name: {"S": value} for name, value in zip(input_df.columns, row)}
+        for row in input_df.itertuples(index=False)
+    )
+writer.flush()
 
 output2 = time.time() - t2
 
 logger.info("END  : Loading data to DDB Table ...")
 logger.info("Loading time: [{}] seconds".format(output2))
 logger.info("No. of records loaded: [{}]".format(rec_cnt))
+logger.info("Write rate control: {}".format(writer.report()))
+
+# Readers cache the items of a load generation, the new one invalidates them
+response = dynamodb.update_item(
+    TableName=target_ddb_table,
+    Key={table_header_name[0]: {"S": args["GENERATION_MARKER_KEY"]}},
+    UpdateExpression="ADD #g :one SET loaded_at = :loaded_at",
+    ExpressionAttributeNames={"#g": "generation"},
+    ExpressionAttributeValues={
+        ":one": {"N": "1"},
+        ":loaded_at": {"S": str(int(time.time()))},
+    },
+    ReturnValues="UPDATED_NEW",
+)
+logger.info(
+    "Load generation: [{}]".format(response["Attributes"]["generation"]["N"])
+)
 
 job.commit()